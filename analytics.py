@@ -0,0 +1,477 @@
+"""
+Columnar run snapshots and vectorized run analytics
+
+Runs (hot and archived) and per-step timings from run traces are exported to
+a columnar snapshot: Parquet when pyarrow is installed, otherwise a
+compressed NumPy .npz with the same columns. Analytics read the snapshot,
+never the OLTP tables:
+  - p50/p90/p99 duration per test case and environment
+  - week-over-week duration regressions
+  - failure clusters by normalized error message
+  - p50/p90/p99 duration per test step
+
+Usage:
+    python analytics.py export
+    python analytics.py summary --user-id 1
+"""
+import os
+import re
+import json
+import time
+import zlib
+import logging
+import argparse
+import itertools
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from models import TestRun, ArchivedTestRun
+from tracing import TRACE_DIR, STATUS_ERROR
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: snapshots fall back to compressed .npz
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics_exports")
+# Snapshots older than this are re-exported on the next analytics request
+ANALYTICS_SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE_SECONDS", "900"))
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+# A refresh requested within this long of the last export is not repeated
+ANALYTICS_REFRESH_MIN_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_REFRESH_MIN_INTERVAL_SECONDS", "60"))
+
+# Regression detection: current week's p50 vs the previous week's
+REGRESSION_THRESHOLD = float(os.getenv("ANALYTICS_REGRESSION_THRESHOLD", "0.2"))
+REGRESSION_MIN_RUNS = int(os.getenv("ANALYTICS_REGRESSION_MIN_RUNS", "5"))
+
+PERCENTILES = (50, 90, 99)
+WEEK_SECONDS = 7 * 86400
+EXPORT_BATCH_SIZE = 5000
+# Runs keep their error's signature and the start of its first line, never the full stderr
+ERROR_EXAMPLE_CHARS = 200
+
+RUN_COLUMNS = ("id", "test_case_id", "user_id", "environment_id", "status", "execution_time", "created_at", "error_signature", "error_example")
+STEP_COLUMNS = ("run_id", "test_case_id", "user_id", "step_index", "step_type", "duration", "failed")
+
+# Volatile fragments replaced before clustering error messages
+_SIGNATURE_PATTERNS = [
+    (re.compile(r"\[data-id=['\"][^'\"]*['\"]\]"), "[data-id=<id>]"),
+    (re.compile(r"(['\"]).*?\1"), "<str>"),
+    (re.compile(r"https?://\S+"), "<url>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<guid>"),
+    (re.compile(r"\b0x[0-9a-f]+\b", re.I), "<hex>"),
+    (re.compile(r"\d+(\.\d+)?"), "<n>"),
+    (re.compile(r"\s+"), " "),
+]
+
+def error_signature(message: str) -> str:
+    """Normalize an error message so runs failing the same way cluster together"""
+    if not message:
+        return ""
+    signature = message.strip().splitlines()[0][:300]
+    for pattern, replacement in _SIGNATURE_PATTERNS:
+        signature = pattern.sub(replacement, signature)
+    return signature.strip()
+
+def error_example(message: str) -> str:
+    if not message:
+        return ""
+    return message.strip().splitlines()[0][:ERROR_EXAMPLE_CHARS]
+
+def _epoch(value: Optional[datetime]) -> int:
+    return int(value.timestamp()) if value is not None else 0
+
+# Snapshot export
+
+def _run_rows(db: Session):
+    """All runs as tuples in RUN_COLUMNS order, hot table first then the archive"""
+    for run in db.query(TestRun).order_by(TestRun.id).yield_per(EXPORT_BATCH_SIZE):
+        yield (
+            run.id, run.test_case_id, run.user_id, run.environment_id or 0, run.status or "",
+            run.execution_time, _epoch(run.created_at), error_signature(run.error_message), error_example(run.error_message)
+        )
+    for run in db.query(ArchivedTestRun).order_by(ArchivedTestRun.id).yield_per(EXPORT_BATCH_SIZE):
+        payload = json.loads(zlib.decompress(run.payload)) if run.payload else {}
+        message = payload.get("error_message")
+        yield (
+            run.id, run.test_case_id, run.user_id, run.environment_id or 0, run.status,
+            run.execution_time, _epoch(run.created_at), error_signature(message), error_example(message)
+        )
+
+def _step_rows(runs: Dict[str, np.ndarray]):
+    """Per-step durations taken from exported run traces"""
+    if not TRACE_DIR.is_dir():
+        return
+    owners = {
+        int(run_id): (int(test_case_id), int(user_id))
+        for run_id, test_case_id, user_id in zip(runs["id"], runs["test_case_id"], runs["user_id"])
+    }
+    for path in TRACE_DIR.glob("run_*.json"):
+        try:
+            run_id = int(path.stem.split("_", 1)[1])
+        except ValueError:
+            continue
+        if run_id not in owners:
+            continue
+        try:
+            with open(path) as f:
+                document = json.load(f)
+        except (OSError, ValueError):
+            continue
+        test_case_id, user_id = owners[run_id]
+        for resource in document.get("resourceSpans", []):
+            for scope in resource.get("scopeSpans", []):
+                for span in scope.get("spans", []):
+                    attributes = {a["key"]: a["value"] for a in span.get("attributes", [])}
+                    if "step.index" not in attributes:
+                        continue
+                    duration = (int(span["endTimeUnixNano"]) - int(span["startTimeUnixNano"])) / 1e9
+                    yield (
+                        run_id, test_case_id, user_id,
+                        int(attributes["step.index"].get("intValue", 0)),
+                        attributes.get("step.type", {}).get("stringValue", ""),
+                        duration,
+                        span.get("status", {}).get("code") == STATUS_ERROR
+                    )
+
+def _to_columns(rows, names: Tuple[str, ...], dtypes: Dict[str, Any]) -> Dict[str, np.ndarray]:
+    """Column arrays from row tuples, converted EXPORT_BATCH_SIZE rows at a time
+    
+    Strings are object arrays: a fixed-width NumPy string column pads every
+    row to the longest value.
+    """
+    chunks: Dict[str, List[np.ndarray]] = {name: [] for name in names}
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, EXPORT_BATCH_SIZE))
+        if not batch:
+            break
+        for name, values in zip(names, zip(*batch)):
+            dtype = dtypes.get(name)
+            if dtype is float:
+                chunks[name].append(np.array([np.nan if v is None else v for v in values], dtype=np.float64))
+            elif dtype is str:
+                chunks[name].append(np.array(values, dtype=object))
+            else:
+                chunks[name].append(np.array(values, dtype=dtype))
+    arrays = {}
+    for name in names:
+        if chunks[name]:
+            arrays[name] = np.concatenate(chunks[name])
+        else:
+            dtype = dtypes.get(name)
+            arrays[name] = np.array([], dtype=np.float64 if dtype is float else object if dtype is str else dtype)
+    return arrays
+
+def _write_table(columns: Dict[str, np.ndarray], base_path: str) -> str:
+    if pq is not None:
+        path = base_path + ".parquet"
+        pq.write_table(pa.table({name: values for name, values in columns.items()}), path, compression="zstd")
+    else:
+        path = base_path + ".npz"
+        # .npz can't hold object arrays without pickling; the string values here are short
+        np.savez_compressed(path, **{name: values.astype(np.str_) if values.dtype == object else values for name, values in columns.items()})
+    return path
+
+def _read_table(base_path: str) -> Optional[Dict[str, np.ndarray]]:
+    if pq is not None and os.path.exists(base_path + ".parquet"):
+        table = pq.read_table(base_path + ".parquet")
+        return {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+    if os.path.exists(base_path + ".npz"):
+        with np.load(base_path + ".npz", allow_pickle=False) as data:
+            return {name: data[name] for name in data.files}
+    return None
+
+def export_snapshot(db: Session, directory: str = ANALYTICS_DIR) -> Dict[str, Any]:
+    """Write runs and steps snapshots (plus a manifest) to the analytics directory"""
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    runs = _to_columns(_run_rows(db), RUN_COLUMNS, {
+        "id": np.int64, "test_case_id": np.int64, "user_id": np.int64, "environment_id": np.int64,
+        "status": str, "execution_time": float, "created_at": np.int64, "error_signature": str, "error_example": str,
+    })
+    steps = _to_columns(_step_rows(runs), STEP_COLUMNS, {
+        "run_id": np.int64, "test_case_id": np.int64, "user_id": np.int64, "step_index": np.int64,
+        "step_type": str, "duration": float, "failed": np.bool_,
+    })
+    manifest = {
+        "format": "parquet" if pq is not None else "npz",
+        "exported_at": datetime.utcnow().isoformat(),
+        "runs": int(len(runs["id"])),
+        "steps": int(len(steps["run_id"])),
+        "files": [
+            os.path.basename(_write_table(runs, os.path.join(directory, "runs"))),
+            os.path.basename(_write_table(steps, os.path.join(directory, "steps"))),
+        ],
+        "export_seconds": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Exported analytics snapshot: {manifest['runs']} runs, {manifest['steps']} steps ({manifest['format']})")
+    return manifest
+
+def snapshot_mtime(directory: str = ANALYTICS_DIR) -> Optional[float]:
+    """When the current snapshot was exported (its manifest's mtime); None without one"""
+    manifest_path = os.path.join(directory, "manifest.json")
+    return os.path.getmtime(manifest_path) if os.path.exists(manifest_path) else None
+
+def load_snapshot(directory: str = ANALYTICS_DIR) -> Optional[Dict[str, Any]]:
+    manifest_path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    runs = _read_table(os.path.join(directory, "runs"))
+    steps = _read_table(os.path.join(directory, "steps"))
+    # Snapshots written with other columns are unusable until re-exported
+    if runs is None or steps is None or set(runs) != set(RUN_COLUMNS):
+        return None
+    return {"manifest": manifest, "runs": runs, "steps": steps, "mtime": os.path.getmtime(manifest_path)}
+
+# Vectorized statistics
+
+def _group_slices(*keys: np.ndarray):
+    """Sort rows by keys; yield (key tuple, row indices) per distinct group"""
+    if len(keys[0]) == 0:
+        return
+    order = np.lexsort(keys[::-1])
+    stacked = np.stack([key[order] for key in keys], axis=1) if len(keys) > 1 else keys[0][order][:, None]
+    boundaries = np.flatnonzero(np.any(stacked[1:] != stacked[:-1], axis=1)) + 1
+    starts = np.concatenate(([0], boundaries))
+    ends = np.concatenate((boundaries, [len(order)]))
+    for start, end in zip(starts, ends):
+        yield tuple(stacked[start].tolist()), order[start:end]
+
+def duration_percentiles(runs: Dict[str, np.ndarray], mask: np.ndarray) -> List[Dict[str, Any]]:
+    """p50/p90/p99 execution time per (test case, environment) for finished runs"""
+    durations = runs["execution_time"]
+    mask = mask & ~np.isnan(durations)
+    test_cases = runs["test_case_id"][mask]
+    environments = runs["environment_id"][mask]
+    values = durations[mask]
+    results = []
+    for (test_case_id, environment_id), index in _group_slices(test_cases, environments):
+        p50, p90, p99 = np.percentile(values[index], PERCENTILES)
+        results.append({
+            "test_case_id": int(test_case_id),
+            "environment_id": int(environment_id) or None,
+            "runs": int(len(index)),
+            "mean": round(float(values[index].mean()), 3),
+            "p50": round(float(p50), 3),
+            "p90": round(float(p90), 3),
+            "p99": round(float(p99), 3),
+        })
+    results.sort(key=lambda row: row["p99"], reverse=True)
+    return results
+
+def weekly_regressions(runs: Dict[str, np.ndarray], mask: np.ndarray, now: float,
+                       threshold: float = REGRESSION_THRESHOLD, min_runs: int = REGRESSION_MIN_RUNS) -> List[Dict[str, Any]]:
+    """Test cases whose p50 duration this week grew by more than threshold vs last week"""
+    durations = runs["execution_time"]
+    age = now - runs["created_at"]
+    base = mask & ~np.isnan(durations) & (age < 2 * WEEK_SECONDS)
+    week = np.where(age < WEEK_SECONDS, 1, 0)[base]
+    test_cases = runs["test_case_id"][base]
+    environments = runs["environment_id"][base]
+    values = durations[base]
+    results = []
+    for (test_case_id, environment_id), index in _group_slices(test_cases, environments):
+        current = values[index][week[index] == 1]
+        previous = values[index][week[index] == 0]
+        if len(current) < min_runs or len(previous) < min_runs:
+            continue
+        current_p50 = float(np.median(current))
+        previous_p50 = float(np.median(previous))
+        if previous_p50 <= 0:
+            continue
+        change = current_p50 / previous_p50 - 1
+        if change > threshold:
+            results.append({
+                "test_case_id": int(test_case_id),
+                "environment_id": int(environment_id) or None,
+                "previous_p50": round(previous_p50, 3),
+                "current_p50": round(current_p50, 3),
+                "previous_p90": round(float(np.percentile(previous, 90)), 3),
+                "current_p90": round(float(np.percentile(current, 90)), 3),
+                "change_pct": round(change * 100, 1),
+                "previous_runs": int(len(previous)),
+                "current_runs": int(len(current)),
+            })
+    results.sort(key=lambda row: row["change_pct"], reverse=True)
+    return results
+
+def failure_clusters(runs: Dict[str, np.ndarray], mask: np.ndarray, limit: int = 20) -> List[Dict[str, Any]]:
+    """Failed/errored runs grouped by normalized error message"""
+    failed = mask & np.isin(runs["status"], ("failed", "error")) & (runs["error_signature"] != "")
+    signatures = runs["error_signature"][failed]
+    if len(signatures) == 0:
+        return []
+    examples = runs["error_example"][failed]
+    test_cases = runs["test_case_id"][failed]
+    created = runs["created_at"][failed]
+    unique_signatures, signature_index, counts = np.unique(signatures, return_inverse=True, return_counts=True)
+    results = []
+    for cluster in np.argsort(counts)[::-1][:limit]:
+        members = signature_index == cluster
+        results.append({
+            "signature": str(unique_signatures[cluster]),
+            "count": int(counts[cluster]),
+            "test_case_ids": sorted(int(t) for t in np.unique(test_cases[members]))[:50],
+            "example": str(examples[members][0]),
+            "last_seen": datetime.utcfromtimestamp(int(created[members].max())).isoformat(),
+        })
+    return results
+
+def step_percentiles(steps: Dict[str, np.ndarray], mask: np.ndarray, limit: int = 50) -> List[Dict[str, Any]]:
+    """Slowest steps by p90 duration per (test case, step index)"""
+    test_cases = steps["test_case_id"][mask]
+    indexes = steps["step_index"][mask]
+    types = steps["step_type"][mask]
+    durations = steps["duration"][mask]
+    failed = steps["failed"][mask]
+    results = []
+    for (test_case_id, step_index), index in _group_slices(test_cases, indexes):
+        p50, p90, p99 = np.percentile(durations[index], PERCENTILES)
+        results.append({
+            "test_case_id": int(test_case_id),
+            "step_index": int(step_index),
+            "step_type": str(types[index[0]]),
+            "samples": int(len(index)),
+            "failure_rate": round(float(failed[index].mean()) * 100, 2),
+            "p50": round(float(p50), 3),
+            "p90": round(float(p90), 3),
+            "p99": round(float(p99), 3),
+        })
+    results.sort(key=lambda row: row["p90"], reverse=True)
+    return results[:limit]
+
+def user_manifest(snapshot: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """The snapshot manifest with row counts limited to one user's runs and steps"""
+    return {
+        **snapshot["manifest"],
+        "runs": int((snapshot["runs"]["user_id"] == user_id).sum()),
+        "steps": int((snapshot["steps"]["user_id"] == user_id).sum()),
+    }
+
+def summarize(snapshot: Dict[str, Any], user_id: int, days: int, now: Optional[float] = None) -> Dict[str, Any]:
+    """All analytics for one user's runs over the last `days` days"""
+    now = now or time.time()
+    runs = snapshot["runs"]
+    steps = snapshot["steps"]
+    run_mask = (runs["user_id"] == user_id) & (runs["created_at"] >= now - days * 86400)
+    in_period = set(runs["id"][run_mask].tolist())
+    step_mask = (steps["user_id"] == user_id) & np.isin(steps["run_id"], list(in_period))
+    return {
+        "period_days": days,
+        "snapshot": user_manifest(snapshot, user_id),
+        "runs_analyzed": int(run_mask.sum()),
+        "durations": duration_percentiles(runs, run_mask),
+        "regressions": weekly_regressions(runs, runs["user_id"] == user_id, now),
+        "failure_clusters": failure_clusters(runs, run_mask),
+        "slowest_steps": step_percentiles(steps, step_mask),
+    }
+
+class AnalyticsService:
+    """Keeps the snapshot loaded, re-exports it in the background and caches per-user summaries"""
+    
+    def __init__(self, directory: str = ANALYTICS_DIR):
+        self.directory = directory
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._summaries: Dict[Tuple[int, int], Tuple[float, float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        # One export at a time, and never under _lock, so summaries keep serving meanwhile
+        self._export_thread: Optional[threading.Thread] = None
+    
+    def export(self, db: Optional[Session] = None) -> Dict[str, Any]:
+        """Export a new snapshot and load it; db defaults to a read session (replica when in sync)"""
+        if db is None:
+            from database import read_session
+            with read_session() as session:
+                return self.export(session)
+        manifest = export_snapshot(db, self.directory)
+        with self._lock:
+            self._snapshot = load_snapshot(self.directory)
+            self._summaries.clear()
+        return manifest
+    
+    def _export_in_background(self):
+        try:
+            self.export()
+        except Exception as e:
+            logger.error(f"Analytics export failed: {e}")
+    
+    def start_export(self) -> bool:
+        """Start a background export unless one is running; returns whether it started"""
+        with self._lock:
+            if self._export_thread is not None and self._export_thread.is_alive():
+                return False
+            self._export_thread = threading.Thread(target=self._export_in_background, name="analytics-export", daemon=True)
+            self._export_thread.start()
+            return True
+    
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Current snapshot; a missing or stale one is re-exported in the background
+        
+        A stale snapshot keeps being served until the new one is loaded; None
+        while there is none yet.
+        """
+        mtime = snapshot_mtime(self.directory)
+        with self._lock:
+            if mtime is not None and (self._snapshot is None or self._snapshot["mtime"] != mtime):
+                self._snapshot = load_snapshot(self.directory)
+                self._summaries.clear()
+            snapshot = self._snapshot
+        if snapshot is None or time.time() - mtime > ANALYTICS_SNAPSHOT_MAX_AGE_SECONDS:
+            self.start_export()
+        return snapshot
+    
+    def summary(self, user_id: int, days: int) -> Optional[Dict[str, Any]]:
+        snapshot = self.snapshot()
+        if snapshot is None:
+            return None
+        key = (user_id, days)
+        cached = self._summaries.get(key)
+        if cached and cached[0] == snapshot["mtime"] and time.monotonic() - cached[1] < ANALYTICS_CACHE_TTL_SECONDS:
+            return cached[2]
+        result = summarize(snapshot, user_id, days)
+        self._summaries[key] = (snapshot["mtime"], time.monotonic(), result)
+        return result
+    
+    def refresh(self) -> Dict[str, Any]:
+        """Start a re-export unless one is running or the last finished under ANALYTICS_REFRESH_MIN_INTERVAL_SECONDS ago"""
+        mtime = snapshot_mtime(self.directory)
+        exported_at = datetime.utcfromtimestamp(mtime).isoformat() if mtime is not None else None
+        if mtime is not None and time.time() - mtime < ANALYTICS_REFRESH_MIN_INTERVAL_SECONDS:
+            return {"status": "recent", "exported_at": exported_at}
+        return {"status": "started" if self.start_export() else "running", "exported_at": exported_at}
+
+# Global analytics service
+analytics_service = AnalyticsService()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export run snapshots and print analytics")
+    parser.add_argument("command", choices=["export", "summary"])
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    
+    mtime = snapshot_mtime()
+    # Export in the foreground; a background export would die with the process
+    if args.command == "export" or mtime is None or time.time() - mtime > ANALYTICS_SNAPSHOT_MAX_AGE_SECONDS or load_snapshot() is None:
+        manifest = analytics_service.export()
+        if args.command == "export":
+            print(json.dumps(manifest, indent=2))
+            return
+    print(json.dumps(analytics_service.summary(args.user_id, args.days), indent=2, default=str))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
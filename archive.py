@@ -0,0 +1,232 @@
+"""
+Hot/cold archival of test_runs history
+
+Finished runs older than ARCHIVE_AFTER_DAYS move from test_runs into
+test_runs_archive, with the bulky columns zlib-compressed into one payload.
+A data-driven run's parent moves together with all of its rows.
+Their counts and execution times are folded into test_run_rollups so
+dashboard and trend aggregates stay complete. The read helpers below merge
+hot and archived rows for paged listings.
+
+Usage (e.g. nightly from cron):
+    python archive.py
+    python archive.py --older-than-days 30 --batch-size 5000
+"""
+import os
+import json
+import zlib
+import logging
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy import exists, or_
+from sqlalchemy.orm import Session, aliased
+
+from models import TestRun, ArchivedTestRun, TestRunRollup
+from schemas import TestRun as TestRunSchema
+from serialization import RowEncoder, dumps
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "2000"))
+
+# Runs still in flight are never archived
+ARCHIVABLE_STATUSES = ("passed", "failed", "error", "cancelled")
+
+# Columns kept as real (queryable) columns on the archive table
+INDEXED_COLUMNS = (
+    "id", "test_case_id", "user_id", "status", "execution_time",
+    "environment_id", "started_at", "completed_at", "created_at",
+)
+# Kept in the payload but not part of the run schema; see run_stderr()
+UNLISTED_COLUMNS = ("stderr",)
+PAYLOAD_COLUMNS = tuple(
+    name for name in TestRunSchema.model_fields if name not in INDEXED_COLUMNS
+) + UNLISTED_COLUMNS
+
+encode_hot_run = RowEncoder(TestRunSchema)
+_Parent = aliased(TestRun)
+
+def _pack(run: TestRun) -> bytes:
+    payload = {name: getattr(run, name) for name in PAYLOAD_COLUMNS}
+    return zlib.compress(dumps(payload), 6)
+
+def encode_archived_run(row: ArchivedTestRun) -> Dict[str, Any]:
+    """Archived run as the same dict shape RowEncoder(TestRunSchema) produces"""
+    payload = json.loads(zlib.decompress(row.payload)) if row.payload else {}
+    data = {}
+    for name in TestRunSchema.model_fields:
+        data[name] = getattr(row, name) if name in INDEXED_COLUMNS else payload.get(name)
+    return data
+
+def _day(value: datetime):
+    return value.date() if isinstance(value, datetime) else value
+
+def _with_dataset_rows(db: Session, runs: List[TestRun]) -> List[TestRun]:
+    """runs plus the rows of the dataset parents among them
+    
+    A parent and its rows are archived together, or not at all while one of
+    the rows is still in flight: rows reference their parent, so the parent
+    can't leave the hot table ahead of them. Rows move even if they were
+    created after the cutoff.
+    """
+    parent_ids = [run.id for run in runs if run.dataset_id is not None and run.parent_run_id is None]
+    if not parent_ids:
+        return runs
+    rows = db.query(TestRun).filter(TestRun.parent_run_id.in_(parent_ids)).all()
+    held = {row.parent_run_id for row in rows if row.status not in ARCHIVABLE_STATUSES}
+    return [run for run in runs if run.id not in held] + [row for row in rows if row.parent_run_id not in held]
+
+def archive_runs(db: Session, older_than_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, Any]:
+    """Move finished runs older than the cutoff to cold storage, batch by batch"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    archived = 0
+    last_id = 0
+    while True:
+        runs = db.query(TestRun).filter(
+            TestRun.created_at < cutoff,
+            TestRun.status.in_(ARCHIVABLE_STATUSES),
+            TestRun.id > last_id,
+            # A dataset run's rows move with their parent (below), never ahead of it
+            or_(TestRun.parent_run_id.is_(None), ~exists().where(_Parent.id == TestRun.parent_run_id))
+        ).order_by(TestRun.id).limit(batch_size).all()
+        if not runs:
+            break
+        last_id = runs[-1].id
+        runs = _with_dataset_rows(db, runs)
+        if not runs:
+            continue
+        
+        # Fold the batch into daily rollups
+        deltas: Dict[tuple, List[float]] = {}
+        for run in runs:
+            key = (run.user_id, _day(run.created_at), run.status)
+            delta = deltas.setdefault(key, [0, 0.0, 0])
+            delta[0] += 1
+            if run.execution_time is not None:
+                delta[1] += run.execution_time
+                delta[2] += 1
+        existing = {
+            (rollup.user_id, rollup.day, rollup.status): rollup
+            for rollup in db.query(TestRunRollup).filter(
+                TestRunRollup.user_id.in_({key[0] for key in deltas}),
+                TestRunRollup.day.in_({key[1] for key in deltas})
+            )
+        }
+        for key, (count, time_sum, time_count) in deltas.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                rollup = TestRunRollup(
+                    user_id=key[0], day=key[1], status=key[2],
+                    run_count=0, execution_time_sum=0.0, execution_time_count=0
+                )
+                db.add(rollup)
+            rollup.run_count += count
+            rollup.execution_time_sum += time_sum
+            rollup.execution_time_count += time_count
+        
+        db.bulk_save_objects([
+            ArchivedTestRun(
+                **{name: getattr(run, name) for name in INDEXED_COLUMNS},
+                payload=_pack(run)
+            )
+            for run in runs
+        ])
+        db.query(TestRun).filter(
+            TestRun.id.in_([run.id for run in runs])
+        ).delete(synchronize_session=False)
+        db.commit()
+        db.expunge_all()
+        archived += len(runs)
+        logger.info(f"Archived {archived} runs (through id {last_id})")
+    
+    return {"archived": archived, "cutoff": cutoff.isoformat()}
+
+def find_run(db: Session, run_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    """A user's run by id from the hot table, falling back to the archive"""
+    run = db.query(TestRun).filter(TestRun.id == run_id, TestRun.user_id == user_id).first()
+    if run is not None:
+        return encode_hot_run(run)
+    archived = db.query(ArchivedTestRun).filter(
+        ArchivedTestRun.id == run_id,
+        ArchivedTestRun.user_id == user_id
+    ).first()
+    return encode_archived_run(archived) if archived is not None else None
+
+def run_stderr(db: Session, run_id: int) -> Optional[str]:
+    """Stored stderr of a run from the hot table or the archive; check ownership with find_run first"""
+    row = db.query(TestRun.stderr).filter(TestRun.id == run_id).first()
+    if row is not None:
+        return row.stderr
+    archived = db.query(ArchivedTestRun.payload).filter(ArchivedTestRun.id == run_id).first()
+    if archived is None or not archived.payload:
+        return None
+    return json.loads(zlib.decompress(archived.payload)).get("stderr")
+
+def archive_query_like(db: Session, user_id: Optional[int] = None, test_case_id: Optional[int] = None,
+                       status_filter: Optional[str] = None, since: Optional[datetime] = None,
+                       until: Optional[datetime] = None):
+    """Archived-run query with the same filters the hot listing applies"""
+    query = db.query(ArchivedTestRun)
+    if user_id is not None:
+        query = query.filter(ArchivedTestRun.user_id == user_id)
+    if test_case_id:
+        query = query.filter(ArchivedTestRun.test_case_id == test_case_id)
+    if status_filter:
+        query = query.filter(ArchivedTestRun.status == status_filter)
+    if since:
+        query = query.filter(ArchivedTestRun.created_at >= since)
+    if until:
+        query = query.filter(ArchivedTestRun.created_at < until)
+    return query.order_by(ArchivedTestRun.created_at.desc(), ArchivedTestRun.id.desc())
+
+def merged_page(db: Session, hot_query, archive_query, skip: int, limit: int) -> List[Dict[str, Any]]:
+    """One page of newest-first runs, continuing into the archive once hot rows run out
+    
+    Archived runs are older than every hot run (bar in-flight runs that
+    were never finished), so the archive is only queried when the page
+    extends past the end of the hot table; a time
+    range filter on archive_query keeps that lookup empty when the range
+    doesn't reach archived history, and callers that know there is none
+    pass archive_query=None.
+    """
+    hot_rows = [encode_hot_run(run) for run in hot_query.offset(skip).limit(limit)]
+    if len(hot_rows) == limit or archive_query is None:
+        return hot_rows
+    
+    hot_total = skip + len(hot_rows) if hot_rows else hot_query.order_by(None).count()
+    archived = archive_query.offset(max(0, skip - hot_total)).limit(limit - len(hot_rows))
+    return hot_rows + [encode_archived_run(row) for row in archived]
+
+def merged_stream_rows(hot_query, archive_query, skip: int, limit: int, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Generator form of merged_page for streamed responses"""
+    hot_total = hot_query.order_by(None).count()
+    for run in hot_query.offset(skip).limit(limit).yield_per(batch_size):
+        yield encode_hot_run(run)
+    remaining = limit - max(0, min(limit, hot_total - skip))
+    if remaining <= 0:
+        return
+    for row in archive_query.offset(max(0, skip - hot_total)).limit(remaining).yield_per(batch_size):
+        yield encode_archived_run(row)
+
+def main():
+    parser = argparse.ArgumentParser(description="Move old test runs to the archive table")
+    parser.add_argument("--older-than-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    args = parser.parse_args()
+    
+    from database import SessionLocal, engine, Base, add_missing_columns
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    db = SessionLocal()
+    try:
+        result = archive_runs(db, args.older_than_days, args.batch_size)
+    finally:
+        db.close()
+    print(f"Archived {result['archived']} runs created before {result['cutoff']}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,49 @@
+"""
+Local artifact store for run output too large to keep in the database
+
+Artifacts live under ARTIFACT_DIR/run_<id>/. Logs are written gzip-compressed
+as they stream in, so spilling never holds a whole log in memory.
+"""
+import os
+import gzip
+import shutil
+import logging
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR", "artifacts"))
+READ_CHUNK_BYTES = 64 * 1024
+
+def run_dir(run_id: int) -> Path:
+    return ARTIFACT_DIR / f"run_{run_id}"
+
+def path_for(run_id: int, name: str) -> Path:
+    return run_dir(run_id) / name
+
+def open_spill(run_id: int, name: str):
+    """Binary gzip writer for a streamed artifact such as a run log"""
+    path = path_for(run_id, name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return gzip.open(path, "wb", compresslevel=6)
+
+def iter_bytes(path: Path, decompress: bool) -> Iterator[bytes]:
+    """Read an artifact in chunks, optionally inflating a gzip file on the fly"""
+    opener = gzip.open if decompress else open
+    with opener(path, "rb") as f:
+        while True:
+            chunk = f.read(READ_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+def size_of(path: Optional[Path]) -> int:
+    try:
+        return path.stat().st_size if path else 0
+    except OSError:
+        return 0
+
+def delete_run(run_id: int):
+    """Remove every stored artifact of a run"""
+    shutil.rmtree(run_dir(run_id), ignore_errors=True)
@@ -2,6 +2,7 @@
 Authentication and authorization utilities
 """
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Depends, HTTPException, status
@@ -10,14 +11,21 @@ from passlib.context import CryptContext
 from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
-from database import get_db
+from database import PrimaryReadSessionLocal, read_session, replica_router
 from models import User
+from metrics import AUTH_CACHE_REQUESTS
 
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Short-lived cache of authenticated users, keyed by username (0 disables); a
+# hit skips the database, so a change to the account (deactivation, quotas,
+# team) made outside invalidate_user_cache takes effect within the TTL
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "30"))
+_user_cache = {}
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -64,13 +72,43 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_current_user(
-    token_data: dict = Depends(verify_token),
-    db: Session = Depends(get_db)
-):
+def user_context(user: User) -> dict:
+    """The current_user dict that routes receive, for a User row"""
+    return {
+        "user_id": user.id,
+        "username": user.username,
+        "email": user.email,
+        "team": user.team,
+        "max_concurrent_runs": user.max_concurrent_runs,
+        "browser_minutes_per_day": user.browser_minutes_per_day
+    }
+
+def _find_user(username: str) -> Optional[User]:
+    """User by username from the replica when it is in sync, else (or if not there yet) the primary
+    
+    Each lookup has its own short-lived session, so resolving the user holds
+    no connection while the route runs.
+    """
+    if replica_router.use_replica(None):
+        with read_session() as db:
+            user = db.query(User).filter(User.username == username).first()
+        if user is not None:
+            return user
+    # New accounts may not have replicated yet
+    with PrimaryReadSessionLocal() as db:
+        return db.query(User).filter(User.username == username).first()
+
+def get_current_user(token_data: dict = Depends(verify_token)):
     """Get current authenticated user"""
     username = token_data.get("sub")
-    user = db.query(User).filter(User.username == username).first()
+    
+    cached = _user_cache.get(username)
+    if cached and cached[0] > time.monotonic():
+        AUTH_CACHE_REQUESTS.inc(result="hit")
+        return dict(cached[1])
+    AUTH_CACHE_REQUESTS.inc(result="miss")
+    
+    user = _find_user(username)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -81,11 +119,25 @@ def get_current_user(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
         )
-    return {
-        "user_id": user.id,
-        "username": user.username,
-        "email": user.email
-    }
+    current_user = user_context(user)
+    if AUTH_CACHE_TTL_SECONDS > 0:
+        _user_cache[username] = (time.monotonic() + AUTH_CACHE_TTL_SECONDS, current_user)
+    return dict(current_user)
+
+def get_read_db(current_user: dict = Depends(get_current_user)):
+    """Dependency to get a read-only session: the replica, unless it's behind the user's last write"""
+    db = read_session(current_user["user_id"])
+    try:
+        yield db
+    finally:
+        db.close()
+
+def invalidate_user_cache(username: Optional[str] = None):
+    """Drop cached user lookups, e.g. after deactivating an account"""
+    if username is None:
+        _user_cache.clear()
+    else:
+        _user_cache.pop(username, None)
 
 def authenticate_user(db: Session, username: str, password: str):
     """Authenticate user with username and password"""
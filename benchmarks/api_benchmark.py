@@ -0,0 +1,238 @@
+"""
+Concurrent API latency and throughput benchmark
+
+Drives the main.app endpoints against a database built by seed_dataset.py,
+either in-process (ASGI transport, no sockets) or against a running uvicorn,
+and writes per-route p50/p95/p99 latency and throughput to a JSON file that
+compare_results.py can diff between commits.
+
+Usage:
+    python benchmarks/api_benchmark.py --db bench.db --output results/base.json
+    python benchmarks/api_benchmark.py --db bench.db --base-url http://127.0.0.1:5000
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+# Route mix weighted roughly like frontend traffic
+ROUTE_MIX = [
+    ("GET /api/tests/", 20),
+    ("GET /api/tests/{test_case_id}", 10),
+    ("GET /api/tests/{test_case_id}/runs", 10),
+    ("GET /api/results/runs", 25),
+    ("GET /api/results/runs/{run_id}", 10),
+    ("GET /api/results/dashboard", 20),
+    ("GET /api/results/trends", 5),
+]
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def summarize(samples, elapsed):
+    """Per-route latency distribution and throughput"""
+    routes = {}
+    for route, entries in samples.items():
+        latencies = sorted(latency for latency, _ in entries)
+        errors = sum(1 for _, status_code in entries if status_code >= 400)
+        routes[route] = {
+            "requests": len(entries),
+            "errors": errors,
+            "throughput_rps": round(len(entries) / elapsed, 2) if elapsed else 0,
+            "mean_ms": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50_ms": round(percentile(latencies, 50), 3) if latencies else None,
+            "p95_ms": round(percentile(latencies, 95), 3) if latencies else None,
+            "p99_ms": round(percentile(latencies, 99), 3) if latencies else None,
+            "max_ms": round(latencies[-1], 3) if latencies else None,
+        }
+    return routes
+
+class RequestPlanner:
+    """Pick a user and valid ids for a route using the seed's ownership layout"""
+    
+    def __init__(self, manifest, sample_users, rng):
+        self.users = manifest["users"]
+        self.test_cases = manifest["test_cases"]
+        self.test_runs = manifest["test_runs"]
+        self.rng = rng
+        self.user_ids = rng.sample(range(1, self.users + 1), min(sample_users, self.users))
+    
+    def _test_case_for(self, user_id):
+        owned = (self.test_cases - user_id) // self.users + 1
+        return user_id + self.users * self.rng.randrange(max(owned, 1))
+    
+    def _run_for(self, test_case_id):
+        owned = (self.test_runs - test_case_id) // self.test_cases + 1
+        return test_case_id + self.test_cases * self.rng.randrange(max(owned, 1))
+    
+    def next_request(self, route):
+        user_id = self.rng.choice(self.user_ids)
+        test_case_id = self._test_case_for(user_id)
+        path = route.split(" ", 1)[1].format(
+            test_case_id=test_case_id,
+            run_id=self._run_for(test_case_id)
+        )
+        params = {}
+        if route == "GET /api/results/runs":
+            params = {"limit": self.rng.choice([20, 50, 100])}
+        elif route == "GET /api/tests/":
+            params = {"limit": 100}
+        return user_id, path, params
+
+def build_tokens(manifest, user_ids):
+    """Mint JWTs directly instead of paying bcrypt on every login"""
+    from auth import create_access_token
+    return {
+        user_id: create_access_token(
+            data={"sub": f"bench_user_{user_id}", "user_id": user_id},
+            expires_delta=timedelta(hours=6)
+        )
+        for user_id in user_ids
+    }
+
+async def run_benchmark(client, planner, tokens, concurrency, duration, warmup):
+    """Hammer the API with `concurrency` workers for `duration` seconds"""
+    routes = [route for route, _ in ROUTE_MIX]
+    weights = [weight for _, weight in ROUTE_MIX]
+    samples = {route: [] for route in routes}
+    deadline_holder = {}
+    
+    async def worker():
+        while True:
+            now = time.perf_counter()
+            if now >= deadline_holder["end"]:
+                return
+            route = planner.rng.choices(routes, weights)[0]
+            user_id, path, params = planner.next_request(route)
+            headers = {"Authorization": f"Bearer {tokens[user_id]}"}
+            started = time.perf_counter()
+            try:
+                response = await client.get(path, params=params, headers=headers)
+                status_code = response.status_code
+            except Exception:
+                status_code = 599
+            latency_ms = (time.perf_counter() - started) * 1000
+            if started >= deadline_holder["measure_from"]:
+                samples[route].append((latency_ms, status_code))
+    
+    started = time.perf_counter()
+    deadline_holder["measure_from"] = started + warmup
+    deadline_holder["end"] = started + warmup + duration
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True
+        ).strip()
+    except Exception:
+        return None
+
+async def main_async(args):
+    from seed_dataset import manifest_path
+    
+    args.db = os.path.abspath(args.db)
+    with open(manifest_path(args.db)) as f:
+        manifest = json.load(f)
+    
+    invoked_from = os.getcwd()
+    rng = random.Random(args.seed)
+    planner = RequestPlanner(manifest, args.sample_users, rng)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("httpx is required for the API benchmark: pip install httpx")
+    
+    tokens = build_tokens(manifest, planner.user_ids)
+    
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+        mode = "uvicorn"
+    else:
+        # main.py resolves static/ relative to the working directory
+        os.chdir(ROOT_DIR)
+        import database
+        database.engine.echo = args.sql_echo
+        from main import app
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60)
+        mode = "in-process"
+    
+    print(f"Benchmarking {mode} for {args.duration}s at concurrency {args.concurrency}...")
+    async with client:
+        wall_start = time.perf_counter()
+        samples = await run_benchmark(client, planner, tokens, args.concurrency, args.duration, args.warmup)
+        elapsed = time.perf_counter() - wall_start - args.warmup
+    
+    routes = summarize(samples, elapsed)
+    total = sum(r["requests"] for r in routes.values())
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "mode": mode,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "dataset": {k: manifest[k] for k in ("users", "test_cases", "test_runs")},
+        },
+        "totals": {
+            "requests": total,
+            "errors": sum(r["errors"] for r in routes.values()),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+        },
+        "routes": routes,
+    }
+    
+    print(f"{'route':42} {'req':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for route, stats in routes.items():
+        if not stats["requests"]:
+            continue
+        print(
+            f"{route:42} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8.1f} "
+            f"{stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}"
+        )
+    
+    if args.output:
+        args.output = os.path.join(invoked_from, args.output)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="API latency and throughput benchmark")
+    parser.add_argument("--db", default="benchmark.db", help="Database created by seed_dataset.py")
+    parser.add_argument("--base-url", help="Benchmark a running server instead of the in-process app")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Unmeasured seconds before measuring")
+    parser.add_argument("--sample-users", type=int, default=200, help="Distinct users to spread load across")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--sql-echo", action="store_true", help="Keep SQL statement echo on (in-process only)")
+    parser.add_argument("--output", help="Write JSON results here")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare two api_benchmark.py result files and flag regressions
+
+Exits with status 1 when any route's p95/p99 latency grows or its
+throughput drops by more than the threshold.
+
+Usage:
+    python benchmarks/compare_results.py results/base.json results/head.json --threshold 10
+"""
+import sys
+import json
+import argparse
+
+LATENCY_METRICS = ["p50_ms", "p95_ms", "p99_ms"]
+
+def _change(before, after):
+    """Relative change in percent, or None when it can't be computed"""
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before * 100
+
+def compare(baseline, candidate, threshold):
+    """Return (rows, regressions) describing per-route changes"""
+    rows = []
+    regressions = []
+    for route, base_stats in baseline["routes"].items():
+        new_stats = candidate["routes"].get(route)
+        if not new_stats or not base_stats.get("requests") or not new_stats.get("requests"):
+            continue
+        
+        row = {"route": route}
+        for metric in LATENCY_METRICS + ["throughput_rps"]:
+            row[metric] = (base_stats.get(metric), new_stats.get(metric), _change(base_stats.get(metric), new_stats.get(metric)))
+        rows.append(row)
+        
+        for metric in ("p95_ms", "p99_ms"):
+            change = row[metric][2]
+            if change is not None and change > threshold:
+                regressions.append(f"{route}: {metric} {row[metric][0]:.1f} -> {row[metric][1]:.1f} ms (+{change:.1f}%)")
+        change = row["throughput_rps"][2]
+        if change is not None and change < -threshold:
+            regressions.append(f"{route}: throughput {row['throughput_rps'][0]:.1f} -> {row['throughput_rps'][1]:.1f} rps ({change:.1f}%)")
+        
+        base_errors = base_stats.get("errors", 0)
+        if new_stats.get("errors", 0) > base_errors:
+            regressions.append(f"{route}: errors {base_errors} -> {new_stats['errors']}")
+    
+    return rows, regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff two API benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Allowed change in percent")
+    args = parser.parse_args()
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    
+    print(f"baseline {baseline['meta'].get('commit')}  vs  candidate {candidate['meta'].get('commit')}")
+    if baseline["meta"].get("dataset") != candidate["meta"].get("dataset"):
+        print("warning: results were produced against different datasets")
+    
+    rows, regressions = compare(baseline, candidate, args.threshold)
+    print(f"{'route':42} {'p50':>16} {'p95':>16} {'p99':>16} {'rps':>16}")
+    for row in rows:
+        cells = []
+        for metric in LATENCY_METRICS + ["throughput_rps"]:
+            _, after, change = row[metric]
+            cells.append(f"{after:>8.1f} ({change:+.0f}%)" if change is not None else f"{after!s:>16}")
+        print(f"{row['route']:42} " + " ".join(f"{c:>16}" for c in cells))
+    
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold}%:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print("\nNo regressions above threshold")
+
+if __name__ == "__main__":
+    main()
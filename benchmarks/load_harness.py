@@ -0,0 +1,285 @@
+"""
+Load harness: push thousands of concurrent runs through the API on the simulated executor
+
+Runs go through the real endpoints, scheduler, database writes and result
+handling, but the simulated backend (simulated_executor.py) stands in for
+browsers. Since a simulated run's execution_time is exactly its browser
+time, everything else a run's wall time contains is platform overhead:
+  overhead = end-to-end time - execution_time
+(scheduler queueing, DB writes, result processing, request handling).
+
+Modes:
+  batch  POST /api/tests/batch-run in chunks, then poll run lists until
+         every run finished; end-to-end is accurate to --poll-interval
+  run    concurrent POST /api/tests/{id}/run, which waits for the result
+
+In-process mode starts from a fresh SQLite database and configures the
+app (simulated backend, execution slots, pool size) through environment
+variables; against a running server (--base-url), start it with
+EXECUTOR_BACKEND=simulated and matching settings yourself.
+
+Usage:
+    python benchmarks/load_harness.py --runs 5000 --output results/load.json
+    python benchmarks/load_harness.py --mode run --runs 2000 --concurrency 500
+    python benchmarks/load_harness.py --base-url http://127.0.0.1:5000 --runs 1000
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+TERMINAL_STATUSES = ("passed", "failed", "error", "cancelled")
+
+def distribution(values):
+    """Mean and nearest-rank percentiles, in the unit of values"""
+    from api_benchmark import percentile
+    values = sorted(values)
+    if not values:
+        return None
+    return {
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(values, 50), 4),
+        "p95": round(percentile(values, 95), 4),
+        "p99": round(percentile(values, 99), 4),
+        "max": round(values[-1], 4),
+    }
+
+def configure_in_process(args):
+    """Environment for the in-process app; explicit env vars still win"""
+    settings = {
+        "DATABASE_URL": f"sqlite:///{os.path.abspath(args.db)}",
+        "EXECUTOR_BACKEND": "simulated",
+        # Traces are still written (that's platform overhead), just not into the repo
+        "TRACE_DIR": tempfile.mkdtemp(prefix="load_harness_traces_"),
+        "SIMULATED_TIME_SCALE": str(args.time_scale),
+        "SCHEDULER_MAX_CONCURRENT_RUNS": str(args.slots),
+        "USER_MAX_CONCURRENT_RUNS": str(args.slots),
+        # Queued and executing runs don't hold connections; this is for request handlers
+        "DB_POOL_SIZE": "20",
+        "DB_MAX_OVERFLOW": str(max(args.concurrency, 20)),
+    }
+    for name, value in settings.items():
+        os.environ.setdefault(name, value)
+    if os.path.exists(args.db):
+        os.remove(args.db)
+
+async def create_users(client, users, cases_per_user):
+    """Fresh users (so every run in their lists is ours) with a few test cases each"""
+    from seed_dataset import SAMPLE_STEPS
+    tag = uuid.uuid4().hex[:8]
+    accounts = []
+    for index in range(users):
+        username = f"load_{tag}_{index}"
+        credentials = {"username": username, "password": "load-harness"}
+        response = await client.post("/api/auth/register", json={**credentials, "email": f"{username}@example.com"})
+        response.raise_for_status()
+        response = await client.post("/api/auth/login", json=credentials)
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        test_case_ids = []
+        for number in range(cases_per_user):
+            response = await client.post("/api/tests/", headers=headers, json={
+                "name": f"Load test case {number}",
+                "steps": SAMPLE_STEPS,
+                "tags": "load-harness"
+            })
+            response.raise_for_status()
+            test_case_ids.append(response.json()["id"])
+        accounts.append({"headers": headers, "test_case_ids": test_case_ids, "submitted": {}, "total": 0})
+    return accounts
+
+async def submit_batches(client, accounts, runs, batch_size, concurrency, submit_latencies):
+    """Queue `runs` runs as batch-run requests; records each run's submit time per account"""
+    chunks = [min(batch_size, runs - start) for start in range(0, runs, batch_size)]
+    next_chunk = iter(enumerate(chunks))
+    
+    async def worker():
+        for index, size in next_chunk:
+            account = accounts[index % len(accounts)]
+            cases = account["test_case_ids"]
+            test_case_ids = [cases[(index + offset) % len(cases)] for offset in range(size)]
+            started = time.perf_counter()
+            response = await client.post("/api/tests/batch-run", headers=account["headers"], json={"test_case_ids": test_case_ids})
+            submitted = time.perf_counter()
+            submit_latencies.append(submitted - started)
+            if response.status_code != 202:
+                print(f"batch-run returned {response.status_code}: {response.text[:200]}")
+                continue
+            for run in response.json():
+                account["submitted"][run["id"]] = submitted
+            account["total"] += size
+    
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+async def wait_for_batches(client, accounts, poll_interval, timeout):
+    """Poll each account's run list until all its runs are terminal; returns per-run samples"""
+    samples = []
+    pending = {id(account): account for account in accounts if account["submitted"]}
+    deadline = time.perf_counter() + timeout
+    while pending and time.perf_counter() < deadline:
+        await asyncio.sleep(poll_interval)
+        for key, account in list(pending.items()):
+            # Newest first, so the oldest unfinished run is only in the list if it covers them all
+            response = await client.get("/api/results/runs", headers=account["headers"], params={
+                "limit": account["total"], "stream": "json"
+            })
+            response.raise_for_status()
+            observed = time.perf_counter()
+            for run in response.json():
+                submitted = account["submitted"].pop(run["id"], None) if run["status"] in TERMINAL_STATUSES else None
+                if submitted is not None:
+                    samples.append({
+                        "status": run["status"],
+                        "end_to_end": observed - submitted,
+                        "browser": run.get("execution_time") or 0.0
+                    })
+            if not account["submitted"]:
+                del pending[key]
+    return samples
+
+async def run_interactive(client, accounts, runs, concurrency):
+    """`runs` concurrent-ish POST /run requests from `concurrency` workers"""
+    samples = []
+    next_run = iter(range(runs))
+    
+    async def worker():
+        for index in next_run:
+            account = accounts[index % len(accounts)]
+            test_case_id = account["test_case_ids"][index % len(account["test_case_ids"])]
+            started = time.perf_counter()
+            response = await client.post(
+                f"/api/tests/{test_case_id}/run", headers=account["headers"], json={"test_case_id": test_case_id}
+            )
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                samples.append({"status": f"http_{response.status_code}", "end_to_end": elapsed, "browser": 0.0})
+                continue
+            run = response.json()
+            samples.append({"status": run["status"], "end_to_end": elapsed, "browser": run.get("execution_time") or 0.0})
+    
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+def _git_commit():
+    from api_benchmark import _git_commit
+    return _git_commit()
+
+async def main_async(args):
+    invoked_from = os.getcwd()
+    try:
+        import httpx
+    except ImportError:
+        raise SystemExit("httpx is required for the load harness: pip install httpx")
+    
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=None)
+        mode = "uvicorn"
+    else:
+        configure_in_process(args)
+        # main.py resolves static/ relative to the working directory
+        os.chdir(ROOT_DIR)
+        import logging
+        from database import engine, Base
+        from main import app
+        logging.disable(logging.WARNING)
+        Base.metadata.create_all(bind=engine)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-harness", timeout=None)
+        mode = "in-process"
+    
+    async with client:
+        accounts = await create_users(client, args.users, args.cases_per_user)
+        print(f"Pushing {args.runs} runs ({args.mode} mode, {mode}) through {args.users} users...")
+        submit_latencies = []
+        started = time.perf_counter()
+        if args.mode == "batch":
+            await submit_batches(client, accounts, args.runs, args.batch_size, args.concurrency, submit_latencies)
+            samples = await wait_for_batches(client, accounts, args.poll_interval, args.timeout)
+        else:
+            samples = await run_interactive(client, accounts, args.runs, args.concurrency)
+        elapsed = time.perf_counter() - started
+    
+    by_status = {}
+    for sample in samples:
+        by_status[sample["status"]] = by_status.get(sample["status"], 0) + 1
+    browser_seconds = sum(sample["browser"] for sample in samples)
+    end_to_end_seconds = sum(sample["end_to_end"] for sample in samples)
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.utcnow().isoformat(),
+            "mode": mode,
+            "submit_mode": args.mode,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "runs": args.runs,
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "batch_size": args.batch_size if args.mode == "batch" else None,
+            "slots": args.slots,
+            "time_scale": float(os.getenv("SIMULATED_TIME_SCALE", args.time_scale)),
+            "poll_interval_s": args.poll_interval if args.mode == "batch" else None,
+        },
+        "totals": {
+            "completed": len(samples),
+            "unfinished": args.runs - len(samples),
+            "by_status": by_status,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_runs_per_s": round(len(samples) / elapsed, 2) if elapsed else 0,
+            "browser_seconds": round(browser_seconds, 3),
+            # All slots busy with browser time the whole run
+            "ideal_elapsed_s": round(browser_seconds / args.slots, 3),
+            "overhead_share": round(1 - browser_seconds / end_to_end_seconds, 4) if end_to_end_seconds else None,
+        },
+        "seconds": {
+            "submit": distribution(submit_latencies),
+            "end_to_end": distribution([sample["end_to_end"] for sample in samples]),
+            "browser": distribution([sample["browser"] for sample in samples]),
+            "overhead": distribution([sample["end_to_end"] - sample["browser"] for sample in samples]),
+        },
+    }
+    
+    totals = report["totals"]
+    print(f"{totals['completed']} runs in {totals['elapsed_s']}s ({totals['throughput_runs_per_s']} runs/s), "
+          f"ideal {totals['ideal_elapsed_s']}s at {args.slots} slots; statuses {by_status}")
+    for name, stats in report["seconds"].items():
+        if stats:
+            print(f"{name:12} mean {stats['mean']:>9.4f}  p50 {stats['p50']:>9.4f}  p95 {stats['p95']:>9.4f}  p99 {stats['p99']:>9.4f}")
+    
+    if args.output:
+        args.output = os.path.join(invoked_from, args.output)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Platform overhead under load, on the simulated executor")
+    parser.add_argument("--mode", choices=("batch", "run"), default="batch")
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--cases-per-user", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent submitting requests")
+    parser.add_argument("--batch-size", type=int, default=50, help="Runs per batch-run request")
+    parser.add_argument("--slots", type=int, default=64, help="Execution slots (in-process: scheduler and per-user limit)")
+    parser.add_argument("--time-scale", type=float, default=0.01, help="SIMULATED_TIME_SCALE (in-process)")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--timeout", type=float, default=600, help="Give up waiting for runs after this many seconds")
+    parser.add_argument("--db", default="load_harness.db", help="SQLite file for in-process mode; recreated")
+    parser.add_argument("--base-url", help="Load a running server instead of the in-process app")
+    parser.add_argument("--output", help="Write JSON results here")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -0,0 +1,217 @@
+"""
+Seed a SQLite database with a large, realistic dataset for API benchmarks
+
+Ownership is deterministic so the benchmark driver can pick valid ids
+without querying:
+  test case t belongs to user ((t - 1) % users) + 1
+  test run r belongs to test case ((r - 1) % test_cases) + 1
+
+Usage:
+    python benchmarks/seed_dataset.py --db bench.db
+    python benchmarks/seed_dataset.py --db bench.db --scale 0.01
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_USERS = 10_000
+DEFAULT_TEST_CASES = 500_000
+DEFAULT_TEST_RUNS = 20_000_000
+BATCH_SIZE = 50_000
+HISTORY_DAYS = 90
+
+# Shared bcrypt hash of "benchmark" so seeding doesn't pay for 10k hashes
+BENCHMARK_PASSWORD = "benchmark"
+
+STATUS_WEIGHTS = [("passed", 0.78), ("failed", 0.15), ("error", 0.05), ("running", 0.01), ("pending", 0.01)]
+
+SAMPLE_STEPS = [
+    {"type": "navigate", "value": "https://org.crm.dynamics.com", "description": "Open D365", "timeout": 30000},
+    {"type": "click", "selector": "[data-id='sitemap-entity-account']", "description": "Open accounts", "timeout": 5000},
+    {"type": "click", "selector": "[data-id='new-record-button']", "description": "New account", "timeout": 5000},
+    {"type": "fill", "selector": "[data-id='name.fieldControl-text-box-text']", "value": "Contoso", "description": "Fill name", "timeout": 5000},
+    {"type": "click", "selector": "[data-id='save-button']", "description": "Save", "timeout": 5000},
+    {"type": "verify", "selector": "[data-id='form-header']", "expected": "visible", "description": "Saved", "timeout": 5000},
+]
+
+ERROR_MESSAGES = [
+    "TimeoutError: page.click: Timeout 5000ms exceeded.",
+    "Error: expect(locator).toBeVisible() failed",
+    "Error: page.goto: net::ERR_CONNECTION_RESET",
+    "TimeoutError: page.waitForSelector: Timeout 30000ms exceeded.",
+]
+
+def _create_schema(db_path):
+    """Create tables through the ORM metadata so the schema matches the app"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from sqlalchemy import create_engine
+    from database import Base
+    import models  # noqa: F401 - registers tables on Base.metadata
+    
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    engine.dispose()
+
+def _pick_status(rng):
+    roll = rng.random()
+    cumulative = 0.0
+    for status, weight in STATUS_WEIGHTS:
+        cumulative += weight
+        if roll < cumulative:
+            return status
+    return "passed"
+
+def _insert_batches(conn, sql, rows, total, label):
+    """Insert rows from a generator in fixed-size executemany batches"""
+    started = time.perf_counter()
+    batch = []
+    inserted = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            inserted += len(batch)
+            batch.clear()
+            if inserted % (BATCH_SIZE * 20) == 0:
+                rate = inserted / (time.perf_counter() - started)
+                print(f"  {label}: {inserted:,}/{total:,} ({rate:,.0f} rows/s)")
+    if batch:
+        conn.executemany(sql, batch)
+        inserted += len(batch)
+    conn.commit()
+    print(f"  {label}: {inserted:,} rows in {time.perf_counter() - started:.1f}s")
+
+def seed(db_path, users, test_cases, test_runs, seed_value=42):
+    """Build the benchmark database and write a manifest next to it"""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    _create_schema(db_path)
+    
+    from auth import get_password_hash
+    password_hash = get_password_hash(BENCHMARK_PASSWORD)
+    
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    history_start = now - timedelta(days=HISTORY_DAYS)
+    steps_json = json.dumps(SAMPLE_STEPS)
+    
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA cache_size=-200000")
+    
+    print(f"Seeding {db_path}")
+    _insert_batches(
+        conn,
+        "INSERT INTO users (id, username, email, hashed_password, is_active, created_at) VALUES (?, ?, ?, ?, 1, ?)",
+        (
+            (i, f"bench_user_{i}", f"bench_user_{i}@example.com", password_hash, history_start.isoformat(" "))
+            for i in range(1, users + 1)
+        ),
+        users,
+        "users"
+    )
+    
+    _insert_batches(
+        conn,
+        "INSERT INTO test_cases (id, name, description, steps, expected_result, tags, is_active, owner_id, created_at) "
+        "VALUES (?, ?, ?, ?, 'pass', ?, 1, ?, ?)",
+        (
+            (
+                t,
+                f"Account scenario {t}",
+                "Generated benchmark test case",
+                steps_json,
+                "benchmark,d365,account",
+                ((t - 1) % users) + 1,
+                (history_start + timedelta(seconds=rng.randrange(HISTORY_DAYS * 86400))).isoformat(" ")
+            )
+            for t in range(1, test_cases + 1)
+        ),
+        test_cases,
+        "test_cases"
+    )
+    
+    def run_rows():
+        span = HISTORY_DAYS * 86400
+        for r in range(1, test_runs + 1):
+            test_case_id = ((r - 1) % test_cases) + 1
+            status = _pick_status(rng)
+            # Runs are inserted in roughly chronological order, like production
+            created = history_start + timedelta(seconds=span * r / test_runs)
+            duration = rng.lognormvariate(3.2, 0.6) if status not in ("pending", "running") else None
+            completed = created + timedelta(seconds=duration) if duration is not None else None
+            yield (
+                r,
+                test_case_id,
+                ((test_case_id - 1) % users) + 1,
+                status,
+                duration,
+                rng.choice(ERROR_MESSAGES) if status in ("failed", "error") else None,
+                created.isoformat(" "),
+                completed.isoformat(" ") if completed else None,
+                created.isoformat(" ")
+            )
+    
+    _insert_batches(
+        conn,
+        "INSERT INTO test_runs (id, test_case_id, user_id, status, execution_time, error_message, started_at, completed_at, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        run_rows(),
+        test_runs,
+        "test_runs"
+    )
+    
+    print("  creating reporting indexes")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_test_runs_user_created ON test_runs (user_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_test_runs_test_case_created ON test_runs (test_case_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_test_cases_owner ON test_cases (owner_id, is_active)")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    
+    manifest = {
+        "db_path": os.path.abspath(db_path),
+        "users": users,
+        "test_cases": test_cases,
+        "test_runs": test_runs,
+        "password": BENCHMARK_PASSWORD,
+        "seed": seed_value,
+        "created_at": now.isoformat()
+    }
+    with open(manifest_path(db_path), "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Wrote manifest {manifest_path(db_path)}")
+    return manifest
+
+def manifest_path(db_path):
+    """Location of the manifest describing a seeded database"""
+    return f"{db_path}.manifest.json"
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a SQLite database for API benchmarks")
+    parser.add_argument("--db", default="benchmark.db", help="SQLite file to (re)create")
+    parser.add_argument("--users", type=int, default=DEFAULT_USERS)
+    parser.add_argument("--test-cases", type=int, default=DEFAULT_TEST_CASES)
+    parser.add_argument("--test-runs", type=int, default=DEFAULT_TEST_RUNS)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply all row counts, e.g. 0.01 for a quick run")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    
+    seed(
+        args.db,
+        max(1, int(args.users * args.scale)),
+        max(1, int(args.test_cases * args.scale)),
+        max(1, int(args.test_runs * args.scale)),
+        args.seed
+    )
+
+if __name__ == "__main__":
+    main()
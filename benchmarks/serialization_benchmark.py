@@ -0,0 +1,141 @@
+"""
+Serialization time and peak memory for large list responses
+
+Compares, per page size, the three ways a list endpoint can build its body:
+  pydantic     model_validate() per row + jsonable_encoder + json.dumps
+               (what response_model with the stock JSONResponse did)
+  row_encoder  RowEncoder dicts + serialization.dumps (orjson when installed)
+  stream       the stream=json path: yield_per batches, only one batch resident
+
+Rows come from a database built by seed_dataset.py.
+
+Usage:
+    python benchmarks/serialization_benchmark.py --db bench.db
+    python benchmarks/serialization_benchmark.py --db bench.db --limits 1000 10000 --output results/serialization.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import statistics
+import tracemalloc
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+def _strategies(schemas, serialization, jsonable_encoder):
+    """name -> fn(query_factory, schema, encoder) returning encoded bytes length"""
+    def pydantic_path(make_query, schema, encoder):
+        rows = make_query().all()
+        payload = jsonable_encoder([schema.model_validate(row) for row in rows])
+        return len(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+    
+    def row_encoder_path(make_query, schema, encoder):
+        return len(serialization.dumps([encoder(row) for row in make_query()]))
+    
+    def stream_path(make_query, schema, encoder):
+        total = 0
+        for chunk in serialization._stream_chunks(
+            make_query().yield_per(serialization.STREAM_BATCH_SIZE), encoder, "json", serialization.STREAM_BATCH_SIZE
+        ):
+            total += len(chunk)
+        return total
+    
+    return {
+        "pydantic": pydantic_path,
+        "row_encoder": row_encoder_path,
+        "stream": stream_path,
+    }
+
+def measure(fn, make_query, schema, encoder, repeat, session):
+    """Median wall time over repeat runs, then one traced run for peak memory"""
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        session.expunge_all()
+        gc.collect()
+        started = time.perf_counter()
+        size = fn(make_query, schema, encoder)
+        timings.append((time.perf_counter() - started) * 1000)
+    
+    session.expunge_all()
+    gc.collect()
+    tracemalloc.start()
+    fn(make_query, schema, encoder)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return {
+        "median_ms": round(statistics.median(timings), 2),
+        "min_ms": round(min(timings), 2),
+        "peak_kib": round(peak / 1024, 1),
+        "bytes": size,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="List serialization benchmark")
+    parser.add_argument("--db", default="benchmark.db", help="Database created by seed_dataset.py")
+    parser.add_argument("--limits", type=int, nargs="+", default=[100, 1000, 10000], help="Page sizes to encode")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="Write JSON results here")
+    args = parser.parse_args()
+    
+    invoked_from = os.getcwd()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+    os.environ.setdefault("SLOW_QUERY_THRESHOLD_MS", "0")
+    os.chdir(ROOT_DIR)
+    
+    from fastapi.encoders import jsonable_encoder
+    from database import SessionLocal
+    import models
+    import schemas
+    import serialization
+    
+    strategies = _strategies(schemas, serialization, jsonable_encoder)
+    datasets = {
+        "test_runs": (models.TestRun, schemas.TestRun, serialization.RowEncoder(schemas.TestRun)),
+        "test_cases": (
+            models.TestCase,
+            schemas.TestCase,
+            serialization.RowEncoder(schemas.TestCase, nested={"steps": schemas.TestStepBase})
+        ),
+    }
+    
+    session = SessionLocal()
+    results = []
+    print(f"encoder: {'orjson' if serialization.orjson else 'json (stdlib)'}")
+    print(f"{'dataset':11} {'rows':>7} {'strategy':12} {'median ms':>10} {'peak KiB':>10} {'bytes':>11}")
+    try:
+        for dataset, (model, schema, encoder) in datasets.items():
+            for limit in args.limits:
+                make_query = lambda: session.query(model).order_by(model.id).limit(limit)
+                for name, fn in strategies.items():
+                    stats = measure(fn, make_query, schema, encoder, args.repeat, session)
+                    results.append({"dataset": dataset, "rows": limit, "strategy": name, **stats})
+                    print(
+                        f"{dataset:11} {limit:>7} {name:12} {stats['median_ms']:>10.1f} "
+                        f"{stats['peak_kib']:>10.1f} {stats['bytes']:>11,}"
+                    )
+    finally:
+        session.close()
+    
+    if args.output:
+        args.output = os.path.join(invoked_from, args.output)
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({
+                "meta": {
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "encoder": "orjson" if serialization.orjson else "json",
+                    "stream_batch_size": serialization.STREAM_BATCH_SIZE,
+                    "repeat": args.repeat,
+                },
+                "results": results,
+            }, f, indent=2)
+        print(f"Wrote {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Artifact capture policies (trace, screenshot, video) for generated Playwright runs
+
+A policy can be set on an environment, a test suite and a test case; the
+more specific layer wins field by field, on top of CAPTURE_POLICY_DEFAULT.
+"""
+import os
+import zlib
+from typing import Dict, Any, List, Optional
+
+from fastapi import HTTPException, status
+
+TRACE_MODES = ['off', 'on', 'retain-on-failure', 'on-first-retry', 'sampled']
+SCREENSHOT_MODES = ['off', 'on', 'only-on-failure']
+VIDEO_MODES = ['off', 'on', 'retain-on-failure', 'on-first-retry']
+MAX_RETRIES = 3
+
+# Built-in presets that a stored policy can extend
+BUILTIN_POLICIES: Dict[str, Dict[str, Any]] = {
+    'off': {'trace': 'off', 'screenshot': 'off', 'video': 'off'},
+    'full': {'trace': 'on', 'screenshot': 'on', 'video': 'off'},
+    'retain-on-failure': {'trace': 'retain-on-failure', 'screenshot': 'only-on-failure', 'video': 'off'},
+    'on-first-retry': {'trace': 'on-first-retry', 'screenshot': 'only-on-failure', 'video': 'off', 'retries': 1},
+    # Failures always keep their trace; 1 in trace_sample_rate passing runs keeps one too
+    'sampled': {'trace': 'sampled', 'trace_sample_rate': 10, 'screenshot': 'only-on-failure', 'video': 'off'},
+    'screenshot-only': {'trace': 'off', 'screenshot': 'only-on-failure', 'video': 'off'},
+    'video': {'trace': 'retain-on-failure', 'screenshot': 'only-on-failure', 'video': 'retain-on-failure'},
+}
+
+# Presets from least to most capture, used to pick the baseline in cost reports
+PRESETS_BY_COST = ['off', 'screenshot-only', 'sampled', 'retain-on-failure', 'on-first-retry', 'video', 'full']
+
+DEFAULT_CAPTURE_POLICY = os.getenv("CAPTURE_POLICY_DEFAULT", "retain-on-failure")
+
+POLICY_FIELDS = ('trace', 'screenshot', 'video', 'trace_sample_rate', 'retries')
+
+def resolve_capture_policy(*layers: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Merge stored policies, least specific first (environment, suite, test case)"""
+    if DEFAULT_CAPTURE_POLICY not in BUILTIN_POLICIES:
+        raise ValueError(f"Unknown CAPTURE_POLICY_DEFAULT preset: {DEFAULT_CAPTURE_POLICY}")
+    name = DEFAULT_CAPTURE_POLICY
+    resolved = {'trace_sample_rate': 10, 'retries': 0, **BUILTIN_POLICIES[name]}
+    customized = False
+    
+    for layer in layers:
+        if not layer:
+            continue
+        preset_name = layer.get('preset')
+        if preset_name:
+            if preset_name not in BUILTIN_POLICIES:
+                raise ValueError(f"Unknown capture policy preset: {preset_name}")
+            name = preset_name
+            customized = False
+            resolved = {'trace_sample_rate': 10, 'retries': 0, **BUILTIN_POLICIES[preset_name]}
+        overrides = {field: layer[field] for field in POLICY_FIELDS if layer.get(field) is not None}
+        if overrides:
+            customized = True
+            resolved.update(overrides)
+    
+    if resolved['trace'] not in TRACE_MODES:
+        raise ValueError(f"Unknown trace mode: {resolved['trace']}")
+    if resolved['screenshot'] not in SCREENSHOT_MODES:
+        raise ValueError(f"Unknown screenshot mode: {resolved['screenshot']}")
+    if resolved['video'] not in VIDEO_MODES:
+        raise ValueError(f"Unknown video mode: {resolved['video']}")
+    if not 1 <= int(resolved['trace_sample_rate']) <= 10000:
+        raise ValueError("trace_sample_rate must be between 1 and 10000")
+    if not 0 <= int(resolved['retries']) <= MAX_RETRIES:
+        raise ValueError(f"retries must be between 0 and {MAX_RETRIES}")
+    
+    # *-on-first-retry modes capture nothing unless the run is retried
+    if 'on-first-retry' in (resolved['trace'], resolved['video']) and not resolved['retries']:
+        resolved['retries'] = 1
+    
+    resolved['name'] = f"{name}+custom" if customized else name
+    return resolved
+
+def normalize_capture_policy(policy: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Stored form of a submitted policy (unset fields dropped); raises ValueError if invalid"""
+    stored = {key: value for key, value in (policy or {}).items() if value is not None}
+    if not stored:
+        return None
+    resolve_capture_policy(stored)
+    return stored
+
+def validate_capture_policy(policy: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """normalize_capture_policy for API writes; 400 for unknown presets or modes"""
+    try:
+        return normalize_capture_policy(policy)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def plan_capture(policy: Dict[str, Any], run_id: int) -> Dict[str, Any]:
+    """Concrete Playwright modes for one run, deciding trace sampling by run id"""
+    plan = dict(policy)
+    if policy['trace'] == 'sampled':
+        rate = int(policy['trace_sample_rate'])
+        # crc32 spreads consecutive run ids evenly and is stable across restarts
+        plan['sampled'] = zlib.crc32(str(run_id).encode()) % rate == 0
+        plan['trace'] = 'on' if plan['sampled'] else 'retain-on-failure'
+    return plan
+
+def playwright_cli_args(plan: Dict[str, Any]) -> List[str]:
+    args = [f"--trace={plan['trace']}"]
+    if plan.get('retries'):
+        args.append(f"--retries={int(plan['retries'])}")
+    return args
+
+def generate_capture_script(plan: Dict[str, Any]) -> List[str]:
+    """Module-level JavaScript setting screenshot and video capture for the test"""
+    return [
+        f"test.use({{ screenshot: '{plan['screenshot']}', video: '{plan['video']}' }});",
+        ""
+    ]
@@ -0,0 +1,103 @@
+"""
+Five-field cron expressions: minute hour day-of-month month day-of-week
+
+Fields accept *, lists (1,15), ranges (1-5), steps (*/15, 8-18/2) and, for
+months and weekdays, names (jan, mon). Aliases @hourly, @daily, @weekly and
+@monthly are accepted. As in Vixie cron, a day matches when day-of-month OR
+day-of-week matches if both are restricted. Times are evaluated in the given
+time zone and returned as naive UTC, like the rest of the platform's timestamps.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, Optional
+from zoneinfo import ZoneInfo
+
+ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_WEEKDAYS = ["sun", "mon", "tue", "wed", "thu", "fri", "sat"]
+# Give up looking for a matching day after this long (e.g. "0 0 30 2 *")
+MAX_SEARCH_DAYS = 366 * 5
+
+def _parse_field(text: str, low: int, high: int, names: Optional[List[str]] = None) -> List[int]:
+    values = set()
+    for part in text.lower().split(","):
+        spec, _, step_text = part.partition("/")
+        step = int(step_text) if step_text else 1
+        if step < 1:
+            raise ValueError(f"Invalid step in cron field: {part}")
+        if spec == "*":
+            start, end = low, high
+        else:
+            first, dash, last = spec.partition("-")
+            if dash and not last:
+                raise ValueError(f"Open range in cron field: {part}")
+            start = _parse_value(first, names)
+            end = _parse_value(last, names) if last else (high if step_text else start)
+        if not low <= start <= high or not low <= end <= high or start > end:
+            raise ValueError(f"Cron field value out of range: {part}")
+        values.update(range(start, end + 1, step))
+    # Day-of-week 7 is Sunday too
+    return sorted({value % 7 if high == 7 else value for value in values})
+
+def _parse_value(text: str, names: Optional[List[str]]) -> int:
+    if names and text[:3] in names:
+        return names.index(text[:3]) + (1 if len(names) == 12 else 0)
+    return int(text)
+
+class CronExpression:
+    def __init__(self, expression: str, tz: str = "UTC"):
+        self.expression = expression.strip()
+        fields = ALIASES.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError("Cron expression needs 5 fields: minute hour day-of-month month day-of-week")
+        try:
+            self.minutes = _parse_field(fields[0], 0, 59)
+            self.hours = _parse_field(fields[1], 0, 23)
+            self.days = set(_parse_field(fields[2], 1, 31))
+            self.months = set(_parse_field(fields[3], 1, 12, _MONTHS))
+            self.weekdays = set(_parse_field(fields[4], 0, 7, _WEEKDAYS))
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}")
+        self.day_restricted = fields[2] != "*"
+        self.weekday_restricted = fields[4] != "*"
+        self.tz = ZoneInfo(tz)
+    
+    def _day_matches(self, day) -> bool:
+        if day.month not in self.months:
+            return False
+        in_month = day.day in self.days
+        in_week = (day.weekday() + 1) % 7 in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return in_month or in_week
+        return in_month and in_week
+    
+    def next_after(self, after: datetime) -> datetime:
+        """First fire time strictly after `after` (naive UTC in and out)"""
+        local = after.replace(tzinfo=timezone.utc).astimezone(self.tz).replace(tzinfo=None)
+        local = local.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = local.date()
+        for _ in range(MAX_SEARCH_DAYS):
+            if self._day_matches(day):
+                earliest = (local.hour, local.minute) if day == local.date() else (0, 0)
+                for hour in self.hours:
+                    if hour < earliest[0]:
+                        continue
+                    for minute in self.minutes:
+                        if (hour, minute) < earliest:
+                            continue
+                        fire = datetime(day.year, day.month, day.day, hour, minute, tzinfo=self.tz)
+                        fire = fire.astimezone(timezone.utc).replace(tzinfo=None)
+                        if fire > after:
+                            return fire
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+    
+    def iter_after(self, after: datetime) -> Iterator[datetime]:
+        while True:
+            after = self.next_after(after)
+            yield after
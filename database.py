@@ -2,36 +2,223 @@
 Database configuration and session management
 """
 import os
-from sqlalchemy import create_engine, text
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import create_engine, event, inspect, text, bindparam, DateTime
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from urllib.parse import quote_plus
 import logging
 
+from metrics import POOL_CHECKOUT_WAIT, POOL_CHECKED_OUT, current_route
+
 logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("d365.slow_query")
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "mssql+pyodbc://localhost/D365TestPlatform?driver=ODBC+Driver+17+for+SQL+Server&trusted_connection=yes")
 
-# Create engine
-try:
-    engine = create_engine(
-        DATABASE_URL,
-        echo=True,  # Set to False in production
+# Optional read replica for reporting and listing reads (see ReplicaRouter)
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+# Reads fall back to the primary while the replica is further behind than this
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_HEARTBEAT_SECONDS = float(os.getenv("REPLICA_HEARTBEAT_SECONDS", "1"))
+# An unreachable replica fails fast instead of stalling the heartbeat and reads
+REPLICA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REPLICA_CONNECT_TIMEOUT_SECONDS", "2"))
+
+# Connect argument holding the connection timeout, per backend
+CONNECT_TIMEOUT_ARGS = {
+    "sqlite": "timeout",
+    "mssql": "timeout",
+    "postgresql": "connect_timeout",
+    "mysql": "connect_timeout",
+}
+
+# Engine profiles, selected with DB_PROFILE and overridable per setting
+ENGINE_PROFILES = {
+    "production": {
+        "echo": False,
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "pool_recycle": 300,
+    },
+    "development": {
+        "echo": False,
+        "pool_size": 5,
+        "max_overflow": 5,
+        "pool_timeout": 10,
+        "pool_recycle": 300,
+    },
+    "debug": {
+        "echo": True,
+        "pool_size": 2,
+        "max_overflow": 2,
+        "pool_timeout": 10,
+        "pool_recycle": 300,
+    },
+}
+DB_PROFILE = os.getenv("DB_PROFILE", "production")
+
+# Applied to every new SQLite connection (dev fallback and local benchmarks)
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": "5000",
+    "cache_size": "-64000",
+    "temp_store": "MEMORY",
+    "mmap_size": "268435456",
+}
+
+# Slow-query log: statements slower than the threshold, sampled at the given rate
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_SAMPLE_RATE", "1.0"))
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    return default if value is None else value.lower() in ("1", "true", "yes")
+
+def engine_settings(profile_name=DB_PROFILE):
+    """Resolve pool and logging settings for a profile plus env overrides"""
+    if profile_name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_PROFILE: {profile_name}")
+    profile = ENGINE_PROFILES[profile_name]
+    return {
+        "echo": _env_bool("DB_ECHO", profile["echo"]),
+        "pool_size": int(os.getenv("DB_POOL_SIZE", profile["pool_size"])),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", profile["max_overflow"])),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", profile["pool_timeout"])),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", profile["pool_recycle"])),
+    }
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that reports how long callers waited to check out a connection"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        connection = super()._do_get()
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+        return connection
+
+def _parameter_shape(parameters, executemany):
+    """Describe bound parameters by type only, never by value"""
+    if executemany and isinstance(parameters, (list, tuple)) and parameters:
+        return f"{len(parameters)} x {_parameter_shape(parameters[0], False)}"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+def _create_engine(url, settings, connect_timeout=None):
+    """Build an engine for a URL with the profile's pool settings"""
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    timeout_arg = CONNECT_TIMEOUT_ARGS.get(make_url(url).get_backend_name())
+    if connect_timeout and timeout_arg:
+        # psycopg2 and pymysql only take whole seconds
+        connect_args[timeout_arg] = connect_timeout if timeout_arg == "timeout" else max(1, round(connect_timeout))
+    pool_args = {}
+    if ":memory:" not in url and url != "sqlite://":
+        pool_args = {
+            "poolclass": TimedQueuePool,
+            "pool_size": settings["pool_size"],
+            "max_overflow": settings["max_overflow"],
+            "pool_timeout": settings["pool_timeout"],
+        }
+    return create_engine(
+        url,
+        echo=settings["echo"],
         pool_pre_ping=True,
-        pool_recycle=300
+        pool_recycle=settings["pool_recycle"],
+        connect_args=connect_args,
+        **pool_args
     )
-    logger.info("Database engine created successfully")
+
+def _install_engine_hooks(engine):
+    """SQLite pragmas, pool occupancy and the slow-query log"""
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma, value in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {pragma}={value}")
+            cursor.close()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        POOL_CHECKED_OUT.dec()
+
+    if SLOW_QUERY_THRESHOLD_MS <= 0:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _slow_query_start(conn, cursor, statement, parameters, context, executemany):
+        context._slow_query_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _slow_query_end(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context._slow_query_started) * 1000
+        if elapsed_ms < SLOW_QUERY_THRESHOLD_MS or random.random() >= SLOW_QUERY_SAMPLE_RATE:
+            return
+        slow_query_logger.warning(
+            "slow query %.1fms route=%s params=%s sql=%s",
+            elapsed_ms,
+            current_route() or "-",
+            _parameter_shape(parameters, executemany),
+            " ".join(statement.split())
+        )
+
+# Create engine
+settings = engine_settings()
+try:
+    engine = _create_engine(DATABASE_URL, settings)
+    logger.info(f"Database engine created successfully (profile: {DB_PROFILE})")
 except Exception as e:
     logger.error(f"Failed to create database engine: {e}")
     # Fallback to SQLite for development
     DATABASE_URL = "sqlite:///./d365_test_platform.db"
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    engine = _create_engine(DATABASE_URL, settings)
     logger.info("Fallback to SQLite database")
 
+_install_engine_hooks(engine)
+
+replica_engine = None
+if DATABASE_REPLICA_URL:
+    try:
+        replica_engine = _create_engine(
+            DATABASE_REPLICA_URL,
+            {**settings, "pool_timeout": min(settings["pool_timeout"], REPLICA_CONNECT_TIMEOUT_SECONDS)},
+            connect_timeout=REPLICA_CONNECT_TIMEOUT_SECONDS
+        )
+        _install_engine_hooks(replica_engine)
+        logger.info("Read replica engine created")
+    except Exception as e:
+        logger.error(f"Failed to create read replica engine, reading from the primary: {e}")
+
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only sessions: on the replica, or on the primary when it can't serve a read
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine or engine)
+PrimaryReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+def _reject_writes(session, flush_context, instances):
+    raise RuntimeError("Read-only session: use get_db for writes")
+
+event.listen(ReplicaSessionLocal, "before_flush", _reject_writes)
+event.listen(PrimaryReadSessionLocal, "before_flush", _reject_writes)
+
 # Create base class for models
 Base = declarative_base()
 
@@ -43,6 +230,154 @@ def get_db():
     finally:
         db.close()
 
+class ReplicaRouter:
+    """Decides per read whether the replica is fresh enough
+    
+    A heartbeat loop writes the current time to the primary's
+    replication_heartbeat row and reads it back from the replica. The
+    replica's copy is a watermark: every commit before it has replicated,
+    and now minus it is the lag. A user's reads go to the primary while
+    the replica is too far behind or hasn't reached the user's last write
+    (noted by response_cache.invalidate after every write), so a run list
+    read right after a run completes shows it. Last writes are tracked per
+    process; with several workers, a user's next read may land on another
+    one and trail by up to the lag.
+    """
+    
+    def __init__(self, max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS):
+        self.max_lag_seconds = max_lag_seconds
+        self.watermark: Optional[datetime] = None
+        self.lag_seconds: Optional[float] = None
+        self.error: Optional[str] = None  # Why the last heartbeat couldn't read the replica
+        self._last_writes: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+        self.replica_reads = 0
+        self.primary_reads = 0
+    
+    @property
+    def enabled(self) -> bool:
+        return replica_engine is not None
+    
+    def note_write(self, user_id: int):
+        if self.enabled:
+            with self._lock:
+                self._last_writes[user_id] = datetime.utcnow()
+    
+    def use_replica(self, user_id: Optional[int]) -> bool:
+        if not self.enabled or self.watermark is None or self.lag_seconds > self.max_lag_seconds:
+            return False
+        last_write = self._last_writes.get(user_id)
+        return last_write is None or last_write <= self.watermark
+    
+    def observe(self, watermark: Optional[datetime], now: datetime):
+        """Record the replica's heartbeat; writes it has caught up with no longer matter"""
+        self.watermark = watermark
+        self.lag_seconds = (now - watermark).total_seconds() if watermark else None
+        if watermark:
+            with self._lock:
+                for user_id in [user_id for user_id, at in self._last_writes.items() if at <= watermark]:
+                    del self._last_writes[user_id]
+    
+    def status(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "lag_seconds": round(self.lag_seconds, 3) if self.lag_seconds is not None else None,
+            "max_lag_seconds": self.max_lag_seconds,
+            "error": self.error,
+            "users_reading_primary": len(self._last_writes),
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+        }
+
+replica_router = ReplicaRouter()
+
+def read_session(user_id: Optional[int] = None):
+    """Read-only session on the replica, or on the primary if the replica is behind for this user"""
+    if replica_router.use_replica(user_id):
+        replica_router.replica_reads += 1
+        return ReplicaSessionLocal()
+    replica_router.primary_reads += 1
+    return PrimaryReadSessionLocal()
+
+_WRITE_HEARTBEAT = text("UPDATE replication_heartbeat SET beat_at = :now WHERE id = 1").bindparams(bindparam("now", type_=DateTime()))
+_INSERT_HEARTBEAT = text("INSERT INTO replication_heartbeat (id, beat_at) VALUES (1, :now)").bindparams(bindparam("now", type_=DateTime()))
+_READ_HEARTBEAT = text("SELECT beat_at FROM replication_heartbeat WHERE id = 1").columns(beat_at=DateTime())
+
+def replica_heartbeat():
+    """Write a heartbeat to the primary and observe how far the replica trails it"""
+    now = datetime.utcnow()
+    with engine.begin() as connection:
+        if not connection.execute(_WRITE_HEARTBEAT, {"now": now}).rowcount:
+            connection.execute(_INSERT_HEARTBEAT, {"now": now})
+    error = None
+    try:
+        with replica_engine.connect() as connection:
+            watermark = connection.execute(_READ_HEARTBEAT).scalar()
+    except Exception as e:
+        watermark, error = None, str(e).splitlines()[0]
+    if error != replica_router.error:
+        if error:
+            logger.warning(f"Read replica unavailable, reading from the primary: {error}")
+        else:
+            logger.info("Read replica available again")
+        replica_router.error = error
+    replica_router.observe(watermark, now)
+
+async def replica_heartbeat_loop():
+    """Run replica_heartbeat every REPLICA_HEARTBEAT_SECONDS, in a worker thread off the event loop"""
+    while True:
+        try:
+            await asyncio.to_thread(replica_heartbeat)
+        except Exception as e:
+            replica_router.observe(None, datetime.utcnow())
+            logger.error(f"Replica heartbeat failed: {e}")
+        await asyncio.sleep(REPLICA_HEARTBEAT_SECONDS)
+
+def pool_status(pool_engine=None):
+    """Current connection pool occupancy, for health checks"""
+    pool = (pool_engine or engine).pool
+    if not isinstance(pool, QueuePool):
+        return {"pool": type(pool).__name__}
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "checked_in": pool.checkedin(),
+    }
+
+def add_missing_columns(bind=None):
+    """Add model columns and indexes that existing tables don't have yet
+
+    create_all only creates missing tables, so a database created before a
+    column was added to a model gets it here (ALTER TABLE ... ADD, with its
+    server default). Foreign key and check constraints are not added to
+    existing tables; for SQL Server, sql/migrations.sql has those too.
+    Returns the "table.column" names that were added.
+    """
+    bind = bind or engine
+    inspector = inspect(bind)
+    added = []
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            missing = [column for column in table.columns if column.name not in existing]
+            for column in missing:
+                spec = CreateColumn(column).compile(dialect=bind.dialect)
+                connection.execute(text(f"ALTER TABLE {bind.dialect.identifier_preparer.format_table(table)} ADD {spec}"))
+                added.append(f"{table.name}.{column.name}")
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+    if added:
+        logger.info(f"Added columns missing from existing tables: {added}")
+    return added
+
 def test_connection():
     """Test database connection"""
     try:
@@ -0,0 +1,166 @@
+"""
+Data-driven test cases: a dataset's rows bound to {{placeholders}} in the steps
+
+A test case with a dataset_id is a template. Each {{column}} in a step's
+selector, value or expected text stands for that column of a row. A run
+request for it creates a parent run plus one pending child run per row,
+and the children run in parallel in the batch lane (bounded by the
+scheduler's slots and the user's quota). They all execute one generated
+script: placeholders compile to lookups in the row the executor passes
+in, so the script is shared rather than rendered per row. When the last
+child finishes, finish_parent rolls the row outcomes up onto the parent.
+
+Rows are stored once, in the datasets table, and never edited; to change
+the data, upload a new dataset and point the test case at it.
+"""
+import io
+import os
+import re
+import csv
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+DATASET_MAX_ROWS = int(os.getenv("DATASET_MAX_ROWS", "1000"))
+
+PLACEHOLDER = re.compile(r"\{\{\s*([^{}]+?)\s*\}\}")
+# Step fields placeholders are bound in
+BOUND_FIELDS = ("selector", "value", "expected")
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    raise ValueError(f"Dataset values must be strings, numbers or booleans, not {type(value).__name__}")
+
+def parse_dataset(rows: Optional[List[Dict[str, Any]]] = None, csv_text: Optional[str] = None) -> Tuple[List[str], List[Dict[str, str]]]:
+    """Columns and string-valued rows from JSON rows or CSV text; ValueError when they're unusable"""
+    if (rows is None) == (csv_text is None):
+        raise ValueError("Provide either rows or csv")
+    if csv_text is not None:
+        reader = csv.DictReader(io.StringIO(csv_text.lstrip("\ufeff")))
+        if not reader.fieldnames:
+            raise ValueError("CSV has no header line")
+        columns = [name.strip() for name in reader.fieldnames]
+        rows = []
+        for line_number, record in enumerate(reader, start=2):
+            if None in record:
+                raise ValueError(f"CSV line {line_number} has more values than the header")
+            rows.append(dict(zip(columns, record.values())))
+    else:
+        columns = list(dict.fromkeys(str(name).strip() for row in rows for name in row))
+        rows = [{str(name).strip(): value for name, value in row.items()} for row in rows]
+    
+    if not rows:
+        raise ValueError("Dataset has no rows")
+    if len(rows) > DATASET_MAX_ROWS:
+        raise ValueError(f"Dataset has {len(rows)} rows; the limit is {DATASET_MAX_ROWS}")
+    if len(set(columns)) != len(columns):
+        raise ValueError("Dataset column names must be unique")
+    for column in columns:
+        if not column or PLACEHOLDER.fullmatch(f"{{{{{column}}}}}") is None:
+            raise ValueError(f"Invalid dataset column name: {column!r}")
+    return columns, [{column: _cell(row.get(column)) for column in columns} for row in rows]
+
+def placeholders(steps: List[Dict[str, Any]]) -> List[str]:
+    """Column names the steps refer to, in order of first use"""
+    names = []
+    for step in steps:
+        for field in BOUND_FIELDS:
+            value = step.get(field)
+            if isinstance(value, str):
+                names.extend(PLACEHOLDER.findall(value))
+    return list(dict.fromkeys(names))
+
+def missing_columns(steps: List[Dict[str, Any]], columns: List[str]) -> List[str]:
+    return [name for name in placeholders(steps) if name not in columns]
+
+def bind(text: str, row: Dict[str, str]) -> str:
+    """text with its placeholders replaced from row; unknown names are left as they are"""
+    return PLACEHOLDER.sub(lambda match: row.get(match.group(1), match.group(0)), text)
+
+def finish_parent(db: Session, parent_id: int) -> bool:
+    """Roll the rows up onto their parent run once none is in flight
+    
+    Returns whether this call finished the parent; False while rows are
+    still pending or running, or when another call got there first.
+    """
+    # Imported here so the executor can use the placeholder helpers without the database
+    from models import TestRun
+    children = db.query(
+        TestRun.id, TestRun.dataset_row, TestRun.status, TestRun.execution_time, TestRun.error_message
+    ).filter(TestRun.parent_run_id == parent_id).order_by(TestRun.dataset_row).all()
+    counts: Dict[str, int] = {}
+    for child in children:
+        counts[child.status] = counts.get(child.status, 0) + 1
+    if counts.get("pending") or counts.get("running"):
+        return False
+    
+    if counts.get("failed"):
+        status = "failed"
+    elif counts.get("error"):
+        status = "error"
+    elif counts.get("cancelled"):
+        status = "cancelled"
+    else:
+        status = "passed"
+    browser_seconds = sum(child.execution_time or 0 for child in children)
+    unsuccessful = [child for child in children if child.status != "passed"]
+    # Same shape as a reporter summary, one "test" per row
+    summary = {
+        "status": status,
+        "counts": counts,
+        "duration_ms": round(browser_seconds * 1000),
+        "tests": [
+            {
+                "title": f"row {child.dataset_row}",
+                "status": child.status,
+                "duration_ms": round((child.execution_time or 0) * 1000),
+                "run_id": child.id,
+                "dataset_row": child.dataset_row,
+                "errors": [{"message": child.error_message[:500]}] if child.error_message else []
+            }
+            for child in children
+        ],
+        "errors": []
+    }
+    lines = [f"{counts.get('passed', 0)} of {len(children)} dataset rows passed"]
+    lines.extend(f"row {child.dataset_row} (run {child.id}): {child.status}" for child in unsuccessful)
+    error_message = None
+    if unsuccessful:
+        first = unsuccessful[0]
+        error_message = f"{len(unsuccessful)} of {len(children)} rows did not pass; row {first.dataset_row}: {first.error_message or first.status}"
+    
+    # Conditional, so concurrent last rows (or a cancel) finish it once
+    finished = db.query(TestRun).filter(
+        TestRun.id == parent_id,
+        TestRun.status.in_(("pending", "running"))
+    ).update({
+        TestRun.status: status,
+        TestRun.result: "\n".join(lines),
+        TestRun.error_message: error_message,
+        TestRun.report_summary: summary,
+        TestRun.completed_at: datetime.utcnow()
+    }, synchronize_session=False)
+    db.commit()
+    return bool(finished)
+
+def finish_stalled_parents(db: Session) -> list:
+    """Finish in-flight parent runs whose rows all ended, e.g. after the reaper marked them orphaned"""
+    from models import TestRun
+    parents = db.query(TestRun).filter(
+        TestRun.dataset_id.isnot(None),
+        TestRun.parent_run_id.is_(None),
+        TestRun.status.in_(("pending", "running"))
+    ).all()
+    finished = [parent for parent in parents if finish_parent(db, parent.id)]
+    if finished:
+        logger.info(f"Finished {len(finished)} dataset runs whose rows had all ended: {[parent.id for parent in finished]}")
+    return finished
@@ -0,0 +1,149 @@
+"""
+Image comparison primitives for visual regression checks (see visual_diff.py)
+
+Only NumPy and Pillow are imported here: these functions run in process
+pool workers, which shouldn't load the application or its database layer.
+"""
+import os
+import hashlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+# Largest per-channel difference still treated as equal (anti-aliasing, font hinting)
+VISUAL_PIXEL_THRESHOLD = int(os.getenv("VISUAL_PIXEL_THRESHOLD", "24"))
+# Share of compared pixels that may differ before the screenshot counts as changed
+VISUAL_MAX_DIFF_RATIO = float(os.getenv("VISUAL_MAX_DIFF_RATIO", "0.001"))
+# Perceptual hashes whose tiles all differ by at most this many bits count as a match;
+# -1 always runs the pixel diff
+VISUAL_PHASH_MAX_DISTANCE = int(os.getenv("VISUAL_PHASH_MAX_DISTANCE", "0"))
+
+# The hash is computed per tile of an 8x8 grid: one hash over the whole
+# screenshot doesn't notice a changed field or button, a tile hash does
+HASH_GRID = 8
+HASH_TILE_SAMPLE = 16
+HASH_BITS = 8  # Low-frequency coefficients kept per axis: 64 bits per tile
+# DCT-II basis: _DCT @ tile @ _DCT.T
+_DCT = np.cos(np.pi / (2 * HASH_TILE_SAMPLE) * np.outer(np.arange(HASH_TILE_SAMPLE), 2 * np.arange(HASH_TILE_SAMPLE) + 1))
+
+# Diff images are palette PNGs: a faded grayscale baseline (levels 191-254)
+# with changed pixels and masked regions drawn in reserved palette entries
+DIFF_INDEX = 0
+MASK_INDEX = 1
+_DIFF_PALETTE = [value for level in range(256) for value in (level, level, level)]
+_DIFF_PALETTE[DIFF_INDEX * 3:DIFF_INDEX * 3 + 3] = (255, 0, 64)
+_DIFF_PALETTE[MASK_INDEX * 3:MASK_INDEX * 3 + 3] = (150, 170, 240)
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+def perceptual_hash(image: Image.Image) -> str:
+    """Tiled DCT hash of the downscaled grayscale image: 64 bits per tile, as hex"""
+    size = HASH_GRID * HASH_TILE_SAMPLE
+    sample = np.asarray(image.convert("L").resize((size, size), Image.Resampling.BOX), dtype=np.float64)
+    tiles = sample.reshape(HASH_GRID, HASH_TILE_SAMPLE, HASH_GRID, HASH_TILE_SAMPLE).swapaxes(1, 2)
+    low = (_DCT @ tiles @ _DCT.T)[:, :, :HASH_BITS, :HASH_BITS]
+    # Rounded so flat tiles (all-zero AC terms up to float noise) hash the same every time
+    low = low.reshape(HASH_GRID * HASH_GRID, HASH_BITS * HASH_BITS).round(3)
+    # The DC term only carries a tile's brightness, so it's left out of the median
+    bits = low > np.median(low[:, 1:], axis=1, keepdims=True)
+    return np.packbits(bits).tobytes().hex()
+
+def hash_distance(first: str, second: str) -> int:
+    """Largest per-tile Hamming distance between two hashes (-1 if they aren't comparable)"""
+    if len(first) != len(second):
+        return -1
+    differing = np.unpackbits(np.frombuffer(bytes.fromhex(first), np.uint8) ^ np.frombuffer(bytes.fromhex(second), np.uint8))
+    return int(differing.reshape(HASH_GRID * HASH_GRID, -1).sum(axis=1).max())
+
+def region_mask(shape, regions: Optional[List[Dict[str, Any]]]) -> np.ndarray:
+    """Boolean height x width mask, True inside any of the {x, y, width, height} regions"""
+    mask = np.zeros(shape[:2], dtype=bool)
+    for region in regions or []:
+        x, y = max(int(region.get("x", 0)), 0), max(int(region.get("y", 0)), 0)
+        mask[y:y + int(region.get("height", 0)), x:x + int(region.get("width", 0))] = True
+    return mask
+
+def load_rgb(path: str) -> Image.Image:
+    with Image.open(path) as image:
+        image.load()
+        return image if image.mode == "RGB" else image.convert("RGB")
+
+def describe_image(path: str) -> Dict[str, Any]:
+    """Digest, perceptual hash and size of a new baseline"""
+    with Image.open(path) as image:
+        return {
+            "digest": file_digest(path),
+            "phash": perceptual_hash(image),
+            "width": image.width,
+            "height": image.height
+        }
+
+def compare_screenshot(
+    actual_path: str,
+    baseline_path: str,
+    baseline_digest: str,
+    baseline_phash: str,
+    regions: Optional[List[Dict[str, Any]]],
+    diff_path: str
+) -> Dict[str, Any]:
+    """Compare a screenshot with its baseline; runs in a pool worker"""
+    if file_digest(actual_path) == baseline_digest:
+        return {"status": "match", "method": "digest", "diff_ratio": 0.0}
+    
+    actual_image = load_rgb(actual_path)
+    phash = perceptual_hash(actual_image)
+    distance = hash_distance(phash, baseline_phash)
+    if 0 <= distance <= VISUAL_PHASH_MAX_DISTANCE:
+        return {"status": "match", "method": "phash", "diff_ratio": 0.0, "phash_distance": distance}
+    
+    baseline = np.asarray(load_rgb(baseline_path))
+    actual = np.asarray(actual_image)
+    if actual.shape != baseline.shape:
+        return {
+            "status": "changed",
+            "method": "size",
+            "diff_ratio": 1.0,
+            "phash_distance": distance,
+            "detail": f"size changed from {baseline.shape[1]}x{baseline.shape[0]} to {actual.shape[1]}x{actual.shape[0]}"
+        }
+    
+    mask = region_mask(actual.shape, regions)
+    # |actual - baseline| without widening to int16, then per-channel planes (contiguous reductions are much faster)
+    delta = np.maximum(actual, baseline)
+    delta -= np.minimum(actual, baseline)
+    changed = delta[:, :, 0] > VISUAL_PIXEL_THRESHOLD
+    changed |= delta[:, :, 1] > VISUAL_PIXEL_THRESHOLD
+    changed |= delta[:, :, 2] > VISUAL_PIXEL_THRESHOLD
+    changed &= ~mask
+    compared = mask.size - int(np.count_nonzero(mask))
+    changed_pixels = int(np.count_nonzero(changed))
+    ratio = changed_pixels / compared if compared else 0.0
+    result = {
+        "status": "changed" if ratio > VISUAL_MAX_DIFF_RATIO else "match",
+        "method": "pixels",
+        "diff_ratio": round(ratio, 6),
+        "changed_pixels": changed_pixels,
+        "phash_distance": distance
+    }
+    
+    if result["status"] == "changed":
+        rows = np.flatnonzero(changed.any(axis=1))
+        columns = np.flatnonzero(changed.any(axis=0))
+        result["changed_region"] = {
+            "x": int(columns[0]), "y": int(rows[0]),
+            "width": int(columns[-1] - columns[0] + 1), "height": int(rows[-1] - rows[0] + 1)
+        }
+        # Green channel as luminance is close enough for a backdrop
+        diff = (baseline[:, :, 1] >> 2) + 191
+        diff[mask] = MASK_INDEX
+        diff[changed] = DIFF_INDEX
+        diff_image = Image.fromarray(diff)
+        diff_image.putpalette(_DIFF_PALETTE)  # L becomes P
+        Path(diff_path).parent.mkdir(parents=True, exist_ok=True)
+        diff_image.save(diff_path, compress_level=1)
+        result["diff_path"] = diff_path
+    return result
@@ -2,19 +2,31 @@
 Main FastAPI application for D365 Test Automation Platform
 """
 import os
+import asyncio
 import logging
-from fastapi import FastAPI, Depends, HTTPException, status
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse
 from contextlib import asynccontextmanager
 
-from database import engine, Base
+from database import engine, replica_engine, Base, SessionLocal, add_missing_columns, pool_status, replica_router, replica_heartbeat_loop
+from serialization import FastJSONResponse
+from static_assets import STATIC_DIR, PrecompressedStaticFiles, index_page, load_static_assets
 from routers.auth import router as auth_router
 from routers.tests import router as tests_router
 from routers.results import router as results_router
+from routers.environments import router as environments_router
+from routers.analytics import router as analytics_router
+from routers.schedules import router as schedules_router
+from routers.datasets import router as datasets_router
+from routers.suites import router as suites_router
 from auth import get_current_user
+from reaper import reap_on_startup, reaper_loop
+from visual_diff import visual_diff_engine
+from scheduler import run_scheduler
+from run_schedules import SCHEDULES_ENABLED, schedule_loop
+from metrics import METRICS_ENABLED, instrument_engine, metrics_middleware, render_latest
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,17 +38,35 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Creating database tables...")
     Base.metadata.create_all(bind=engine)
+    # create_all leaves existing tables alone; bring their columns up to date
+    add_missing_columns(engine)
     logger.info("Database tables created successfully")
+    load_static_assets()
+    db = SessionLocal()
+    try:
+        reap_on_startup(db)
+    finally:
+        db.close()
+    reaper_task = asyncio.create_task(reaper_loop(SessionLocal))
+    schedule_task = asyncio.create_task(schedule_loop(SessionLocal)) if SCHEDULES_ENABLED else None
+    heartbeat_task = asyncio.create_task(replica_heartbeat_loop()) if replica_router.enabled else None
     yield
     # Shutdown
     logger.info("Application shutting down...")
+    reaper_task.cancel()
+    if schedule_task:
+        schedule_task.cancel()
+    if heartbeat_task:
+        heartbeat_task.cancel()
+    visual_diff_engine.shutdown()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="D365 Test Automation Platform",
     description="Web-based platform for creating, running, and managing automated test cases for Dynamics 365",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
 
 # Configure CORS
@@ -48,26 +78,48 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request latency and SQL instrumentation (disable with METRICS_ENABLED=false)
+if METRICS_ENABLED:
+    instrument_engine(engine)
+    if replica_engine is not None:
+        instrument_engine(replica_engine)
+    app.middleware("http")(metrics_middleware)
+
 # Include routers
 app.include_router(auth_router, prefix="/api/auth", tags=["authentication"])
 app.include_router(tests_router, prefix="/api/tests", tags=["tests"])
 app.include_router(results_router, prefix="/api/results", tags=["results"])
+app.include_router(environments_router, prefix="/api/environments", tags=["environments"])
+app.include_router(analytics_router, prefix="/api/analytics", tags=["analytics"])
+app.include_router(schedules_router, prefix="/api/schedules", tags=["schedules"])
+app.include_router(datasets_router, prefix="/api/datasets", tags=["datasets"])
+app.include_router(suites_router, prefix="/api/suites", tags=["suites"])
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Mount static files (hashed assets under /static/dist are precompressed and immutable)
+app.mount("/static", PrecompressedStaticFiles(directory=STATIC_DIR), name="static")
 
 # Root endpoint
 @app.get("/", response_class=HTMLResponse)
-async def root():
-    """Serve the main application page"""
-    with open("static/index.html", "r") as f:
-        return HTMLResponse(content=f.read())
+async def root(request: Request):
+    """Serve the main application page from memory"""
+    return index_page.response(request)
 
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
     """Health check endpoint for monitoring"""
-    return {"status": "healthy", "message": "D365 Test Platform is running"}
+    health = {"status": "healthy", "message": "D365 Test Platform is running", "database_pool": pool_status(), "scheduler": run_scheduler.status()}
+    if replica_engine is not None:
+        health["read_replica"] = {**replica_router.status(), "pool": pool_status(replica_engine)}
+    return health
+
+# Metrics endpoint for Prometheus scraping
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """Expose platform metrics in the Prometheus text format"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Metrics are disabled")
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4")
 
 # Protected route example
 @app.get("/api/profile")
@@ -0,0 +1,275 @@
+"""
+Prometheus-style metrics registry and hot-path instrumentation
+"""
+import os
+import time
+import bisect
+import threading
+import contextvars
+from typing import Dict, Tuple, Optional, List
+
+from sqlalchemy import event
+
+from query_budget import check_request
+
+# Set METRICS_ENABLED=false to turn every metric operation into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+RUN_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# Per-request SQL accumulator and ASGI scope, set by the HTTP middleware
+_request_sql_stats: contextvars.ContextVar[Optional[Dict[str, object]]] = contextvars.ContextVar(
+    "request_sql_stats", default=None
+)
+
+def _format_labels(label_names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    metric_type = "untyped"
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+    
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+class Counter(_Metric):
+    metric_type = "counter"
+    
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    metric_type = "gauge"
+    
+    def set(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+    
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., +Inf count], sum
+                state = [[0] * (len(self.buckets) + 1), 0.0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = [(key, (list(state[0]), state[1])) for key, state in self._values.items()]
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+    
+    def _register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+    
+    def gauge(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+    
+    def histogram(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# Global registry and platform metrics
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    "d365_http_request_duration_seconds", "HTTP request latency", ("method", "route", "status")
+)
+HTTP_REQUESTS = registry.counter(
+    "d365_http_requests_total", "HTTP requests served", ("method", "route", "status")
+)
+DB_QUERY_DURATION = registry.histogram(
+    "d365_db_query_duration_seconds", "SQL statement execution time", buckets=QUERY_BUCKETS
+)
+DB_QUERIES_PER_REQUEST = registry.histogram(
+    "d365_db_queries_per_request", "SQL statements issued per HTTP request", ("route",), buckets=COUNT_BUCKETS
+)
+DB_TIME_PER_REQUEST = registry.histogram(
+    "d365_db_time_per_request_seconds", "Total SQL time per HTTP request", ("route",)
+)
+EXECUTOR_SPAWN_DURATION = registry.histogram(
+    "d365_executor_spawn_seconds", "Time to spawn the npx playwright process"
+)
+EXECUTOR_RUN_DURATION = registry.histogram(
+    "d365_executor_run_seconds", "Wall time of a test execution", ("status",), buckets=RUN_BUCKETS
+)
+RUNS_ACTIVE = registry.gauge("d365_runs_active", "Test runs currently executing")
+RUNS_QUEUED = registry.gauge("d365_runs_queued", "Test runs waiting to execute")
+SCHEDULER_WAIT = registry.histogram(
+    "d365_scheduler_wait_seconds", "Time runs spent pending before getting an execution slot", ("tenant", "lane"),
+    buckets=QUERY_BUCKETS + (2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+SCHEDULER_QUEUE_DEPTH = registry.gauge("d365_scheduler_queued_runs", "Runs waiting for an execution slot", ("lane",))
+RUNS_TERMINATED = registry.counter(
+    "d365_runs_terminated_total", "Runs stopped before finishing (timeout, cancelled, orphaned)", ("reason",)
+)
+ARTIFACT_BYTES = registry.counter(
+    "d365_artifact_bytes_written_total", "Bytes of run artifacts written", ("kind",)
+)
+AUTH_CACHE_REQUESTS = registry.counter(
+    "d365_auth_cache_requests_total", "Authenticated user lookups by cache outcome", ("result",)
+)
+RESULT_REUSE_REQUESTS = registry.counter(
+    "d365_result_reuse_requests_total", "Run requests opted into result reuse by outcome (hit, miss)", ("result",)
+)
+SHARED_PREFIX_SECONDS_SAVED = registry.counter(
+    "d365_shared_prefix_step_seconds_saved_total", "Step seconds batch runs saved by starting from a shared setup prefix's state"
+)
+RESPONSE_CACHE_REQUESTS = registry.counter(
+    "d365_response_cache_requests_total", "Conditional GETs by outcome (hit, miss, not_modified)", ("result",)
+)
+POOL_CHECKOUT_WAIT = registry.histogram(
+    "d365_db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", buckets=QUERY_BUCKETS + (2.5, 5.0, 10.0, 30.0)
+)
+POOL_CHECKED_OUT = registry.gauge("d365_db_pool_checked_out", "Pooled connections currently checked out")
+QUERY_BUDGET_VIOLATIONS = registry.counter(
+    "d365_db_query_budget_violations_total", "Requests over their SQL statement budget or repeating a statement (N+1)", ("route", "kind")
+)
+
+def instrument_engine(engine):
+    """Time every SQL statement and attribute it to the current request"""
+    if not METRICS_ENABLED:
+        return
+    
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+    
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        DB_QUERY_DURATION.observe(elapsed)
+        stats = _request_sql_stats.get()
+        if stats is not None:
+            stats["count"] += 1
+            stats["duration"] += elapsed
+            stats["statements"].append(statement)
+
+def route_template(scope) -> str:
+    """Matched route template (e.g. /api/results/runs/{run_id}) for an ASGI scope
+    
+    Templates rather than raw paths keep metric label cardinality bounded.
+    """
+    # Newer FastAPI keeps the router-relative route in scope["route"] and the
+    # prefixed path on the effective route context
+    effective = (scope.get("fastapi") or {}).get("effective_route_context")
+    if effective is not None and getattr(effective, "path", None):
+        return effective.path
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+def detach_request():
+    """Stop attributing SQL to the request whose context the current task was spawned from"""
+    _request_sql_stats.set(None)
+
+def current_route() -> Optional[str]:
+    """Route template of the request being served on this context, if any"""
+    stats = _request_sql_stats.get()
+    if stats is None:
+        return None
+    return route_template(stats["scope"])
+
+async def metrics_middleware(request, call_next):
+    """Record latency, status and SQL usage for each HTTP request, and check its query budget"""
+    stats = {"count": 0, "duration": 0.0, "statements": [], "scope": request.scope}
+    token = _request_sql_stats.set(stats)
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        _request_sql_stats.reset(token)
+        route_path = route_template(request.scope)
+        HTTP_REQUEST_DURATION.observe(elapsed, method=request.method, route=route_path, status=status_code)
+        HTTP_REQUESTS.inc(method=request.method, route=route_path, status=status_code)
+        DB_QUERIES_PER_REQUEST.observe(stats["count"], route=route_path)
+        DB_TIME_PER_REQUEST.observe(stats["duration"], route=route_path)
+        for violation in check_request(route_path, stats["statements"]):
+            QUERY_BUDGET_VIOLATIONS.inc(route=route_path, kind=violation["kind"])
+
+def render_latest() -> str:
+    """Current metrics in the Prometheus text exposition format"""
+    return registry.render()
@@ -1,9 +1,9 @@
 """
 SQLAlchemy models for D365 Test Platform
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON, Float
+from sqlalchemy import Column, Integer, String, Text, DateTime, Date, Boolean, ForeignKey, JSON, Float, LargeBinary, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, literal_column
 from database import Base
 
 class User(Base):
@@ -14,6 +14,9 @@ class User(Base):
     email = Column(String(100), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
+    team = Column(String(100), index=True)  # Scheduling tenant; users without one are their own tenant
+    max_concurrent_runs = Column(Integer)  # Quota overrides; null uses the scheduler defaults
+    browser_minutes_per_day = Column(Float)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -21,6 +24,23 @@ class User(Base):
     test_cases = relationship("TestCase", back_populates="owner")
     test_runs = relationship("TestRun", back_populates="user")
 
+class Dataset(Base):
+    """Rows of test data, stored once and bound to a test case's {{placeholders}} (see dataset_runs.py)"""
+    __tablename__ = "datasets"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(200), nullable=False)
+    description = Column(Text)
+    columns = Column(JSON, nullable=False)  # Column names, in the order they were uploaded
+    rows = Column(JSON, nullable=False)  # List of {column: string value}; immutable once stored
+    row_count = Column(Integer, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    # Relationships
+    owner = relationship("User")
+
 class TestCase(Base):
     __tablename__ = "test_cases"
     
@@ -30,8 +50,13 @@ class TestCase(Base):
     steps = Column(JSON, nullable=False)  # JSON array of test steps
     expected_result = Column(String(20), default="pass")  # pass/fail
     tags = Column(String(500))  # Comma-separated tags
+    timeout_seconds = Column(Integer)  # Wall-clock limit per run; capped by EXECUTOR_TIMEOUT_SECONDS
+    capture_policy = Column(JSON)  # Trace/screenshot/video capture; overrides suite and environment
+    dataset_id = Column(Integer, ForeignKey("datasets.id"))  # Rows its {{placeholders}} are bound to; runs fan out per row
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Current content version (see versioning.py)
     is_active = Column(Boolean, default=True)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    row_version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("row_version + 1"))  # Bumped on every update, feeds ETags
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -39,18 +64,57 @@ class TestCase(Base):
     owner = relationship("User", back_populates="test_cases")
     test_runs = relationship("TestRun", back_populates="test_case")
 
+class TestCaseVersion(Base):
+    """One saved version of a test case: a full snapshot or a JSON Patch from the previous version"""
+    __tablename__ = "test_case_versions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    test_case_id = Column(Integer, ForeignKey("test_cases.id"), nullable=False)
+    version = Column(Integer, nullable=False)
+    is_snapshot = Column(Boolean, nullable=False)
+    payload = Column(LargeBinary, nullable=False)  # zlib-compressed JSON content (snapshot) or patch (delta)
+    payload_bytes = Column(Integer)
+    created_by = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_test_case_versions_case_version", "test_case_id", "version", unique=True),
+    )
+
 class TestRun(Base):
     __tablename__ = "test_runs"
     
     id = Column(Integer, primary_key=True, index=True)
     test_case_id = Column(Integer, ForeignKey("test_cases.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    status = Column(String(20), default="pending")  # pending/running/passed/failed/error
+    status = Column(String(20), default="pending")  # pending/running/passed/failed/error/cancelled
     result = Column(Text)  # Detailed result output
     execution_time = Column(Float)  # Execution time in seconds
     screenshot_path = Column(String(500))  # Path to screenshot if available
     trace_path = Column(String(500))  # Path to Playwright trace
     error_message = Column(Text)  # Error details if failed
+    stderr = Column(Text)  # Playwright stderr, head and tail when capped (see reporter_stream.CappedLog)
+    environment_id = Column(Integer, ForeignKey("environments.id"))
+    blocked_requests = Column(Integer)  # Requests aborted by the routing profile
+    bytes_saved = Column(Integer)  # Estimated bytes not downloaded due to blocking
+    har_mode = Column(String(20))  # record/replay, or null for a plain live run
+    har_path = Column(String(500))  # HAR captured (record) or served (replay)
+    log_path = Column(String(500))  # Full stdout spilled to the artifact store when `result` was truncated
+    report_summary = Column(JSON)  # Per-test status, errors, failed steps and attachments from the reporter
+    capture_policy = Column(String(50))  # Name of the capture policy the run used
+    artifact_bytes = Column(Integer)  # Disk used by the run's traces, screenshots, videos and logs
+    visual_diffs = Column(JSON)  # Per screenshot step comparison with its baseline (see visual_diff.py)
+    test_case_version = Column(Integer)  # Test case version that was executed
+    steps_hash = Column(String(64))  # What was executed, for result reuse (see result_reuse.py)
+    environment_build = Column(String(100))  # Environment build marker when the run was queued
+    reuse_status = Column(String(10))  # hit/miss when the request opted into result reuse
+    reused_from_run_id = Column(Integer)  # Run whose result a reuse hit copied
+    dataset_id = Column(Integer, ForeignKey("datasets.id"))  # Set on the parent run of a dataset fan-out
+    parent_run_id = Column(Integer, ForeignKey("test_runs.id"), index=True)  # Set on its per-row child runs
+    dataset_row = Column(Integer)  # 0-based dataset row a child run was bound to
+    batch_id = Column(String(32), index=True)  # Batch-run request that queued the run
+    shared_prefix = Column(JSON)  # Shared setup prefix group, role and timings (see prefix_planner.py)
+    row_version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("row_version + 1"))  # Bumped on every update, feeds ETags
     started_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -58,6 +122,93 @@ class TestRun(Base):
     # Relationships
     test_case = relationship("TestCase", back_populates="test_runs")
     user = relationship("User", back_populates="test_runs")
+    environment = relationship("Environment")
+
+class ArchivedTestRun(Base):
+    """Cold copy of a test run moved out of test_runs by archive.py"""
+    __tablename__ = "test_runs_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)  # Original test_runs.id
+    test_case_id = Column(Integer, nullable=False)
+    user_id = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False)
+    execution_time = Column(Float)
+    environment_id = Column(Integer)
+    started_at = Column(DateTime(timezone=True))
+    completed_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    payload = Column(LargeBinary)  # zlib-compressed JSON of the remaining run columns
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_test_runs_archive_user_created", "user_id", "created_at"),
+        Index("ix_test_runs_archive_test_case_created", "test_case_id", "created_at"),
+    )
+
+class TestRunRollup(Base):
+    """Per-user daily run counts for archived runs, so aggregates survive archival"""
+    __tablename__ = "test_run_rollups"
+    
+    user_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    status = Column(String(20), primary_key=True)
+    run_count = Column(Integer, nullable=False, default=0)
+    execution_time_sum = Column(Float, nullable=False, default=0)
+    execution_time_count = Column(Integer, nullable=False, default=0)
+
+class VisualBaseline(Base):
+    """Approved screenshot that a screenshot step is compared with, per environment"""
+    __tablename__ = "visual_baselines"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    test_case_id = Column(Integer, ForeignKey("test_cases.id"), nullable=False)
+    step_index = Column(Integer, nullable=False)  # 1-based, as in the generated script
+    environment_id = Column(Integer, ForeignKey("environments.id"))  # Null for runs without an environment
+    path = Column(String(500), nullable=False)
+    digest = Column(String(64), nullable=False)  # sha256 of the PNG file
+    phash = Column(String(1024), nullable=False)  # Tiled perceptual hash, hex (see image_diff.py)
+    width = Column(Integer)
+    height = Column(Integer)
+    source_run_id = Column(Integer)  # Run the screenshot was taken from
+    approved_by = Column(Integer, ForeignKey("users.id"))  # Null when it was the step's first screenshot
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        # NULLs never collide in a unique index, so runs without an environment get their own
+        Index(
+            "ix_visual_baselines_case_env_step", "test_case_id", "environment_id", "step_index", unique=True,
+            sqlite_where=environment_id.isnot(None), postgresql_where=environment_id.isnot(None), mssql_where=environment_id.isnot(None)
+        ),
+        Index(
+            "ix_visual_baselines_case_step_default", "test_case_id", "step_index", unique=True,
+            sqlite_where=environment_id.is_(None), postgresql_where=environment_id.is_(None), mssql_where=environment_id.is_(None)
+        ),
+    )
+
+class SelectorStat(Base):
+    """Resolution latency and outcomes of one selector across an owner's runs (see selector_index.py)"""
+    __tablename__ = "selector_index"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    selector_hash = Column(String(40), nullable=False)  # sha1 of the selector, for the unique key
+    selector = Column(Text, nullable=False)
+    resolutions = Column(Integer, nullable=False, default=0)
+    timeouts = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    slow_resolutions = Column(Integer, nullable=False, default=0)  # Over SLOW_SELECTOR_MS
+    total_ms = Column(Float, nullable=False, default=0)
+    max_ms = Column(Float)
+    last_ms = Column(Float)
+    last_test_case_id = Column(Integer)
+    last_run_id = Column(Integer)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_selector_index_owner_selector", "owner_id", "selector_hash", unique=True),
+    )
 
 class TestSuite(Base):
     __tablename__ = "test_suites"
@@ -66,6 +217,7 @@ class TestSuite(Base):
     name = Column(String(200), nullable=False)
     description = Column(Text)
     test_case_ids = Column(JSON, nullable=False)  # Array of test case IDs
+    capture_policy = Column(JSON)  # Trace/screenshot/video capture for runs of this suite
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -74,6 +226,34 @@ class TestSuite(Base):
     # Relationships
     owner = relationship("User")
 
+class RunSchedule(Base):
+    """Cron schedule that queues batch runs of a test case, suite or tag query (see run_schedules.py)"""
+    __tablename__ = "run_schedules"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(200), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    cron = Column(String(100), nullable=False)  # Five-field cron expression or @daily-style alias
+    timezone = Column(String(64), nullable=False, default="UTC")
+    # Exactly one target
+    test_case_id = Column(Integer, ForeignKey("test_cases.id"))
+    suite_id = Column(Integer, ForeignKey("test_suites.id"))
+    tag_query = Column(String(500))  # Comma-separated tags that must all be present; !tag excludes
+    environment_id = Column(Integer, ForeignKey("environments.id"))
+    jitter_seconds = Column(Integer, nullable=False, default=300)  # Start up to this long after each tick
+    is_active = Column(Boolean, default=True)
+    next_tick_at = Column(DateTime)  # Next cron tick (UTC)
+    next_run_at = Column(DateTime)  # next_tick_at plus the schedule's jitter
+    last_tick_at = Column(DateTime)
+    last_run_at = Column(DateTime)
+    last_result = Column(JSON)  # Runs queued and skipped by the last fire
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        Index("ix_run_schedules_due", "is_active", "next_run_at"),
+    )
+
 class Environment(Base):
     __tablename__ = "environments"
     
@@ -81,9 +261,19 @@ class Environment(Base):
     name = Column(String(100), nullable=False)
     url = Column(String(500), nullable=False)
     description = Column(Text)
+    routing_profile = Column(JSON)  # Request blocking/stubbing rules for generated scripts
+    capture_policy = Column(JSON)  # Default trace/screenshot/video capture for runs against this environment
+    build_version = Column(String(100))  # Deployed build/version marker, set by CI; gates result reuse
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Relationships
     owner = relationship("User")
+
+class ReplicationHeartbeat(Base):
+    """Single row the primary keeps touching; its replicated value shows replica lag (see database.ReplicaRouter)"""
+    __tablename__ = "replication_heartbeat"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    beat_at = Column(DateTime, nullable=False)
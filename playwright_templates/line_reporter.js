@@ -0,0 +1,82 @@
+/**
+ * Line-delimited Playwright reporter for D365 Test Platform
+ * Writes one `D365_REPORT {json}` line per finished test and one at the end of
+ * the run, and passes test console output through line by line, so the
+ * executor can parse results incrementally instead of buffering one large
+ * JSON document.
+ */
+
+const MARKER = 'D365_REPORT ';
+const MAX_ERROR_CHARS = 4000;
+
+function truncate(text, limit) {
+    if (!text || text.length <= limit) {
+        return text || '';
+    }
+    return text.slice(0, limit) + `... [${text.length - limit} chars truncated]`;
+}
+
+function serializeError(error) {
+    return {
+        message: truncate(error.message || String(error.value || ''), MAX_ERROR_CHARS),
+        location: error.location ? `${error.location.file}:${error.location.line}` : undefined,
+    };
+}
+
+function failedSteps(steps, path = []) {
+    const failed = [];
+    for (const step of steps || []) {
+        const title = [...path, step.title];
+        if (step.error) {
+            failed.push({ title: title.join(' > '), category: step.category, duration: step.duration, error: serializeError(step.error) });
+        }
+        failed.push(...failedSteps(step.steps, title));
+    }
+    return failed;
+}
+
+class LineReporter {
+    emit(type, data) {
+        process.stdout.write(MARKER + JSON.stringify({ type, data }) + '\n');
+    }
+
+    onBegin(config, suite) {
+        this.emit('begin', { tests: suite.allTests().length, workers: config.workers });
+    }
+
+    onStdOut(chunk) {
+        process.stdout.write(chunk);
+    }
+
+    onStdErr(chunk) {
+        process.stderr.write(chunk);
+    }
+
+    onTestEnd(test, result) {
+        this.emit('test_end', {
+            title: test.titlePath().filter(Boolean).join(' > '),
+            file: test.location ? `${test.location.file}:${test.location.line}` : undefined,
+            status: result.status,
+            expected: test.expectedStatus,
+            retry: result.retry,
+            duration: result.duration,
+            errors: (result.errors || []).map(serializeError),
+            failed_steps: failedSteps(result.steps),
+            attachments: (result.attachments || []).map((a) => ({ name: a.name, path: a.path, content_type: a.contentType })),
+        });
+    }
+
+    onError(error) {
+        this.emit('error', serializeError(error));
+    }
+
+    onEnd(result) {
+        this.emit('end', { status: result.status, duration: result.duration });
+    }
+
+    printsToStdio() {
+        return true;
+    }
+}
+
+module.exports = LineReporter;
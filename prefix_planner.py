@@ -0,0 +1,161 @@
+"""
+Shared setup prefixes: run a batch's common opening steps once
+
+Most test cases open with the same steps (navigate, sign in, open the
+app, open an entity form). plan_shared_prefixes builds a prefix tree over
+the steps of a batch's runs and groups each run with the others sharing
+its longest setup prefix. The group's first run, the leader, executes all
+of its steps and saves the browser's storage state (cookies, local
+storage) and URL once it is past the prefix. The other members start from
+that state as soon as it is saved, while the leader runs on, opening the
+saved URL instead of repeating the prefix. If the leader ends without
+getting through the prefix, they run in full.
+
+Only navigate, click, fill, wait, waitForSelector and verify steps form a
+prefix (a skipped screenshot would lose its visual comparison), it must
+start with a navigate, and every member keeps at least one step of its
+own. Storage state and a goto only bring back what a URL and cookies
+hold, so a prefix ends at a navigate or at a waitForSelector (say, the
+app's home after signing in), which members wait for again after the
+goto; clicks and fills after that point, such as an opened form or typed
+text, stay with each run. Runs with nobody to share their prefix with run
+as usual.
+
+Savings are recorded on the runs (TestRun.shared_prefix) and summed per
+batch by batch_report: each restored member saved the leader's prefix
+step time less the time its restore took.
+"""
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import TestRun
+
+SHARED_PREFIXES_ENABLED = os.getenv("SHARED_PREFIXES_ENABLED", "true").lower() in ("1", "true", "yes")
+# Shortest prefix worth sharing
+SHARED_PREFIX_MIN_STEPS = max(1, int(os.getenv("SHARED_PREFIX_MIN_STEPS", "2")))
+
+SETUP_STEP_TYPES = ("navigate", "click", "fill", "wait", "waitForSelector", "verify")
+# Steps a prefix may end at: the page they leave is one a goto to its URL brings back
+PREFIX_END_STEP_TYPES = ("navigate", "waitForSelector")
+# What a step does; description and timeout don't change the state it leaves
+STEP_IDENTITY_FIELDS = ("type", "selector", "value", "expected")
+
+# Pending members waiting for their leader; neither queued nor executing, but not orphaned
+waiting_run_ids: set = set()
+
+def step_key(step: Dict[str, Any]) -> str:
+    return json.dumps([step.get(field) for field in STEP_IDENTITY_FIELDS])
+
+def effective_steps(steps: List[Dict[str, Any]], environment_url: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Steps as the executor will run them: the environment URL replaces the first navigate's value"""
+    steps = [dict(step) for step in steps]
+    if environment_url:
+        for step in steps:
+            if step.get("type") == "navigate":
+                step["value"] = environment_url
+                break
+    return steps
+
+def plan_shared_prefixes(runs: List[Tuple[int, List[Dict[str, Any]]]], environment_url: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """Groups of runs sharing a setup prefix, by group key
+    
+    runs are (run_id, steps) in batch order. Each group is {"key", "steps"
+    (prefix length), "run_ids"}; its first run id is the leader.
+    """
+    root = {"children": {}}
+    paths = {}
+    for run_id, steps in runs:
+        steps = effective_steps(steps, environment_url)
+        if not steps or steps[0].get("type") != "navigate":
+            continue
+        node, path, keys = root, [], []
+        # The last step is never part of a prefix, so every member runs something
+        for step in steps[:-1]:
+            if step.get("type") not in SETUP_STEP_TYPES:
+                break
+            keys.append(step_key(step))
+            node = node["children"].setdefault(keys[-1], {
+                "children": {},
+                "run_ids": [],
+                "prefix": "\n".join(keys),
+                "ends": step.get("type") in PREFIX_END_STEP_TYPES
+            })
+            node["run_ids"].append(run_id)
+            path.append(node)
+        paths[run_id] = path
+    
+    # Each run joins the deepest prefix it shares with another run that ends where a goto can resume
+    chosen: Dict[int, List[int]] = {}
+    nodes = {}
+    for run_id, path in paths.items():
+        depth = next((
+            depth for depth in range(len(path), SHARED_PREFIX_MIN_STEPS - 1, -1)
+            if path[depth - 1]["ends"] and len(path[depth - 1]["run_ids"]) > 1
+        ), None)
+        if depth:
+            node = path[depth - 1]
+            chosen.setdefault(id(node), []).append(run_id)
+            nodes[id(node)] = (node, depth)
+    
+    groups = {}
+    for node_id, run_ids in chosen.items():
+        # Runs sharing a deeper prefix among themselves may leave one alone here
+        if len(run_ids) < 2:
+            continue
+        node, depth = nodes[node_id]
+        key = hashlib.sha1(node["prefix"].encode()).hexdigest()[:12]
+        groups[key] = {"key": key, "steps": depth, "run_ids": run_ids}
+    return groups
+
+def seconds_saved(shared_prefix: Optional[Dict[str, Any]]) -> float:
+    """Step seconds a restored member didn't spend repeating the prefix"""
+    if not shared_prefix or shared_prefix.get("role") != "member" or not shared_prefix.get("restored"):
+        return 0.0
+    return max(0.0, (shared_prefix.get("prefix_seconds") or 0) - (shared_prefix.get("restore_seconds") or 0))
+
+def batch_report(db: Session, user_id: int, batch_id: str) -> Optional[Dict[str, Any]]:
+    """Shared prefix groups of one batch and the step seconds they saved; None for an unknown batch"""
+    runs = db.query(TestRun.id, TestRun.status, TestRun.execution_time, TestRun.shared_prefix).filter(
+        TestRun.batch_id == batch_id,
+        TestRun.user_id == user_id
+    ).order_by(TestRun.id).all()
+    if not runs:
+        return None
+    
+    groups: Dict[str, Dict[str, Any]] = {}
+    for run in runs:
+        shared_prefix = run.shared_prefix
+        if not shared_prefix:
+            continue
+        group = groups.setdefault(shared_prefix["group"], {
+            "group": shared_prefix["group"],
+            "steps": shared_prefix["steps"],
+            "leader_run_id": None,
+            "prefix_seconds": None,
+            "members": 0,
+            "restored": 0,
+            "step_seconds_saved": 0.0
+        })
+        if shared_prefix["role"] == "leader":
+            group["leader_run_id"] = run.id
+            group["prefix_seconds"] = shared_prefix.get("prefix_seconds")
+        else:
+            group["members"] += 1
+            group["restored"] += bool(shared_prefix.get("restored"))
+            group["step_seconds_saved"] += seconds_saved(shared_prefix)
+    
+    for group in groups.values():
+        group["step_seconds_saved"] = round(group["step_seconds_saved"], 3)
+    return {
+        "batch_id": batch_id,
+        "runs": len(runs),
+        "finished": sum(run.status not in ("pending", "running") for run in runs),
+        "browser_seconds": round(sum(run.execution_time or 0 for run in runs), 3),
+        "shared_prefix_runs": sum(1 + group["members"] for group in groups.values()),
+        "step_seconds_saved": round(sum(group["step_seconds_saved"] for group in groups.values()), 3),
+        "groups": list(groups.values())
+    }
@@ -0,0 +1,150 @@
+"""
+Per-request SQL query budgets and N+1 detection
+
+The metrics middleware already collects every statement a request issues
+(see metrics.instrument_engine). When the request finishes, check_request
+compares them against the route's budget and looks for N+1 patterns: the
+same SELECT shape (SQL with literals and placeholders normalised) run
+N_PLUS_ONE_THRESHOLD or more times, typically a lazy load or a query
+inside a loop. Repeated INSERTs are left to the budget: whether the unit
+of work batches them depends on the driver's RETURNING support. Violations are logged and counted in
+d365_db_query_budget_violations_total; nothing is blocked.
+
+Budgets are per route template. ROUTE_QUERY_BUDGETS covers the hot
+routes; QUERY_BUDGETS overrides or extends it, e.g.
+    QUERY_BUDGETS="/api/results/dashboard=6,/api/tests/=8"
+and every other route gets QUERY_BUDGET_DEFAULT.
+
+assert_max_queries is the same check for tests and benchmarks:
+    with assert_max_queries(5):
+        client.get("/api/results/dashboard", headers=headers)
+"""
+import os
+import re
+import logging
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGETS_ENABLED = os.getenv("QUERY_BUDGETS_ENABLED", "true").lower() in ("1", "true", "yes")
+QUERY_BUDGET_DEFAULT = int(os.getenv("QUERY_BUDGET_DEFAULT", "20"))
+# Repeats of one statement shape within a request that count as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Statements per request on the hot routes, with a little headroom; each
+# includes the user lookup of an auth cache miss (see auth.get_current_user)
+ROUTE_QUERY_BUDGETS = {
+    "/api/results/dashboard": 6,
+    "/api/results/runs": 5,
+    "/api/results/runs/{run_id}": 4,
+    "/api/tests/": 6,  # Listing and creating
+    "/api/tests/{test_case_id}": 3,
+    "/api/tests/{test_case_id}/run": 20,  # Includes executing the run and saving its results
+    # One INSERT per run where the driver can't batch them, for batches of up to 50
+    "/api/tests/batch-run": 60,
+}
+
+def _parse_budgets(value: str) -> Dict[str, int]:
+    budgets = {}
+    for item in value.split(","):
+        route, _, limit = item.strip().rpartition("=")
+        if route and limit.strip().isdigit():
+            budgets[route.strip()] = int(limit)
+        elif item.strip():
+            logger.warning(f"Ignoring malformed QUERY_BUDGETS entry: {item.strip()}")
+    return budgets
+
+ROUTE_QUERY_BUDGETS.update(_parse_budgets(os.getenv("QUERY_BUDGETS", "")))
+
+_STRING_LITERALS = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERALS = re.compile(r"\b\d+(?:\.\d+)?\b")
+# qmark (SQLite, pyodbc), pyformat and named paramstyles
+_PLACEHOLDERS = re.compile(r"\?|%\(\w+\)s|%s|(?<!:):\w+")
+# Expanded IN lists vary in length with their parameters
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+@lru_cache(maxsize=2048)
+def statement_shape(statement: str) -> str:
+    """Statement with literals and placeholders normalised, so repeats of one query compare equal"""
+    shape = _STRING_LITERALS.sub("?", statement)
+    shape = _PLACEHOLDERS.sub("?", shape)
+    shape = _NUMBER_LITERALS.sub("?", shape)
+    shape = _PLACEHOLDER_LISTS.sub("(?, ...)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+def route_budget(route: str) -> int:
+    return ROUTE_QUERY_BUDGETS.get(route, QUERY_BUDGET_DEFAULT)
+
+def repeated_shapes(statements: List[str], threshold: int = N_PLUS_ONE_THRESHOLD) -> Dict[str, int]:
+    """SELECT shapes issued at least threshold times, most repeated first"""
+    counts: Dict[str, int] = {}
+    for statement in statements:
+        shape = statement_shape(statement)
+        if shape[:6].upper() != "SELECT":
+            continue
+        counts[shape] = counts.get(shape, 0) + 1
+    repeated = {shape: count for shape, count in counts.items() if count >= threshold}
+    return dict(sorted(repeated.items(), key=lambda item: -item[1]))
+
+def check_request(route: str, statements: List[str]) -> List[Dict[str, Any]]:
+    """Budget and N+1 violations of one finished request; each is logged"""
+    if not QUERY_BUDGETS_ENABLED:
+        return []
+    violations = []
+    budget = route_budget(route)
+    if len(statements) > budget:
+        violations.append({"kind": "budget", "route": route, "queries": len(statements), "budget": budget})
+        logger.warning(f"{route} issued {len(statements)} SQL statements, over its budget of {budget}")
+    for shape, count in repeated_shapes(statements).items():
+        violations.append({"kind": "n_plus_one", "route": route, "shape": shape, "count": count})
+        logger.warning(f"{route} ran the same statement {count} times (possible N+1): {shape[:300]}")
+    return violations
+
+class QueryLog:
+    """Statements captured by assert_max_queries"""
+    
+    def __init__(self):
+        self.statements: List[str] = []
+    
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+    
+    def summary(self) -> str:
+        lines = [f"{index}. {_WHITESPACE.sub(' ', statement).strip()[:200]}" for index, statement in enumerate(self.statements, start=1)]
+        return "\n".join(lines)
+
+@contextmanager
+def assert_max_queries(max_queries: int, engine=None, max_repeats: Optional[int] = None):
+    """Fail with the captured statements if the block issues more than max_queries
+    
+    Counts every statement on the engine, whichever thread issues it (a
+    TestClient serves requests on its own thread). max_repeats additionally
+    caps how often one SELECT shape may repeat.
+    """
+    if engine is None:
+        from database import engine
+    log = QueryLog()
+    
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        log.statements.append(statement)
+    
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield log
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+    
+    problems = []
+    if log.count > max_queries:
+        problems.append(f"{log.count} SQL statements issued, expected at most {max_queries}")
+    if max_repeats is not None:
+        for shape, count in repeated_shapes(log.statements, max_repeats + 1).items():
+            problems.append(f"SELECT repeated {count} times, expected at most {max_repeats}: {shape[:200]}")
+    if problems:
+        raise AssertionError("\n".join(problems) + "\n" + log.summary())
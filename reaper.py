@@ -0,0 +1,93 @@
+"""
+Cleanup of runs and browser processes orphaned by a crashed or restarted server
+
+At startup, Playwright process groups recorded by server processes that no
+longer exist are killed, and runs still marked pending/running are set to
+error. While the app is up, a periodic sweep does the same for runs older
+than the executor's hard timeout, which no live executor can still own.
+Dataset runs never execute themselves: they're finished from their rows
+once the sweep has ended those.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from models import TestRun
+from metrics import RUNS_TERMINATED
+from response_cache import response_cache
+from test_executor import test_executor, EXECUTOR_TIMEOUT_SECONDS, EXECUTOR_KILL_GRACE_SECONDS
+from scheduler import run_scheduler
+from dataset_runs import finish_stalled_parents
+from prefix_planner import waiting_run_ids
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT_STATUSES = ("pending", "running")
+
+REAPER_INTERVAL_SECONDS = float(os.getenv("REAPER_INTERVAL_SECONDS", "300"))
+# With several worker processes sharing the database, set this to false so a
+# restarting worker doesn't reap runs another worker is still executing; the
+# age-based sweep still catches them.
+REAP_ALL_ON_STARTUP = os.getenv("REAP_ALL_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+ORPHANED_MESSAGE = "Run orphaned: the server executing it stopped before it finished"
+
+def reap_orphaned_runs(db: Session, created_before: Optional[datetime] = None) -> int:
+    """Mark in-flight runs not executing or queued in this process as error, then finish dataset runs left without rows in flight"""
+    query = db.query(TestRun).filter(
+        TestRun.status.in_(IN_FLIGHT_STATUSES),
+        # Dataset runs (the parents) end with their rows
+        TestRun.dataset_id.is_(None)
+    )
+    active = test_executor.active_run_ids | run_scheduler.queued_run_ids | waiting_run_ids
+    if active:
+        query = query.filter(TestRun.id.notin_(active))
+    if created_before is not None:
+        query = query.filter(TestRun.created_at < created_before)
+    
+    runs = query.all()
+    if not runs:
+        _finish_parents(db)
+        return 0
+    now = datetime.utcnow()
+    for run in runs:
+        run.status = "error"
+        run.error_message = ORPHANED_MESSAGE
+        run.completed_at = now
+    db.commit()
+    
+    for user_id in {run.user_id for run in runs}:
+        response_cache.invalidate(user_id)
+    RUNS_TERMINATED.inc(len(runs), reason="orphaned")
+    logger.warning(f"Marked {len(runs)} orphaned runs as error: {[run.id for run in runs]}")
+    _finish_parents(db)
+    return len(runs)
+
+def _finish_parents(db: Session):
+    for parent in finish_stalled_parents(db):
+        response_cache.invalidate(parent.user_id)
+
+def stale_cutoff() -> datetime:
+    """Runs created before this have outlived any executor timeout"""
+    return datetime.utcnow() - timedelta(seconds=EXECUTOR_TIMEOUT_SECONDS + EXECUTOR_KILL_GRACE_SECONDS + 60)
+
+def reap_on_startup(db: Session) -> int:
+    test_executor.kill_orphaned_process_groups()
+    return reap_orphaned_runs(db, None if REAP_ALL_ON_STARTUP else stale_cutoff())
+
+async def reaper_loop(session_factory):
+    """Periodically reap runs older than the hard timeout"""
+    while True:
+        await asyncio.sleep(REAPER_INTERVAL_SECONDS)
+        db = session_factory()
+        try:
+            test_executor.kill_orphaned_process_groups()
+            reap_orphaned_runs(db, stale_cutoff())
+        except Exception as e:
+            logger.error(f"Orphaned run sweep failed: {e}")
+        finally:
+            db.close()
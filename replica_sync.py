@@ -0,0 +1,54 @@
+"""
+Keep a SQLite read replica in sync with a SQLite primary
+
+For trying the read replica routing locally (see database.ReplicaRouter):
+every --interval seconds the primary is copied onto the replica with
+SQLite's online backup API, so the replica trails the primary by up to
+that interval, like an asynchronous replica. Readers of the replica wait
+out each copy (busy_timeout).
+
+Usage:
+    DATABASE_URL=sqlite:///./primary.db DATABASE_REPLICA_URL=sqlite:///./replica.db uvicorn main:app
+    python replica_sync.py primary.db replica.db --interval 2
+    python replica_sync.py primary.db replica.db --once
+"""
+import time
+import sqlite3
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+def sync_once(primary_path: str, replica_path: str) -> float:
+    """Copy the primary's committed state onto the replica; returns seconds taken"""
+    started = time.perf_counter()
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path, timeout=30)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy a SQLite primary onto a SQLite replica periodically")
+    parser.add_argument("primary")
+    parser.add_argument("replica")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between copies, i.e. the maximum lag")
+    parser.add_argument("--once", action="store_true", help="Copy once and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    
+    while True:
+        try:
+            elapsed = sync_once(args.primary, args.replica)
+            logger.info(f"Synced {args.primary} -> {args.replica} in {elapsed * 1000:.0f}ms")
+        except sqlite3.Error as e:
+            logger.error(f"Sync failed: {e}")
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Incremental parsing of Playwright output with bounded memory
+
+The executor runs Playwright with playwright_templates/line_reporter.js, which
+prints one `D365_REPORT {json}` line per finished test. stdout and stderr are
+read in fixed-size chunks: complete lines go to ReportParser, and the raw bytes
+go to a CappedLog that keeps only the head and tail in memory while the
+whole stream is spilled (gzip) to the artifact store.
+"""
+import os
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Prefix of structured lines the generated scripts print to stdout
+SCRIPT_EVENT_MARKER = 'D365_EVENT '
+# Prefix of lines written by the line reporter
+REPORT_MARKER = 'D365_REPORT '
+
+OUTPUT_HEAD_BYTES = int(os.getenv("OUTPUT_HEAD_BYTES", str(32 * 1024)))
+OUTPUT_TAIL_BYTES = int(os.getenv("OUTPUT_TAIL_BYTES", str(32 * 1024)))
+READ_CHUNK_BYTES = 64 * 1024
+# Longer lines are still logged, but not parsed
+MAX_LINE_BYTES = 1024 * 1024
+MAX_EVENTS = 5000
+MAX_TESTS = 500
+MAX_ITEMS_PER_TEST = 50
+
+_EVENT_PREFIX = SCRIPT_EVENT_MARKER.encode()
+_REPORT_PREFIX = REPORT_MARKER.encode()
+
+class CappedLog:
+    """Keeps the first and last bytes of a stream; everything goes to the spill file"""
+    
+    def __init__(self, spill=None, head_bytes: int = OUTPUT_HEAD_BYTES, tail_bytes: int = OUTPUT_TAIL_BYTES):
+        self.spill = spill
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+    
+    def write(self, data: bytes):
+        self.total_bytes += len(data)
+        if self.spill is not None:
+            self.spill.write(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[:len(self.tail) - self.tail_bytes]
+    
+    @property
+    def truncated(self) -> bool:
+        return self.total_bytes > len(self.head) + len(self.tail)
+    
+    def text(self, full_log: Optional[str] = None) -> str:
+        """Head and tail as text, with a marker where output was cut"""
+        if not self.truncated:
+            return (self.head + self.tail).decode('utf-8', 'replace')
+        omitted = self.total_bytes - len(self.head) - len(self.tail)
+        where = f"; full log: {full_log}" if full_log else ""
+        return (
+            self.head.decode('utf-8', 'replace')
+            + f"\n... [{omitted} bytes omitted{where}] ...\n"
+            + self.tail.decode('utf-8', 'replace')
+        )
+
+class ReportParser:
+    """Builds a structured run summary from reporter lines and collects script events"""
+    
+    def __init__(self, on_event: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_event = on_event  # Called with each script event as its line arrives
+        self.events: List[Dict[str, Any]] = []
+        self.tests: List[Dict[str, Any]] = []
+        self.counts: Dict[str, int] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self.run_status: Optional[str] = None
+        self.run_duration: Optional[float] = None
+        self.dropped = 0
+    
+    def feed(self, line: bytes):
+        if line.startswith(_EVENT_PREFIX):
+            if len(self.events) < MAX_EVENTS:
+                record = self._decode(line, _EVENT_PREFIX)
+                if record is not None:
+                    self.events.append(record)
+                    if self.on_event is not None:
+                        self.on_event(record)
+            else:
+                self.dropped += 1
+        elif line.startswith(_REPORT_PREFIX):
+            record = self._decode(line, _REPORT_PREFIX)
+            if record is not None:
+                self._handle(record.get('type'), record.get('data') or {})
+    
+    def _decode(self, line: bytes, prefix: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            record = json.loads(line[len(prefix):])
+        except ValueError:
+            logger.debug(f"Ignoring malformed reporter line: {line[:200]!r}")
+            return None
+        return record if isinstance(record, dict) else None
+    
+    def _handle(self, record_type: str, data: Dict[str, Any]):
+        if record_type == 'test_end':
+            status = data.get('status', 'unknown')
+            self.counts[status] = self.counts.get(status, 0) + 1
+            if len(self.tests) >= MAX_TESTS:
+                self.dropped += 1
+                return
+            self.tests.append({
+                'title': data.get('title'),
+                'status': status,
+                'expected': data.get('expected'),
+                'retry': data.get('retry', 0),
+                'duration_ms': data.get('duration'),
+                'errors': (data.get('errors') or [])[:MAX_ITEMS_PER_TEST],
+                'failed_steps': (data.get('failed_steps') or [])[:MAX_ITEMS_PER_TEST],
+                'attachments': (data.get('attachments') or [])[:MAX_ITEMS_PER_TEST],
+            })
+        elif record_type == 'error' and len(self.errors) < MAX_ITEMS_PER_TEST:
+            self.errors.append(data)
+        elif record_type == 'end':
+            self.run_status = data.get('status')
+            self.run_duration = data.get('duration')
+    
+    def first_error(self) -> Optional[str]:
+        """Message of the first failing test or step, for the run's error_message"""
+        for test in self.tests:
+            for error in test['errors'] + [step['error'] for step in test['failed_steps'] if step.get('error')]:
+                if error.get('message'):
+                    return error['message']
+        return self.errors[0].get('message') if self.errors else None
+    
+    def summary(self) -> Optional[Dict[str, Any]]:
+        if not self.tests and self.run_status is None and not self.errors:
+            return None
+        return {
+            'status': self.run_status,
+            'duration_ms': self.run_duration,
+            'counts': self.counts,
+            'tests': self.tests,
+            'errors': self.errors,
+            'dropped_records': self.dropped,
+        }
+
+async def pump_lines(reader, log: CappedLog, on_line: Optional[Callable[[bytes], None]] = None):
+    """Drain a stream chunk by chunk into log, passing complete lines to on_line"""
+    line = bytearray()
+    overflowed = False
+    while True:
+        chunk = await reader.read(READ_CHUNK_BYTES)
+        if not chunk:
+            break
+        log.write(chunk)
+        if on_line is None:
+            continue
+        start = 0
+        while True:
+            end = chunk.find(b'\n', start)
+            piece = chunk[start:] if end < 0 else chunk[start:end]
+            if not overflowed:
+                line += piece
+                if len(line) > MAX_LINE_BYTES:
+                    line.clear()
+                    overflowed = True
+            if end < 0:
+                break
+            if not overflowed:
+                on_line(bytes(line.rstrip(b'\r')))
+            line.clear()
+            overflowed = False
+            start = end + 1
+    if on_line is not None and line and not overflowed:
+        on_line(bytes(line))
@@ -0,0 +1,163 @@
+"""
+Conditional GET (weak ETags) and a short-lived per-user response cache
+"""
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import func, true
+from sqlalchemy.orm import Session
+
+from models import TestCase, TestRun
+from database import replica_router
+from metrics import RESPONSE_CACHE_REQUESTS
+from serialization import dumps
+
+# Within the TTL a cached entry is served without touching the database;
+# after it, the entry is revalidated against the data fingerprint
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "5"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048"))
+
+class _Entry:
+    __slots__ = ("etag", "body", "validated_at")
+    
+    def __init__(self, etag: str, body: bytes, validated_at: float):
+        self.etag = etag
+        self.body = body
+        self.validated_at = validated_at
+
+def make_etag(*parts: Any) -> str:
+    """Weak ETag from a data fingerprint and whatever else shapes the response"""
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+def test_cases_fingerprint(db: Session, user_id: int) -> Tuple:
+    """Changes whenever one of the user's test cases is created, updated or deleted"""
+    return tuple(db.query(
+        func.count(TestCase.id),
+        func.max(TestCase.id),
+        func.sum(TestCase.row_version)
+    ).filter(TestCase.owner_id == user_id).one())
+
+def test_runs_fingerprint(db: Session, user_id: int) -> Tuple:
+    """Changes whenever one of the user's test runs is created or updated"""
+    return tuple(db.query(
+        func.count(TestRun.id),
+        func.max(TestRun.id),
+        func.sum(TestRun.row_version)
+    ).filter(TestRun.user_id == user_id).one())
+
+def user_data_fingerprint(db: Session, user_id: int) -> Tuple:
+    """Both fingerprints above in one round trip: their single-row aggregates, joined"""
+    test_cases = db.query(
+        func.count(TestCase.id),
+        func.max(TestCase.id),
+        func.sum(TestCase.row_version)
+    ).filter(TestCase.owner_id == user_id).subquery()
+    test_runs = db.query(
+        func.count(TestRun.id),
+        func.max(TestRun.id),
+        func.sum(TestRun.row_version)
+    ).filter(TestRun.user_id == user_id).subquery()
+    return tuple(db.query(test_cases, test_runs).join(test_runs, true()).one())
+
+class ResponseCache:
+    """Serves GET responses by ETag, caching serialized bodies per user"""
+    
+    def __init__(self, ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _key(request: Request, user_id: int) -> Tuple:
+        return (user_id, request.url.path, tuple(sorted(request.query_params.multi_items())))
+    
+    def _headers(self, etag: str) -> Dict[str, str]:
+        # Private: bodies are per user. no-cache: browsers must revalidate,
+        # which is a cheap 304 here
+        return {"ETag": etag, "Cache-Control": "private, no-cache"}
+    
+    def respond(
+        self,
+        request: Request,
+        user_id: int,
+        fingerprint: Callable[[], Any],
+        build: Callable[[], Any]
+    ) -> Response:
+        """Answer a GET with 304, a cached body, or a freshly built one
+        
+        fingerprint() must be cheap (one aggregate query) and change whenever
+        the data behind the response changes; build() is only called when the
+        cached body is missing or stale.
+        """
+        key = self._key(request, user_id)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        
+        if entry is not None and now - entry.validated_at < self.ttl_seconds:
+            etag = entry.etag
+        else:
+            etag = make_etag(key, fingerprint())
+            if entry is not None:
+                if entry.etag == etag:
+                    entry.validated_at = now
+                else:
+                    entry = None
+        
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            RESPONSE_CACHE_REQUESTS.inc(result="not_modified")
+            return Response(status_code=304, headers=self._headers(etag))
+        
+        if entry is not None:
+            RESPONSE_CACHE_REQUESTS.inc(result="hit")
+            return Response(content=entry.body, media_type="application/json", headers=self._headers(etag))
+        
+        RESPONSE_CACHE_REQUESTS.inc(result="miss")
+        body = dumps(build())
+        if self.ttl_seconds > 0:
+            with self._lock:
+                self._entries[key] = _Entry(etag, body, now)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return Response(content=body, media_type="application/json", headers=self._headers(etag))
+    
+    def invalidate(self, user_id: Optional[int] = None):
+        """Drop cached responses for a user (after a write), or all of them
+        
+        A user's write also sends their reads to the primary until the
+        replica has caught up with it.
+        """
+        if user_id is not None:
+            replica_router.note_write(user_id)
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+# Global response cache instance
+response_cache = ResponseCache()
@@ -0,0 +1,136 @@
+"""
+Result reuse for CI gating: skip reruns of unchanged tests against an unchanged environment
+
+Runs record a hash of what was executed (steps, with the URL they
+actually navigated to, expected result, timeout) and the environment's
+build marker. A run request that opts in with
+reuse_result gets a copy of the latest passing run with the same hash,
+environment and build marker from within the freshness window, instead of
+a browser. The copy is a new run with reuse_status "hit" and
+reused_from_run_id pointing at the run that actually executed; opted-in
+requests that had to execute are marked "miss", which gives the hit rate.
+Environments without a build marker never hit: there's no way to tell
+that they haven't changed.
+"""
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, aliased
+
+from models import TestRun, TestCase, Environment
+from prefix_planner import effective_steps
+from metrics import RESULT_REUSE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+# How old a passing run may be and still be reused
+RESULT_REUSE_MAX_AGE_MINUTES = int(os.getenv("RESULT_REUSE_MAX_AGE_MINUTES", "1440"))
+
+# What a run's outcome depends on besides the environment
+EXECUTED_FIELDS = ("steps", "expected_result", "timeout_seconds")
+
+ReusedRun = aliased(TestRun)
+
+def steps_hash(test_case: TestCase, environment_url: Optional[str] = None) -> str:
+    """Hash of what a run executes; environment_url replaces the first navigate, as in the executor"""
+    content = {field: getattr(test_case, field) for field in EXECUTED_FIELDS}
+    content["steps"] = effective_steps(content["steps"] or [], environment_url)
+    return hashlib.sha256(json.dumps(content, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+def environment_build(db: Session, environment_id: Optional[int]) -> Optional[str]:
+    if not environment_id:
+        return None
+    return db.query(Environment.build_version).filter(Environment.id == environment_id).scalar()
+
+def find_reusable_runs(
+    db: Session,
+    test_cases: List[TestCase],
+    environment_id: Optional[int],
+    build: Optional[str],
+    max_age_minutes: Optional[int] = None,
+    environment_url: Optional[str] = None
+) -> Dict[int, TestRun]:
+    """Test case id -> latest passing run that can stand in for a new run of it
+    
+    environment_url is the URL the new run would navigate to (the request's
+    override or the environment's own); only runs that went there match.
+    """
+    if not environment_id or not build or not test_cases:
+        return {}
+    hashes = {test_case.id: steps_hash(test_case, environment_url) for test_case in test_cases}
+    max_age = RESULT_REUSE_MAX_AGE_MINUTES if max_age_minutes is None else max_age_minutes
+    candidates = db.query(TestRun).filter(
+        TestRun.test_case_id.in_(hashes),
+        TestRun.steps_hash.in_(set(hashes.values())),
+        TestRun.environment_id == environment_id,
+        TestRun.environment_build == build,
+        TestRun.status == "passed",
+        TestRun.har_mode.is_(None),  # Replays didn't hit the environment
+        TestRun.reused_from_run_id.is_(None),  # Freshness counts from the run that executed
+        TestRun.created_at >= datetime.utcnow() - timedelta(minutes=max_age)
+    ).order_by(TestRun.id.desc()).all()
+    
+    reusable = {}
+    for run in candidates:
+        if run.test_case_id not in reusable and run.steps_hash == hashes[run.test_case_id]:
+            reusable[run.test_case_id] = run
+    return reusable
+
+def reused_run(source: TestRun, test_case: TestCase, user_id: int) -> TestRun:
+    """New passing run copying source's outcome; not executed, so it has no execution time"""
+    now = datetime.utcnow()
+    return TestRun(
+        test_case_id=test_case.id,
+        user_id=user_id,
+        environment_id=source.environment_id,
+        status="passed",
+        result=source.result,
+        stderr=source.stderr,
+        report_summary=source.report_summary,
+        capture_policy=source.capture_policy,
+        test_case_version=test_case.version,
+        steps_hash=source.steps_hash,
+        environment_build=source.environment_build,
+        reuse_status="hit",
+        reused_from_run_id=source.id,
+        started_at=now,
+        completed_at=now
+    )
+
+def record_outcomes(hits: int, misses: int):
+    if hits:
+        RESULT_REUSE_REQUESTS.inc(hits, result="hit")
+    if misses:
+        RESULT_REUSE_REQUESTS.inc(misses, result="miss")
+
+def reuse_report(db: Session, user_id: int, days: int) -> Dict[str, Any]:
+    """Hit rate of opted-in run requests and the browser time hits saved"""
+    since = datetime.utcnow() - timedelta(days=days)
+    counts = dict(db.query(TestRun.reuse_status, func.count(TestRun.id)).filter(
+        TestRun.user_id == user_id,
+        TestRun.created_at >= since,
+        TestRun.reuse_status.isnot(None)
+    ).group_by(TestRun.reuse_status).all())
+    # Each hit saved roughly what the run it reused took
+    saved = db.query(func.sum(TestRun.execution_time)).select_from(TestRun).join(
+        ReusedRun, ReusedRun.reused_from_run_id == TestRun.id
+    ).filter(
+        ReusedRun.user_id == user_id,
+        ReusedRun.created_at >= since
+    ).scalar() if counts.get("hit") else None
+    
+    hits, misses = counts.get("hit", 0), counts.get("miss", 0)
+    return {
+        "period_days": days,
+        "requests": hits + misses,
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        "browser_seconds_saved": round(saved or 0, 1),
+        "max_age_minutes": RESULT_REUSE_MAX_AGE_MINUTES
+    }
@@ -0,0 +1,41 @@
+"""
+Run analytics routes, served from the columnar snapshot rather than the OLTP tables
+
+The statistics are blocking NumPy work, so they run in a worker thread
+rather than on the event loop. Exports never run on the request path: a
+missing or stale snapshot is re-exported in the background from a read
+session (see AnalyticsService).
+"""
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+
+from auth import get_current_user
+from analytics import analytics_service
+
+router = APIRouter()
+
+@router.get("/summary")
+async def get_analytics_summary(
+    days: int = Query(30, ge=1, le=365),
+    current_user: dict = Depends(get_current_user)
+):
+    """Duration percentiles, weekly regressions, failure clusters and slowest steps"""
+    summary = await asyncio.to_thread(analytics_service.summary, current_user["user_id"], days)
+    if summary is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analytics snapshot is being exported; try again shortly"
+        )
+    return summary
+
+@router.post("/refresh", status_code=status.HTTP_202_ACCEPTED)
+async def refresh_analytics_snapshot(
+    current_user: dict = Depends(get_current_user)
+):
+    """Start re-exporting the analytics snapshot instead of waiting for it to age out
+    
+    Returns at once. The export is shared, so a refresh while one is running,
+    or shortly after the last one finished, doesn't start another.
+    """
+    return analytics_service.refresh()
@@ -0,0 +1,109 @@
+"""
+Dataset routes: rows that data-driven test cases run once each
+
+Datasets are immutable; upload a new one to change the data.
+"""
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import Dataset, TestCase
+from schemas import (
+    Dataset as DatasetSchema,
+    DatasetCreate,
+    DatasetDetail,
+    MessageResponse
+)
+from auth import get_current_user
+from dataset_runs import parse_dataset
+
+router = APIRouter()
+
+def _get_dataset(db: Session, dataset_id: int, user_id: int) -> Dataset:
+    dataset = db.query(Dataset).filter(
+        Dataset.id == dataset_id,
+        Dataset.owner_id == user_id,
+        Dataset.is_active == True
+    ).first()
+    
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    return dataset
+
+@router.post("/", response_model=DatasetSchema)
+async def create_dataset(
+    dataset: DatasetCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Upload a dataset as JSON rows or CSV text"""
+    try:
+        columns, rows = parse_dataset(dataset.rows, dataset.csv)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    db_dataset = Dataset(
+        name=dataset.name,
+        description=dataset.description,
+        columns=columns,
+        rows=rows,
+        row_count=len(rows),
+        owner_id=current_user["user_id"]
+    )
+    
+    db.add(db_dataset)
+    db.commit()
+    db.refresh(db_dataset)
+    
+    return db_dataset
+
+@router.get("/", response_model=List[DatasetSchema])
+async def list_datasets(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """List datasets for the current user, without their rows"""
+    return db.query(Dataset).filter(
+        Dataset.owner_id == current_user["user_id"],
+        Dataset.is_active == True
+    ).all()
+
+@router.get("/{dataset_id}", response_model=DatasetDetail)
+async def get_dataset(
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a dataset with its rows"""
+    return _get_dataset(db, dataset_id, current_user["user_id"])
+
+@router.delete("/{dataset_id}", response_model=MessageResponse)
+async def delete_dataset(
+    dataset_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete a dataset (soft delete); refused while active test cases use it"""
+    dataset = _get_dataset(db, dataset_id, current_user["user_id"])
+    
+    in_use = db.query(TestCase.id).filter(
+        TestCase.dataset_id == dataset.id,
+        TestCase.is_active == True
+    ).first()
+    if in_use:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Dataset is used by active test cases; detach it from them first"
+        )
+    
+    dataset.is_active = False
+    db.commit()
+    
+    return {"message": "Dataset deleted successfully"}
@@ -0,0 +1,144 @@
+"""
+Environment management routes
+"""
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import Environment
+from schemas import (
+    Environment as EnvironmentSchema,
+    EnvironmentCreate,
+    EnvironmentUpdate,
+    MessageResponse
+)
+from auth import get_current_user
+from routing_profiles import resolve_routing_profile
+from capture_policy import validate_capture_policy
+
+router = APIRouter()
+
+def _validate_routing_profile(routing_profile):
+    """Reject profiles with unknown presets, resource types or wait states"""
+    try:
+        resolve_routing_profile(routing_profile)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.post("/", response_model=EnvironmentSchema)
+async def create_environment(
+    environment: EnvironmentCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a new environment"""
+    routing_profile = environment.routing_profile.dict() if environment.routing_profile else None
+    _validate_routing_profile(routing_profile)
+    capture_policy = validate_capture_policy(environment.capture_policy.dict() if environment.capture_policy else None)
+    
+    db_environment = Environment(
+        name=environment.name,
+        url=environment.url,
+        description=environment.description,
+        routing_profile=routing_profile,
+        capture_policy=capture_policy,
+        build_version=environment.build_version,
+        owner_id=current_user["user_id"]
+    )
+    
+    db.add(db_environment)
+    db.commit()
+    db.refresh(db_environment)
+    
+    return db_environment
+
+@router.get("/", response_model=List[EnvironmentSchema])
+async def list_environments(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """List environments for the current user"""
+    return db.query(Environment).filter(
+        Environment.owner_id == current_user["user_id"],
+        Environment.is_active == True
+    ).all()
+
+@router.get("/{environment_id}", response_model=EnvironmentSchema)
+async def get_environment(
+    environment_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a specific environment"""
+    environment = db.query(Environment).filter(
+        Environment.id == environment_id,
+        Environment.owner_id == current_user["user_id"]
+    ).first()
+    
+    if not environment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Environment not found"
+        )
+    
+    return environment
+
+@router.put("/{environment_id}", response_model=EnvironmentSchema)
+async def update_environment(
+    environment_id: int,
+    environment_update: EnvironmentUpdate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Update an environment"""
+    environment = db.query(Environment).filter(
+        Environment.id == environment_id,
+        Environment.owner_id == current_user["user_id"]
+    ).first()
+    
+    if not environment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Environment not found"
+        )
+    
+    update_data = environment_update.dict(exclude_unset=True)
+    if "routing_profile" in update_data:
+        _validate_routing_profile(update_data["routing_profile"])
+    if "capture_policy" in update_data:
+        update_data["capture_policy"] = validate_capture_policy(update_data["capture_policy"])
+    
+    for field, value in update_data.items():
+        setattr(environment, field, value)
+    
+    db.commit()
+    db.refresh(environment)
+    
+    return environment
+
+@router.delete("/{environment_id}", response_model=MessageResponse)
+async def delete_environment(
+    environment_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete an environment (soft delete)"""
+    environment = db.query(Environment).filter(
+        Environment.id == environment_id,
+        Environment.owner_id == current_user["user_id"]
+    ).first()
+    
+    if not environment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Environment not found"
+        )
+    
+    environment.is_active = False
+    db.commit()
+    
+    return {"message": "Environment deleted successfully"}
@@ -1,58 +1,136 @@
 """
 Test results and reporting routes
 """
+from pathlib import Path
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse, FileResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, literal
 
 from database import get_db
-from models import TestRun, TestCase
+from models import TestRun, TestCase, TestRunRollup, VisualBaseline
 from schemas import TestRun as TestRunSchema
-from auth import get_current_user
+from auth import get_current_user, get_read_db
+from tracing import load_trace, summarize_trace
+from response_cache import response_cache, test_runs_fingerprint, user_data_fingerprint
+from serialization import stream_rows, PAGE_MAX_LIMIT, STREAM_MAX_LIMIT
+from archive import archive_query_like, find_run, merged_page, merged_stream_rows, run_stderr
+from test_executor import test_executor
+from scheduler import run_scheduler
+from reaper import IN_FLIGHT_STATUSES
+from static_assets import accepted_encodings
+import artifact_store
+from capture_policy import PRESETS_BY_COST
+from selector_index import rank_selectors, SELECTOR_MIN_SAMPLES, SLOW_SELECTOR_MS
+from result_reuse import reuse_report
+from prefix_planner import batch_report
 
 router = APIRouter()
 
 @router.get("/runs", response_model=List[TestRunSchema])
 async def list_test_runs(
+    request: Request,
     skip: int = Query(0, ge=0),
-    limit: int = Query(100, ge=1, le=1000),
-    status_filter: Optional[str] = Query(None, regex="^(pending|running|passed|failed|error)$"),
+    limit: int = Query(100, ge=1, le=STREAM_MAX_LIMIT),
+    status_filter: Optional[str] = Query(None, regex="^(pending|running|passed|failed|error|cancelled)$"),
     test_case_id: Optional[int] = Query(None),
-    db: Session = Depends(get_db),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None),
+    stream: Optional[str] = Query(None, regex="^(json|ndjson)$"),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """List test runs for the current user"""
-    query = db.query(TestRun).filter(TestRun.user_id == current_user["user_id"])
-    
-    # Apply status filter
-    if status_filter:
-        query = query.filter(TestRun.status == status_filter)
-    
-    # Apply test case filter
-    if test_case_id:
-        # Verify user owns the test case
-        test_case = db.query(TestCase).filter(
-            TestCase.id == test_case_id,
-            TestCase.owner_id == current_user["user_id"]
-        ).first()
-        if not test_case:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Test case not found"
-            )
-        query = query.filter(TestRun.test_case_id == test_case_id)
-    
-    test_runs = query.order_by(desc(TestRun.created_at)).offset(skip).limit(limit).all()
-    return test_runs
+    """List test runs for the current user, newest first, including archived history
+    
+    stream=json|ndjson streams large pages.
+    """
+    user_id = current_user["user_id"]
+    if limit > PAGE_MAX_LIMIT and not stream:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"limit above {PAGE_MAX_LIMIT} requires stream=json or stream=ndjson"
+        )
+    
+    def build_query():
+        query = db.query(TestRun).filter(TestRun.user_id == user_id)
+        
+        # Apply status filter
+        if status_filter:
+            query = query.filter(TestRun.status == status_filter)
+        
+        # Apply test case filter
+        if test_case_id:
+            # Verify user owns the test case
+            test_case = db.query(TestCase).filter(
+                TestCase.id == test_case_id,
+                TestCase.owner_id == user_id
+            ).first()
+            if not test_case:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Test case not found"
+                )
+            query = query.filter(TestRun.test_case_id == test_case_id)
+        
+        # Apply time range
+        if since:
+            query = query.filter(TestRun.created_at >= since)
+        if until:
+            query = query.filter(TestRun.created_at < until)
+        
+        return query.order_by(desc(TestRun.created_at))
+    
+    def archive_query():
+        return archive_query_like(db, user_id, test_case_id, status_filter, since, until)
+    
+    if stream:
+        return stream_rows(merged_stream_rows(build_query(), archive_query(), skip, limit), lambda row: row, stream)
+    
+    # The test case filter's ownership check depends on test cases too
+    def fingerprint():
+        if test_case_id:
+            return user_data_fingerprint(db, user_id)
+        return test_runs_fingerprint(db, user_id)
+    
+    return response_cache.respond(
+        request,
+        user_id,
+        fingerprint,
+        lambda: merged_page(db, build_query(), archive_query(), skip, limit)
+    )
 
 @router.get("/runs/{run_id}", response_model=TestRunSchema)
 async def get_test_run(
+    run_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a specific test run (hot or archived)"""
+    test_run = find_run(db, run_id, current_user["user_id"])
+    
+    if not test_run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test run not found"
+        )
+    
+    return test_run
+
+@router.post("/runs/{run_id}/cancel", response_model=TestRunSchema)
+async def cancel_test_run(
     run_id: int,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get a specific test run"""
+    """Cancel a pending or running test run, killing its browser processes
+    
+    A run queued or executing in this server process is dropped from the
+    queue or terminated; one with no live executor here (e.g. left by a
+    crash) is marked cancelled directly. Cancelling a dataset run cancels
+    its unfinished rows too.
+    """
     test_run = db.query(TestRun).filter(
         TestRun.id == run_id,
         TestRun.user_id == current_user["user_id"]
@@ -63,101 +141,360 @@ async def get_test_run(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Test run not found"
         )
+    if test_run.status not in IN_FLIGHT_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Test run already finished with status '{test_run.status}'"
+        )
     
+    now = datetime.utcnow()
+    runs = [test_run]
+    if test_run.dataset_id and test_run.parent_run_id is None:
+        runs += db.query(TestRun).filter(
+            TestRun.parent_run_id == run_id,
+            TestRun.status.in_(IN_FLIGHT_STATUSES)
+        ).all()
+    for run in runs:
+        run_scheduler.cancel(run.id) or test_executor.cancel(run.id)
+        run.status = "cancelled"
+        run.error_message = "Run cancelled"
+        run.completed_at = now
+    db.commit()
+    db.refresh(test_run)
+    response_cache.invalidate(current_user["user_id"])
     return test_run
 
-@router.get("/dashboard")
-async def get_dashboard_stats(
-    db: Session = Depends(get_db),
+@router.get("/runs/{run_id}/trace")
+async def get_test_run_trace(
+    run_id: int,
+    format: str = Query("otlp", regex="^(otlp|summary)$"),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get dashboard statistics for the current user"""
-    # Total test cases
-    total_test_cases = db.query(TestCase).filter(
-        TestCase.owner_id == current_user["user_id"],
-        TestCase.is_active == True
-    ).count()
-    
-    # Total test runs
-    total_test_runs = db.query(TestRun).filter(
-        TestRun.user_id == current_user["user_id"]
-    ).count()
+    """Get the phase timeline of a test run (OTLP/JSON, or a flattened summary)"""
+    test_run = find_run(db, run_id, current_user["user_id"])
     
-    # Test runs by status
-    status_counts = db.query(
-        TestRun.status,
-        func.count(TestRun.id).label('count')
-    ).filter(
-        TestRun.user_id == current_user["user_id"]
-    ).group_by(TestRun.status).all()
+    if not test_run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test run not found"
+        )
     
-    status_stats = {status: count for status, count in status_counts}
+    trace = load_trace(run_id)
+    if trace is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No trace recorded for this run"
+        )
     
-    # Recent test runs
-    recent_runs = db.query(TestRun).filter(
-        TestRun.user_id == current_user["user_id"]
-    ).order_by(desc(TestRun.created_at)).limit(10).all()
+    if format == "summary":
+        return {"run_id": run_id, "spans": summarize_trace(trace)}
+    return trace
+
+@router.get("/runs/{run_id}/log")
+async def get_test_run_log(
+    run_id: int,
+    request: Request,
+    source: str = Query("stdout", regex="^(stdout|stderr)$"),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Full Playwright output of a run, including what was cut from the stored result"""
+    test_run = find_run(db, run_id, current_user["user_id"])
     
-    # Success rate calculation
-    total_completed = status_stats.get('passed', 0) + status_stats.get('failed', 0)
-    success_rate = (status_stats.get('passed', 0) / total_completed * 100) if total_completed > 0 else 0
+    if not test_run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test run not found"
+        )
     
-    # Average execution time
-    avg_execution_time = db.query(
-        func.avg(TestRun.execution_time)
-    ).filter(
-        TestRun.user_id == current_user["user_id"],
-        TestRun.execution_time.isnot(None)
-    ).scalar() or 0
+    path = artifact_store.path_for(run_id, f"{source}.log.gz")
+    if not path.is_file():
+        # Nothing was truncated, so the stored text is the whole log
+        return PlainTextResponse((test_run["result"] if source == "stdout" else run_stderr(db, run_id)) or "")
     
-    return {
-        "total_test_cases": total_test_cases,
-        "total_test_runs": total_test_runs,
-        "status_counts": status_stats,
-        "success_rate": round(success_rate, 2),
-        "average_execution_time": round(avg_execution_time, 2),
-        "recent_runs": [
-            {
-                "id": run.id,
-                "test_case_id": run.test_case_id,
-                "status": run.status,
-                "execution_time": run.execution_time,
-                "created_at": run.created_at
-            } for run in recent_runs
-        ]
-    }
+    # The spill is already gzip; pass it through when the client accepts that
+    if "gzip" in accepted_encodings(request.headers.get("accept-encoding")):
+        return StreamingResponse(
+            artifact_store.iter_bytes(path, decompress=False),
+            media_type="text/plain; charset=utf-8",
+            headers={"Content-Encoding": "gzip"}
+        )
+    return StreamingResponse(artifact_store.iter_bytes(path, decompress=True), media_type="text/plain; charset=utf-8")
+
+@router.get("/runs/{run_id}/visual/{step_index}")
+async def get_test_run_visual(
+    run_id: int,
+    step_index: int,
+    image: str = Query("diff", regex="^(actual|baseline|diff)$"),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Screenshot of a step, its current baseline, or the diff image against it"""
+    test_run = find_run(db, run_id, current_user["user_id"])
+    
+    if not test_run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test run not found"
+        )
+    
+    entry = next((entry for entry in test_run.get("visual_diffs") or [] if entry["step"] == step_index), None)
+    path = None
+    if entry and image == "actual":
+        path = entry["actual_path"]
+    elif entry and image == "diff":
+        path = entry.get("diff_path")
+    elif entry and entry.get("baseline_id"):
+        baseline = db.query(VisualBaseline).filter(VisualBaseline.id == entry["baseline_id"]).first()
+        path = baseline.path if baseline else None
+    
+    if not path or not Path(path).is_file():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No {image} image for this step"
+        )
+    return FileResponse(path, media_type="image/png")
+
+@router.get("/dashboard")
+async def get_dashboard_stats(
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get dashboard statistics for the current user"""
+    user_id = current_user["user_id"]
+    
+    def build():
+        # Total test cases
+        total_test_cases = db.query(TestCase).filter(
+            TestCase.owner_id == user_id,
+            TestCase.is_active == True
+        ).count()
+        
+        # Test runs by status, hot table plus rollups of archived runs, in one statement
+        status_stats = {}
+        time_sum = 0.0
+        time_count = 0
+        has_archived = False
+        hot_counts = db.query(
+            TestRun.status,
+            func.count(TestRun.id).label('count'),
+            func.sum(TestRun.execution_time),
+            func.count(TestRun.execution_time),
+            literal(0).label('archived')
+        ).filter(
+            TestRun.user_id == user_id
+        ).group_by(TestRun.status)
+        archived_counts = db.query(
+            TestRunRollup.status,
+            func.sum(TestRunRollup.run_count),
+            func.sum(TestRunRollup.execution_time_sum),
+            func.sum(TestRunRollup.execution_time_count),
+            literal(1)
+        ).filter(
+            TestRunRollup.user_id == user_id
+        ).group_by(TestRunRollup.status)
+        for status_name, count, status_time_sum, status_time_count, archived in hot_counts.union_all(archived_counts):
+            status_stats[status_name] = status_stats.get(status_name, 0) + (count or 0)
+            time_sum += status_time_sum or 0
+            time_count += status_time_count or 0
+            has_archived = has_archived or bool(archived and count)
+        
+        # Total test runs
+        total_test_runs = sum(status_stats.values())
+        
+        # Recent test runs
+        recent_runs = merged_page(
+            db,
+            db.query(TestRun).filter(TestRun.user_id == user_id).order_by(desc(TestRun.created_at)),
+            # The rollups show whether the user has archived runs at all
+            archive_query_like(db, user_id) if has_archived else None,
+            0,
+            10
+        )
+        
+        # Success rate calculation
+        total_completed = status_stats.get('passed', 0) + status_stats.get('failed', 0)
+        success_rate = (status_stats.get('passed', 0) / total_completed * 100) if total_completed > 0 else 0
+        
+        # Average execution time
+        avg_execution_time = time_sum / time_count if time_count else 0
+        
+        return {
+            "total_test_cases": total_test_cases,
+            "total_test_runs": total_test_runs,
+            "status_counts": status_stats,
+            "success_rate": round(success_rate, 2),
+            "average_execution_time": round(avg_execution_time, 2),
+            "recent_runs": [
+                {
+                    "id": run["id"],
+                    "test_case_id": run["test_case_id"],
+                    "status": run["status"],
+                    "execution_time": run["execution_time"],
+                    "created_at": run["created_at"]
+                } for run in recent_runs
+            ]
+        }
+    
+    return response_cache.respond(
+        request,
+        user_id,
+        lambda: user_data_fingerprint(db, user_id),
+        build
+    )
 
 @router.get("/trends")
 async def get_test_trends(
     days: int = Query(30, ge=1, le=365),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get test execution trends over time"""
-    from datetime import datetime, timedelta
-    
+    """Get test execution trends over time, including archived history"""
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    # Daily test runs
-    daily_runs = db.query(
+    # Daily test runs by status from the hot table and the archive rollups
+    hot_daily = db.query(
         func.date(TestRun.created_at).label('date'),
-        func.count(TestRun.id).label('total_runs'),
-        func.sum(func.case([(TestRun.status == 'passed', 1)], else_=0)).label('passed_runs'),
-        func.sum(func.case([(TestRun.status == 'failed', 1)], else_=0)).label('failed_runs')
+        TestRun.status,
+        func.count(TestRun.id)
     ).filter(
         TestRun.user_id == current_user["user_id"],
         TestRun.created_at >= start_date
-    ).group_by(func.date(TestRun.created_at)).all()
+    ).group_by(func.date(TestRun.created_at), TestRun.status).all()
+    archived_daily = db.query(
+        TestRunRollup.day,
+        TestRunRollup.status,
+        TestRunRollup.run_count
+    ).filter(
+        TestRunRollup.user_id == current_user["user_id"],
+        TestRunRollup.day >= start_date.date()
+    ).all()
+    
+    daily_runs = {}
+    for date, status_name, count in list(hot_daily) + list(archived_daily):
+        day = daily_runs.setdefault(str(date), {"total": 0, "passed": 0, "failed": 0})
+        day["total"] += count
+        if status_name in ("passed", "failed"):
+            day[status_name] += count
     
     trends = [
         {
-            "date": str(date),
-            "total_runs": total,
-            "passed_runs": passed or 0,
-            "failed_runs": failed or 0,
-            "success_rate": round((passed or 0) / total * 100, 2) if total > 0 else 0
+            "date": date,
+            "total_runs": counts["total"],
+            "passed_runs": counts["passed"],
+            "failed_runs": counts["failed"],
+            "success_rate": round(counts["passed"] / counts["total"] * 100, 2) if counts["total"] > 0 else 0
         }
-        for date, total, passed, failed in daily_runs
+        for date, counts in sorted(daily_runs.items())
     ]
     
     return {"trends": trends, "period_days": days}
+
+@router.get("/selectors")
+async def get_selector_ranking(
+    sort: str = Query("impact", regex="^(impact|slowest|flakiest)$"),
+    limit: int = Query(20, ge=1, le=200),
+    min_resolutions: int = Query(SELECTOR_MIN_SAMPLES, ge=1),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Worst selectors across all test cases, with the test cases that use each
+    
+    impact ranks by total resolution time, so the top entry is the fix that
+    saves the most browser time overall.
+    """
+    return {
+        "sort": sort,
+        "slow_threshold_ms": SLOW_SELECTOR_MS,
+        "selectors": rank_selectors(db, current_user["user_id"], sort, limit, min_resolutions)
+    }
+
+@router.get("/capture-costs")
+async def get_capture_costs(
+    days: int = Query(30, ge=1, le=365),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Run time and artifact disk usage per capture policy
+    
+    extra_seconds_per_run compares each policy with the least-capturing
+    preset in the period, over test cases that ran under both.
+    """
+    user_id = current_user["user_id"]
+    start_date = datetime.utcnow() - timedelta(days=days)
+    recent = (
+        TestRun.user_id == user_id,
+        TestRun.created_at >= start_date,
+        TestRun.capture_policy.isnot(None)
+    )
+    
+    totals = db.query(
+        TestRun.capture_policy,
+        TestRun.status,
+        func.count(TestRun.id),
+        func.sum(TestRun.execution_time),
+        func.sum(TestRun.artifact_bytes)
+    ).filter(*recent).group_by(TestRun.capture_policy, TestRun.status).all()
+    
+    policies = {}
+    for policy, status_name, count, time_sum, bytes_sum in totals:
+        entry = policies.setdefault(policy, {
+            "policy": policy, "runs": 0, "failed_runs": 0, "execution_seconds": 0.0, "artifact_bytes": 0
+        })
+        entry["runs"] += count
+        entry["failed_runs"] += count if status_name in ("failed", "error") else 0
+        entry["execution_seconds"] += time_sum or 0
+        entry["artifact_bytes"] += bytes_sum or 0
+    
+    # Per test case mean duration under each policy, for a like-for-like time overhead
+    per_case = {}
+    for test_case_id, policy, avg_time in db.query(
+        TestRun.test_case_id, TestRun.capture_policy, func.avg(TestRun.execution_time)
+    ).filter(*recent, TestRun.execution_time.isnot(None)).group_by(TestRun.test_case_id, TestRun.capture_policy):
+        per_case.setdefault(test_case_id, {})[policy] = avg_time
+    baseline = next((name for name in PRESETS_BY_COST if name in policies), None)
+    
+    total_bytes = sum(entry["artifact_bytes"] for entry in policies.values())
+    for policy, entry in policies.items():
+        entry["browser_minutes"] = round(entry.pop("execution_seconds") / 60, 2)
+        entry["avg_execution_time"] = round(entry["browser_minutes"] * 60 / entry["runs"], 2) if entry["runs"] else 0
+        entry["avg_artifact_bytes"] = entry["artifact_bytes"] // entry["runs"] if entry["runs"] else 0
+        entry["disk_share_pct"] = round(entry["artifact_bytes"] / total_bytes * 100, 2) if total_bytes else 0
+        deltas = [
+            times[policy] - times[baseline]
+            for times in per_case.values()
+            if baseline and policy != baseline and policy in times and baseline in times
+        ]
+        entry["extra_seconds_per_run"] = round(sum(deltas) / len(deltas), 2) if deltas else None
+    
+    return {
+        "period_days": days,
+        "baseline_policy": baseline,
+        "policies": sorted(policies.values(), key=lambda entry: entry["artifact_bytes"], reverse=True)
+    }
+
+@router.get("/reuse")
+async def get_result_reuse(
+    days: int = Query(7, ge=1, le=365),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Hit rate of run requests that opted into result reuse, and the browser time it saved"""
+    return reuse_report(db, current_user["user_id"], days)
+
+@router.get("/batches/{batch_id}/shared-prefixes")
+async def get_batch_shared_prefixes(
+    batch_id: str,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Setup prefixes a batch ran once for several runs, and the step seconds that saved"""
+    report = batch_report(db, current_user["user_id"], batch_id)
+    if report is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Batch not found"
+        )
+    return report
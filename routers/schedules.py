@@ -0,0 +1,165 @@
+"""
+Run schedule routes (see run_schedules.py)
+"""
+from datetime import datetime
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import RunSchedule, TestCase, TestSuite, Environment
+from schemas import (
+    RunSchedule as RunScheduleSchema,
+    RunScheduleCreate,
+    RunScheduleUpdate,
+    MessageResponse
+)
+from auth import get_current_user
+from run_schedules import parse_schedule, next_fire, upcoming_fires
+
+router = APIRouter()
+
+TARGET_FIELDS = ("test_case_id", "suite_id", "tag_query")
+
+def _validate_schedule(db: Session, values: dict, user_id: int):
+    """400 for a bad cron expression, time zone or target; 422 for an expression that
+    never fires (e.g. "0 0 30 2 *"); 404 for targets the user doesn't own"""
+    try:
+        cron = parse_schedule(values["cron"], values["timezone"])
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    try:
+        cron.next_after(datetime.utcnow())
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+    if sum(1 for field in TARGET_FIELDS if values.get(field)) != 1:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Set exactly one of test_case_id, suite_id or tag_query"
+        )
+    
+    owned = [
+        (values.get("test_case_id"), TestCase, "Test case"),
+        (values.get("suite_id"), TestSuite, "Test suite"),
+        (values.get("environment_id"), Environment, "Environment")
+    ]
+    for target_id, model, label in owned:
+        if target_id and not db.query(model.id).filter(
+            model.id == target_id,
+            model.owner_id == user_id,
+            model.is_active == True
+        ).first():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"{label} not found"
+            )
+
+def _get_owned_schedule(db: Session, schedule_id: int, user_id: int) -> RunSchedule:
+    schedule = db.query(RunSchedule).filter(
+        RunSchedule.id == schedule_id,
+        RunSchedule.owner_id == user_id
+    ).first()
+    if not schedule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Schedule not found"
+        )
+    return schedule
+
+@router.post("/", response_model=RunScheduleSchema)
+async def create_schedule(
+    schedule: RunScheduleCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a schedule; its first tick is the next cron time from now"""
+    values = schedule.dict()
+    _validate_schedule(db, values, current_user["user_id"])
+    
+    db_schedule = RunSchedule(**values, owner_id=current_user["user_id"])
+    db.add(db_schedule)
+    db.flush()  # The id seeds the jitter
+    db_schedule.next_tick_at, db_schedule.next_run_at = next_fire(db_schedule, datetime.utcnow())
+    db.commit()
+    db.refresh(db_schedule)
+    
+    return db_schedule
+
+@router.get("/", response_model=List[RunScheduleSchema])
+async def list_schedules(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """List the current user's active schedules, soonest first"""
+    return db.query(RunSchedule).filter(
+        RunSchedule.owner_id == current_user["user_id"],
+        RunSchedule.is_active == True
+    ).order_by(RunSchedule.next_run_at).all()
+
+@router.get("/{schedule_id}", response_model=RunScheduleSchema)
+async def get_schedule(
+    schedule_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a specific schedule"""
+    return _get_owned_schedule(db, schedule_id, current_user["user_id"])
+
+@router.get("/{schedule_id}/upcoming")
+async def get_upcoming_fires(
+    schedule_id: int,
+    count: int = Query(10, ge=1, le=100),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Next cron ticks of a schedule and when their runs start, after jitter"""
+    schedule = _get_owned_schedule(db, schedule_id, current_user["user_id"])
+    return upcoming_fires(schedule, count)
+
+@router.put("/{schedule_id}", response_model=RunScheduleSchema)
+async def update_schedule(
+    schedule_id: int,
+    schedule_update: RunScheduleUpdate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Update a schedule; setting one target clears the others"""
+    schedule = _get_owned_schedule(db, schedule_id, current_user["user_id"])
+    
+    update_data = schedule_update.dict(exclude_unset=True)
+    if any(field in update_data for field in TARGET_FIELDS):
+        for field in TARGET_FIELDS:
+            update_data.setdefault(field, None)
+    values = {column.name: getattr(schedule, column.name) for column in RunSchedule.__table__.columns}
+    values.update(update_data)
+    _validate_schedule(db, values, current_user["user_id"])
+    
+    for field, value in update_data.items():
+        setattr(schedule, field, value)
+    if {"cron", "timezone", "jitter_seconds", "is_active"} & update_data.keys():
+        # Ticks missed while paused aren't made up
+        schedule.next_tick_at, schedule.next_run_at = next_fire(schedule, datetime.utcnow())
+    
+    db.commit()
+    db.refresh(schedule)
+    
+    return schedule
+
+@router.delete("/{schedule_id}", response_model=MessageResponse)
+async def delete_schedule(
+    schedule_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete a schedule (soft delete)"""
+    schedule = _get_owned_schedule(db, schedule_id, current_user["user_id"])
+    schedule.is_active = False
+    db.commit()
+    
+    return {"message": "Schedule deleted successfully"}
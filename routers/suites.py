@@ -0,0 +1,131 @@
+"""
+Test suite management routes
+"""
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from database import get_db
+from models import TestSuite, TestCase
+from schemas import (
+    TestSuite as TestSuiteSchema,
+    TestSuiteCreate,
+    TestSuiteUpdate,
+    MessageResponse
+)
+from auth import get_current_user
+from capture_policy import validate_capture_policy
+
+router = APIRouter()
+
+def _validate_test_case_ids(db: Session, test_case_ids: List[int], user_id: int):
+    """400 unless every id is one of the user's active test cases"""
+    found = {row.id for row in db.query(TestCase.id).filter(
+        TestCase.id.in_(test_case_ids),
+        TestCase.owner_id == user_id,
+        TestCase.is_active == True
+    )}
+    missing = sorted(set(test_case_ids) - found)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown test cases: {missing}"
+        )
+
+def _get_suite(db: Session, suite_id: int, user_id: int) -> TestSuite:
+    suite = db.query(TestSuite).filter(
+        TestSuite.id == suite_id,
+        TestSuite.owner_id == user_id,
+        TestSuite.is_active == True
+    ).first()
+    
+    if not suite:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test suite not found"
+        )
+    return suite
+
+@router.post("/", response_model=TestSuiteSchema)
+async def create_suite(
+    suite: TestSuiteCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a new test suite"""
+    _validate_test_case_ids(db, suite.test_case_ids, current_user["user_id"])
+    capture_policy = validate_capture_policy(suite.capture_policy.dict() if suite.capture_policy else None)
+    
+    db_suite = TestSuite(
+        name=suite.name,
+        description=suite.description,
+        test_case_ids=suite.test_case_ids,
+        capture_policy=capture_policy,
+        owner_id=current_user["user_id"]
+    )
+    
+    db.add(db_suite)
+    db.commit()
+    db.refresh(db_suite)
+    
+    return db_suite
+
+@router.get("/", response_model=List[TestSuiteSchema])
+async def list_suites(
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """List test suites for the current user"""
+    return db.query(TestSuite).filter(
+        TestSuite.owner_id == current_user["user_id"],
+        TestSuite.is_active == True
+    ).all()
+
+@router.get("/{suite_id}", response_model=TestSuiteSchema)
+async def get_suite(
+    suite_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a specific test suite"""
+    return _get_suite(db, suite_id, current_user["user_id"])
+
+@router.put("/{suite_id}", response_model=TestSuiteSchema)
+async def update_suite(
+    suite_id: int,
+    suite_update: TestSuiteUpdate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Update a test suite, e.g. its test cases or capture policy"""
+    suite = _get_suite(db, suite_id, current_user["user_id"])
+    
+    update_data = suite_update.dict(exclude_unset=True)
+    if update_data.get("test_case_ids") is not None:
+        _validate_test_case_ids(db, update_data["test_case_ids"], current_user["user_id"])
+    elif "test_case_ids" in update_data:
+        del update_data["test_case_ids"]
+    if "capture_policy" in update_data:
+        update_data["capture_policy"] = validate_capture_policy(update_data["capture_policy"])
+    
+    for field, value in update_data.items():
+        setattr(suite, field, value)
+    
+    db.commit()
+    db.refresh(suite)
+    
+    return suite
+
+@router.delete("/{suite_id}", response_model=MessageResponse)
+async def delete_suite(
+    suite_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete a test suite (soft delete)"""
+    suite = _get_suite(db, suite_id, current_user["user_id"])
+    
+    suite.is_active = False
+    db.commit()
+    
+    return {"message": "Test suite deleted successfully"}
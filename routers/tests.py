@@ -1,26 +1,82 @@
 """
 Test case management routes
 """
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import uuid
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
+from sqlalchemy.exc import IntegrityError
 
-from database import get_db
-from models import TestCase, TestRun, User
+from database import get_db, SessionLocal
+from models import TestCase, TestRun, TestSuite, User, Environment, VisualBaseline, TestCaseVersion, Dataset
 from schemas import (
     TestCase as TestCaseSchema,
     TestCaseCreate,
     TestCaseUpdate,
+    TestCaseSaved,
+    TestCaseVersion as TestCaseVersionSchema,
+    TestStepBase,
     TestRunCreate,
+    BatchRunCreate,
     TestRun as TestRunSchema,
+    BaselineApprove,
+    VisualBaseline as VisualBaselineSchema,
     MessageResponse
 )
-from auth import get_current_user
+from auth import get_current_user, get_read_db
 from test_executor import test_executor
+from routing_profiles import resolve_routing_profile
+from capture_policy import validate_capture_policy, resolve_capture_policy
+from selector_index import review_steps, record_resolutions
+from result_reuse import steps_hash, environment_build, find_reusable_runs, reused_run, record_outcomes
+from versioning import content_of, record_initial_version, record_version, get_version, diff_versions
+from dataset_runs import missing_columns, finish_parent
+from prefix_planner import plan_shared_prefixes, seconds_saved, waiting_run_ids, SHARED_PREFIXES_ENABLED
+from visual_diff import visual_diff_engine, summarize_changes, VISUAL_FAIL_ON_CHANGE
+import artifact_store
+from metrics import RUNS_ACTIVE, SHARED_PREFIX_SECONDS_SAVED, detach_request
+from tracing import start_run_trace
+from response_cache import response_cache, test_cases_fingerprint
+from serialization import RowEncoder, stream_query, PAGE_MAX_LIMIT, STREAM_MAX_LIMIT
+from archive import archive_query_like, merged_page
+from scheduler import (
+    run_scheduler, RunCancelled, LANE_INTERACTIVE, LANE_BATCH,
+    browser_minutes_remaining, browser_minutes_quota, projected_browser_minutes
+)
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.post("/", response_model=TestCaseSchema)
+encode_test_case = RowEncoder(TestCaseSchema, nested={"steps": TestStepBase})
+
+def _validate_dataset(db: Session, dataset_id: Optional[int], steps: list, user_id: int):
+    """404 unless the dataset is the user's; 400 when the steps name columns it doesn't have"""
+    if dataset_id is None:
+        return
+    dataset = db.query(Dataset.columns).filter(
+        Dataset.id == dataset_id,
+        Dataset.owner_id == user_id,
+        Dataset.is_active == True
+    ).first()
+    if not dataset:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Dataset not found"
+        )
+    missing = missing_columns(steps, dataset.columns)
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Steps use placeholders the dataset has no columns for: {missing}"
+        )
+
+@router.post("/", response_model=TestCaseSaved)
 async def create_test_case(
     test_case: TestCaseCreate,
     db: Session = Depends(get_db),
@@ -28,12 +84,14 @@ async def create_test_case(
 ):
     """Create a new test case"""
     # Validate test steps
-    validated_steps = test_executor.validate_test_steps(test_case.steps)
+    validated_steps = test_executor.validate_test_steps([step.dict() for step in test_case.steps])
     if not validated_steps:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No valid test steps provided"
         )
+    capture_policy = validate_capture_policy(test_case.capture_policy.dict() if test_case.capture_policy else None)
+    _validate_dataset(db, test_case.dataset_id, validated_steps, current_user["user_id"])
     
     # Create test case
     db_test_case = TestCase(
@@ -42,43 +100,70 @@ async def create_test_case(
         steps=validated_steps,
         expected_result=test_case.expected_result,
         tags=test_case.tags,
+        timeout_seconds=test_case.timeout_seconds,
+        capture_policy=capture_policy,
+        dataset_id=test_case.dataset_id,
         owner_id=current_user["user_id"]
     )
     
     db.add(db_test_case)
+    db.flush()
+    record_initial_version(db, db_test_case, current_user["user_id"])
     db.commit()
     db.refresh(db_test_case)
+    response_cache.invalidate(current_user["user_id"])
     
+    # Slow, flaky or brittle selectors are flagged but don't block saving
+    db_test_case.selector_warnings = review_steps(db, current_user["user_id"], validated_steps)
     return db_test_case
 
 @router.get("/", response_model=List[TestCaseSchema])
 async def list_test_cases(
+    request: Request,
     skip: int = Query(0, ge=0),
-    limit: int = Query(100, ge=1, le=1000),
+    limit: int = Query(100, ge=1, le=STREAM_MAX_LIMIT),
     search: Optional[str] = Query(None),
     tags: Optional[str] = Query(None),
-    db: Session = Depends(get_db),
+    stream: Optional[str] = Query(None, regex="^(json|ndjson)$"),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """List test cases for the current user"""
-    query = db.query(TestCase).filter(
-        TestCase.owner_id == current_user["user_id"],
-        TestCase.is_active == True
-    )
+    """List test cases for the current user (stream=json|ndjson streams large pages)"""
+    user_id = current_user["user_id"]
+    if limit > PAGE_MAX_LIMIT and not stream:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"limit above {PAGE_MAX_LIMIT} requires stream=json or stream=ndjson"
+        )
     
-    # Apply search filter
-    if search:
-        query = query.filter(
-            TestCase.name.contains(search) | 
-            TestCase.description.contains(search)
+    def build_query():
+        query = db.query(TestCase).filter(
+            TestCase.owner_id == user_id,
+            TestCase.is_active == True
         )
+        
+        # Apply search filter
+        if search:
+            query = query.filter(
+                TestCase.name.contains(search) | 
+                TestCase.description.contains(search)
+            )
+        
+        # Apply tags filter
+        if tags:
+            query = query.filter(TestCase.tags.contains(tags))
+        
+        return query.order_by(TestCase.id).offset(skip).limit(limit)
     
-    # Apply tags filter
-    if tags:
-        query = query.filter(TestCase.tags.contains(tags))
+    if stream:
+        return stream_query(build_query(), encode_test_case, stream)
     
-    test_cases = query.offset(skip).limit(limit).all()
-    return test_cases
+    return response_cache.respond(
+        request,
+        user_id,
+        lambda: test_cases_fingerprint(db, user_id),
+        lambda: [encode_test_case(test_case) for test_case in build_query()]
+    )
 
 @router.get("/{test_case_id}", response_model=TestCaseSchema)
 async def get_test_case(
@@ -100,7 +185,7 @@ async def get_test_case(
     
     return test_case
 
-@router.put("/{test_case_id}", response_model=TestCaseSchema)
+@router.put("/{test_case_id}", response_model=TestCaseSaved)
 async def update_test_case(
     test_case_id: int,
     test_case_update: TestCaseUpdate,
@@ -131,13 +216,32 @@ async def update_test_case(
                 detail="No valid test steps provided"
             )
         update_data["steps"] = validated_steps
+    if "capture_policy" in update_data:
+        update_data["capture_policy"] = validate_capture_policy(update_data["capture_policy"])
+    if "steps" in update_data or "dataset_id" in update_data:
+        _validate_dataset(
+            db, update_data.get("dataset_id", test_case.dataset_id), update_data.get("steps", test_case.steps), current_user["user_id"]
+        )
     
+    previous = content_of(test_case)
     for field, value in update_data.items():
         setattr(test_case, field, value)
     
-    db.commit()
+    try:
+        record_version(db, test_case, previous, current_user["user_id"])
+        db.commit()
+    except IntegrityError:
+        # Another save took the same version number
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Test case was modified concurrently; reload and retry"
+        )
     db.refresh(test_case)
+    response_cache.invalidate(current_user["user_id"])
     
+    if "steps" in update_data:
+        test_case.selector_warnings = review_steps(db, current_user["user_id"], update_data["steps"])
     return test_case
 
 @router.delete("/{test_case_id}", response_model=MessageResponse)
@@ -160,9 +264,192 @@ async def delete_test_case(
     
     test_case.is_active = False
     db.commit()
+    response_cache.invalidate(current_user["user_id"])
     
     return {"message": "Test case deleted successfully"}
 
+def _resolve_environment(db: Session, environment_id: Optional[int], environment_url: Optional[str], user_id: int):
+    """Target URL, routing profile and stored capture policy for a run, from the environment when one is given"""
+    routing_profile = None
+    capture_policy = None
+    if environment_id:
+        environment = db.query(Environment).filter(
+            Environment.id == environment_id,
+            Environment.owner_id == user_id,
+            Environment.is_active == True
+        ).first()
+        if not environment:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Environment not found"
+            )
+        environment_url = environment_url or environment.url
+        routing_profile = resolve_routing_profile(environment.routing_profile)
+        capture_policy = environment.capture_policy
+    return environment_url, routing_profile, capture_policy
+
+def _check_browser_minutes(db: Session, current_user: dict, run_counts: Optional[Dict[int, int]] = None):
+    """Reject new runs once the user's daily browser-minute quota is spent
+    
+    With run_counts ({test_case_id: runs}, for a batch) the runs' projected
+    minutes must also fit in what is left of the quota.
+    """
+    remaining = browser_minutes_remaining(db, current_user)
+    if remaining is None:
+        return
+    if remaining <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Daily quota of {browser_minutes_quota(current_user):g} browser minutes used up"
+        )
+    if run_counts:
+        projected = projected_browser_minutes(db, run_counts)
+        if projected > remaining:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Batch needs about {projected:.1f} browser minutes; {remaining:.1f} of the daily quota of {browser_minutes_quota(current_user):g} are left"
+            )
+
+async def _execute_run(
+    db: Session,
+    test_run: TestRun,
+    test_case: TestCase,
+    current_user: dict,
+    lane: str,
+    trace,
+    root_span,
+    environment_url: Optional[str] = None,
+    routing_profile: Optional[dict] = None,
+    har_mode: Optional[str] = None,
+    har_path: Optional[str] = None,
+    capture_layers: tuple = (),
+    dataset_row: Optional[dict] = None,
+    shared_prefix: Optional[dict] = None
+):
+    """Wait for a scheduler slot, execute the test and save its results onto test_run
+    
+    capture_layers are the stored capture policies of the environment and
+    suite; the test case's own policy is applied on top of them.
+    dataset_row is the row a dataset run's child binds its steps to.
+    shared_prefix is the run's part in a shared setup prefix group (see
+    prefix_planner.py); it's recorded on the run without the state file.
+    """
+    run_id = test_run.id
+    # End the session's transaction so its pooled connection isn't held while queued
+    db.commit()
+    try:
+        with trace.span("scheduler.wait", lane=lane) as wait_span:
+            ticket = await run_scheduler.acquire(run_id, current_user, lane)
+            wait_span.set_attribute("scheduler.wait_seconds", round(ticket.waited, 3))
+    except RunCancelled:
+        # The cancel endpoint already marked the run
+        db.refresh(test_run)
+        root_span.set_attribute("run.status", test_run.status)
+        return
+    
+    RUNS_ACTIVE.inc()
+    try:
+        # Prepare test case data; read before the commit below expires test_case
+        test_case_data = {
+            "id": test_case.id,
+            "version": test_case.version,
+            "name": test_case.name,
+            "steps": test_case.steps
+        }
+        timeout = test_case.timeout_seconds
+        capture_policy = resolve_capture_policy(*capture_layers, test_case.capture_policy)
+        prefix_record = {key: value for key, value in shared_prefix.items() if key not in ("state_path", "on_state")} if shared_prefix else None
+        
+        with trace.span("db.mark_running"):
+            test_run.status = "running"
+            test_run.test_case_version = test_case.version
+            test_run.steps_hash = steps_hash(test_case, environment_url)
+            test_run.started_at = datetime.utcnow()
+            if prefix_record:
+                test_run.shared_prefix = prefix_record
+            # Also returns the connection to the pool for the browser time
+            db.commit()
+        
+        # Execute test
+        with trace.span("executor.execute_test"):
+            result = await test_executor.execute_test(
+                test_case_data,
+                run_id,
+                environment_url,
+                routing_profile,
+                har_mode=har_mode,
+                har_path=har_path,
+                trace=trace,
+                timeout=timeout,
+                capture_policy=capture_policy,
+                dataset_row=dataset_row,
+                shared_prefix=shared_prefix
+            )
+        
+        # Compare step screenshots with their baselines; rows of a dataset
+        # differ by design, and baselines are per step, not per row
+        screenshots = result.get("step_screenshots")
+        if screenshots and dataset_row is None:
+            with trace.span("visual.compare", screenshots=len(screenshots)):
+                visual_diffs = await visual_diff_engine.compare_run(
+                    db, test_run.id, test_case.id, test_run.environment_id, test_case.steps, screenshots
+                )
+            test_run.visual_diffs = visual_diffs
+            result["artifact_bytes"] = (result.get("artifact_bytes") or 0) + sum(
+                artifact_store.size_of(Path(entry["diff_path"])) for entry in visual_diffs if entry.get("diff_path")
+            )
+            visual_change = summarize_changes(visual_diffs)
+            if visual_change and VISUAL_FAIL_ON_CHANGE and result.get("status") == "passed":
+                result["status"] = "failed"
+                result["error_message"] = visual_change
+        
+        # Update test run with results
+        with trace.span("db.save_results"):
+            test_run.status = result.get("status", "error")
+            test_run.execution_time = result.get("execution_time", 0)
+            test_run.result = result.get("stdout", "")
+            test_run.error_message = result.get("error_message") or result.get("stderr")
+            test_run.stderr = result.get("stderr")
+            test_run.screenshot_path = result.get("screenshot_path")
+            test_run.trace_path = result.get("trace_path")
+            test_run.har_path = result.get("har_path")
+            test_run.log_path = result.get("log_path")
+            test_run.report_summary = result.get("report_summary")
+            test_run.capture_policy = result.get("capture_policy")
+            test_run.artifact_bytes = result.get("artifact_bytes")
+            network_stats = result.get("network_stats")
+            if network_stats:
+                test_run.blocked_requests = network_stats.get("blocked", 0)
+                test_run.bytes_saved = network_stats.get("bytesSaved", 0)
+            if prefix_record and result.get("shared_prefix"):
+                prefix_record = {**prefix_record, **result["shared_prefix"]}
+                test_run.shared_prefix = prefix_record
+                SHARED_PREFIX_SECONDS_SAVED.inc(seconds_saved(prefix_record))
+            test_run.completed_at = datetime.utcnow()
+            
+            db.commit()
+            db.refresh(test_run)
+        
+        if result.get("selector_timings"):
+            with trace.span("db.record_selectors", samples=len(result["selector_timings"])):
+                try:
+                    record_resolutions(db, current_user["user_id"], test_case.id, test_run.id, result["selector_timings"])
+                except Exception as e:
+                    db.rollback()
+                    logger.warning(f"Failed to record selector timings of run {test_run.id}: {e}")
+        root_span.set_attribute("run.status", test_run.status)
+    
+    except Exception as e:
+        root_span.set_error(str(e))
+        test_run.status = "error"
+        test_run.error_message = str(e)
+        db.commit()
+        db.refresh(test_run)
+    finally:
+        RUNS_ACTIVE.dec()
+        run_scheduler.release(ticket)
+        response_cache.invalidate(current_user["user_id"])
+
 @router.post("/{test_case_id}/run", response_model=TestRunSchema)
 async def run_test_case(
     test_case_id: int,
@@ -170,7 +457,11 @@ async def run_test_case(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Execute a test case"""
+    """Execute a test case (interactive lane; waits for the result)
+    
+    A data-driven test case instead returns its dataset run at once, with
+    one child run per row queued in the batch lane.
+    """
     test_case = db.query(TestCase).filter(
         TestCase.id == test_case_id,
         TestCase.owner_id == current_user["user_id"]
@@ -182,65 +473,411 @@ async def run_test_case(
             detail="Test case not found"
         )
     
-    # Create test run record
-    test_run = TestRun(
-        test_case_id=test_case_id,
-        user_id=current_user["user_id"],
-        status="pending"
+    # Resolve HAR recording to replay, if requested
+    har_mode = run_request.har_mode
+    har_path = None
+    environment_id = run_request.environment_id
+    if har_mode not in (None, "record", "replay"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="har_mode must be 'record' or 'replay'"
+        )
+    if har_mode == "replay":
+        recording_query = db.query(TestRun).filter(
+            TestRun.test_case_id == test_case_id,
+            TestRun.har_mode == "record",
+            TestRun.status == "passed",
+            TestRun.har_path.isnot(None)
+        )
+        if run_request.har_run_id:
+            recording_query = recording_query.filter(TestRun.id == run_request.har_run_id)
+        recording = recording_query.order_by(TestRun.id.desc()).first()
+        if not recording or not test_executor.har_exists(recording.har_path):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No HAR recording available for this test case"
+            )
+        har_path = recording.har_path
+        # Replay against the same environment the HAR was captured from
+        environment_id = environment_id or recording.environment_id
+    
+    # Resolve target environment, its routing profile and capture policy
+    environment_url, routing_profile, environment_capture = _resolve_environment(
+        db, environment_id, run_request.environment_url, current_user["user_id"]
     )
     
-    db.add(test_run)
-    db.commit()
-    db.refresh(test_run)
+    # One run per dataset row, queued in the batch lane; the parent run is returned right away
+    if test_case.dataset_id:
+        if har_mode:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="HAR recording and replay aren't supported for data-driven test cases"
+            )
+        return queue_batch_runs(
+            db, current_user, [test_case], environment_id, environment_url, routing_profile, (environment_capture,)
+        )[0]
+    build = environment_build(db, environment_id)
     
-    # Execute test asynchronously
-    try:
-        test_run.status = "running"
-        test_run.started_at = db.query(TestRun).filter(TestRun.id == test_run.id).first().created_at
-        db.commit()
-        
-        # Prepare test case data
-        test_case_data = {
-            "name": test_case.name,
-            "steps": test_case.steps
-        }
-        
-        # Execute test
-        result = await test_executor.execute_test(
-            test_case_data,
-            test_run.id,
-            run_request.environment_url
+    # CI gating: an unchanged test against an unchanged environment build passed recently
+    reuse_result = run_request.reuse_result and har_mode is None
+    if reuse_result:
+        reusable = find_reusable_runs(
+            db, [test_case], environment_id, build, run_request.reuse_max_age_minutes, environment_url
         )
+        record_outcomes(len(reusable), 1 - len(reusable))
+        if reusable:
+            test_run = reused_run(reusable[test_case_id], test_case, current_user["user_id"])
+            db.add(test_run)
+            db.commit()
+            db.refresh(test_run)
+            response_cache.invalidate(current_user["user_id"])
+            return test_run
+    _check_browser_minutes(db, current_user)
+    
+    trace = start_run_trace(**{"test_case.id": test_case_id, "environment.id": environment_id, "har.mode": har_mode})
+    
+    with trace.span("run_test_case") as root_span:
+        # Create test run record
+        with trace.span("db.create_run"):
+            test_run = TestRun(
+                test_case_id=test_case_id,
+                user_id=current_user["user_id"],
+                environment_id=environment_id,
+                har_mode=har_mode,
+                environment_build=build,
+                reuse_status="miss" if reuse_result else None,
+                status="pending"
+            )
+            
+            db.add(test_run)
+            db.commit()
+            db.refresh(test_run)
+        trace.bind_run(test_run.id)
+        response_cache.invalidate(current_user["user_id"])
         
-        # Update test run with results
-        test_run.status = result.get("status", "error")
-        test_run.execution_time = result.get("execution_time", 0)
-        test_run.result = result.get("stdout", "")
-        test_run.error_message = result.get("stderr") or result.get("error_message")
-        test_run.screenshot_path = result.get("screenshot_path")
-        test_run.trace_path = result.get("trace_path")
-        test_run.completed_at = db.query(TestRun).filter(TestRun.id == test_run.id).first().created_at
-        
-        db.commit()
-        db.refresh(test_run)
-        
-    except Exception as e:
-        test_run.status = "error"
-        test_run.error_message = str(e)
-        db.commit()
-        db.refresh(test_run)
+        await _execute_run(
+            db, test_run, test_case, current_user, LANE_INTERACTIVE, trace, root_span,
+            environment_url, routing_profile, har_mode=har_mode, har_path=har_path,
+            capture_layers=(environment_capture,)
+        )
     
+    trace.export()
     return test_run
 
+# Batch runs in flight; held so their tasks aren't garbage collected
+_batch_tasks = set()
+
+async def _run_batch_item(
+    run_id: int,
+    test_case_id: int,
+    current_user: dict,
+    environment_url: Optional[str],
+    routing_profile: Optional[dict],
+    capture_layers: tuple = (),
+    dataset_row: Optional[dict] = None,
+    shared_prefix: Optional[dict] = None
+) -> Optional[dict]:
+    """Execute one queued batch run with its own session; the last row of a dataset run finishes its parent
+    
+    Returns what the run recorded about its shared prefix, if it had one.
+    """
+    # Spawned from the batch-run request; its SQL isn't that request's
+    detach_request()
+    db = SessionLocal()
+    try:
+        test_run = db.query(TestRun).filter(TestRun.id == run_id).first()
+        test_case = db.query(TestCase).filter(TestCase.id == test_case_id).first()
+        if test_run is None or test_case is None or test_run.status != "pending":
+            return
+        trace = start_run_trace(**{"test_case.id": test_case_id, "environment.id": test_run.environment_id, "run.lane": LANE_BATCH})
+        trace.bind_run(run_id)
+        with trace.span("run_test_case") as root_span:
+            await _execute_run(
+                db, test_run, test_case, current_user, LANE_BATCH, trace, root_span,
+                environment_url, routing_profile, capture_layers=capture_layers, dataset_row=dataset_row,
+                shared_prefix=shared_prefix
+            )
+        trace.export()
+        if test_run.parent_run_id and finish_parent(db, test_run.parent_run_id):
+            response_cache.invalidate(current_user["user_id"])
+        return test_run.shared_prefix
+    except Exception as e:
+        logger.error(f"Batch run {run_id} failed: {e}")
+    finally:
+        db.close()
+
+async def _run_prefix_group(
+    batch_id: str,
+    group: dict,
+    items: List[tuple],
+    current_user: dict,
+    environment_url: Optional[str],
+    routing_profile: Optional[dict],
+    capture_layers: tuple = ()
+):
+    """Run a shared prefix group: the leader first, then the others from the state it saves after the prefix
+    
+    The members start as soon as the leader reports the saved state, while
+    the leader runs on through its own steps.
+    """
+    state_path = test_executor.prefix_state_path(batch_id, group["key"])
+    (leader_run_id, leader_test_case_id), *members = items
+    base = {"group": group["key"], "steps": group["steps"]}
+    state_ready = asyncio.Event()
+    saved = {}
+    
+    def on_state(outcome: dict):
+        saved.update(outcome)
+        state_ready.set()
+    
+    waiting_run_ids.update(run_id for run_id, _ in members)
+    leader_task = None
+    try:
+        leader_task = asyncio.create_task(_run_batch_item(
+            leader_run_id, leader_test_case_id, current_user, environment_url, routing_profile, capture_layers,
+            shared_prefix={**base, "role": "leader", "state_path": str(state_path), "on_state": on_state}
+        ))
+        ready_task = asyncio.create_task(state_ready.wait())
+        await asyncio.wait({leader_task, ready_task}, return_when=asyncio.FIRST_COMPLETED)
+        ready_task.cancel()
+        if saved.get("url"):
+            member_prefix = {
+                **base, "role": "member", "restored": True, "state_path": str(state_path),
+                "url": saved["url"], "prefix_seconds": saved.get("prefix_seconds")
+            }
+        else:
+            # The leader ended without getting through the prefix; nothing to start from
+            member_prefix = {**base, "role": "member", "restored": False}
+        waiting_run_ids.difference_update(run_id for run_id, _ in members)
+        await asyncio.gather(leader_task, *(
+            _run_batch_item(
+                run_id, test_case_id, current_user, environment_url, routing_profile, capture_layers,
+                shared_prefix=member_prefix
+            )
+            for run_id, test_case_id in members
+        ))
+    finally:
+        waiting_run_ids.difference_update(run_id for run_id, _ in members)
+        if leader_task and not leader_task.done():
+            leader_task.cancel()
+        # Storage state holds session cookies; don't leave it behind
+        state_path.unlink(missing_ok=True)
+
+def _spawn(coroutine):
+    task = asyncio.create_task(coroutine)
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
+@router.post("/batch-run", response_model=List[TestRunSchema], status_code=status.HTTP_202_ACCEPTED)
+async def run_test_case_batch(
+    batch: BatchRunCreate,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue runs for many test cases (or a suite) in the batch lane; returns the pending runs immediately"""
+    test_case_ids = list(batch.test_case_ids)
+    suite_capture = None
+    if batch.suite_id:
+        suite = db.query(TestSuite).filter(
+            TestSuite.id == batch.suite_id,
+            TestSuite.owner_id == current_user["user_id"],
+            TestSuite.is_active == True
+        ).first()
+        if not suite:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Test suite not found"
+            )
+        test_case_ids = test_case_ids or list(suite.test_case_ids)
+        suite_capture = suite.capture_policy
+    if not test_case_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provide test_case_ids or a suite_id"
+        )
+    
+    test_cases = db.query(TestCase).filter(
+        TestCase.id.in_(test_case_ids),
+        TestCase.owner_id == current_user["user_id"]
+    ).all()
+    found = {test_case.id for test_case in test_cases}
+    missing = [test_case_id for test_case_id in test_case_ids if test_case_id not in found]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Test cases not found: {missing[:20]}"
+        )
+    
+    environment_url, routing_profile, environment_capture = _resolve_environment(
+        db, batch.environment_id, batch.environment_url, current_user["user_id"]
+    )
+    
+    by_id = {test_case.id: test_case for test_case in test_cases}
+    return queue_batch_runs(
+        db, current_user, [by_id[test_case_id] for test_case_id in test_case_ids],
+        batch.environment_id, environment_url, routing_profile, (environment_capture, suite_capture),
+        reuse_result=batch.reuse_result, reuse_max_age_minutes=batch.reuse_max_age_minutes,
+        share_prefixes=batch.share_prefixes
+    )
+
+def queue_batch_runs(
+    db: Session,
+    current_user: dict,
+    test_cases: List[TestCase],
+    environment_id: Optional[int],
+    environment_url: Optional[str],
+    routing_profile: Optional[dict],
+    capture_layers: tuple = (),
+    skip_duplicates: bool = False,
+    reuse_result: bool = False,
+    reuse_max_age_minutes: Optional[int] = None,
+    share_prefixes: Optional[bool] = None
+) -> List[TestRun]:
+    """Create pending runs and start them in the batch lane
+    
+    With skip_duplicates, a test case that already has a pending or running
+    run of its current version in the same environment isn't queued again.
+    With reuse_result, test cases with a reusable passing run get a copy of
+    it instead (see result_reuse.py). 429 when runs remain to execute and
+    the user's browser-minute quota is spent.
+    
+    A data-driven test case gets a parent run, returned in its place, and
+    a child run per dataset row; results are never reused for them.
+    
+    With share_prefixes (default SHARED_PREFIXES_ENABLED), runs opening
+    with the same setup steps run them once (see prefix_planner.py). All
+    the runs share a batch_id.
+    """
+    if skip_duplicates:
+        in_flight = db.query(TestRun.test_case_id, TestRun.test_case_version).filter(
+            TestRun.test_case_id.in_({test_case.id for test_case in test_cases}),
+            TestRun.environment_id == environment_id,
+            TestRun.status.in_(("pending", "running"))
+        ).all()
+        # Runs still pending when queued may not have their version yet
+        busy = {(test_case_id, version) for test_case_id, version in in_flight}
+        queued = []
+        for test_case in test_cases:
+            version = test_case.version or 1
+            if not busy & {(test_case.id, version), (test_case.id, None)}:
+                queued.append(test_case)
+                busy.add((test_case.id, version))
+        test_cases = queued
+    if not test_cases:
+        return []
+    
+    dataset_ids = {test_case.dataset_id for test_case in test_cases if test_case.dataset_id}
+    datasets = {}
+    if dataset_ids:
+        datasets = {dataset.id: dataset for dataset in db.query(Dataset).filter(
+            Dataset.id.in_(dataset_ids),
+            Dataset.is_active == True
+        )}
+        deleted = sorted(dataset_ids - set(datasets))
+        if deleted:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Test cases use deleted datasets: {deleted}"
+            )
+    
+    build = environment_build(db, environment_id)
+    reusable = find_reusable_runs(
+        db, [test_case for test_case in test_cases if not test_case.dataset_id], environment_id, build, reuse_max_age_minutes, environment_url
+    ) if reuse_result else {}
+    to_execute = [test_case for test_case in test_cases if test_case.id not in reusable]
+    if to_execute:
+        # Dataset test cases run once per row
+        run_counts: Dict[int, int] = {}
+        for test_case in to_execute:
+            rows = datasets[test_case.dataset_id].row_count if test_case.dataset_id else 1
+            run_counts[test_case.id] = run_counts.get(test_case.id, 0) + rows
+        _check_browser_minutes(db, current_user, run_counts)
+    if reuse_result:
+        record_outcomes(len(test_cases) - len(to_execute), len(to_execute))
+    
+    now = datetime.utcnow()
+    batch_id = uuid.uuid4().hex
+    test_runs = [
+        reused_run(reusable[test_case.id], test_case, current_user["user_id"]) if test_case.id in reusable else TestRun(
+            test_case_id=test_case.id,
+            user_id=current_user["user_id"],
+            environment_id=environment_id,
+            test_case_version=test_case.version or 1,
+            environment_build=build,
+            reuse_status="miss" if reuse_result and not test_case.dataset_id else None,
+            # A parent runs until its last row finishes (see dataset_runs.finish_parent)
+            dataset_id=test_case.dataset_id,
+            status="running" if test_case.dataset_id else "pending",
+            started_at=now if test_case.dataset_id else None
+        )
+        for test_case in test_cases
+    ]
+    for test_run in test_runs:
+        test_run.batch_id = batch_id
+    db.add_all(test_runs)
+    db.flush()
+    run_ids = [test_run.id for test_run in test_runs]
+    
+    # Runs to execute as they are, or in shared prefix groups; steps are read before the commit expires them
+    pending = [(test_run.id, test_case) for test_run, test_case in zip(test_runs, test_cases) if test_run.status == "pending"]
+    share_prefixes = SHARED_PREFIXES_ENABLED if share_prefixes is None else share_prefixes
+    groups = plan_shared_prefixes(
+        [(run_id, test_case.steps) for run_id, test_case in pending], environment_url
+    ) if share_prefixes and len(pending) > 1 else {}
+    grouped = {run_id for group in groups.values() for run_id in group["run_ids"]}
+    queued = [(run_id, test_case.id, None) for run_id, test_case in pending if run_id not in grouped]
+    test_case_of = {run_id: test_case.id for run_id, test_case in pending}
+    
+    parents = [(test_run, datasets[test_case.dataset_id]) for test_run, test_case in zip(test_runs, test_cases) if test_case.dataset_id]
+    if parents:
+        # One executemany for all rows, however many there are
+        db.execute(insert(TestRun), [
+            {
+                "test_case_id": parent.test_case_id,
+                "user_id": parent.user_id,
+                "environment_id": environment_id,
+                "test_case_version": parent.test_case_version,
+                "environment_build": build,
+                "batch_id": batch_id,
+                "parent_run_id": parent.id,
+                "dataset_row": index,
+                "status": "pending"
+            }
+            for parent, dataset in parents
+            for index in range(dataset.row_count)
+        ])
+        rows_of = {parent.id: dataset.rows for parent, dataset in parents}
+        children = db.query(TestRun.id, TestRun.test_case_id, TestRun.parent_run_id, TestRun.dataset_row).filter(
+            TestRun.parent_run_id.in_(rows_of)
+        ).all()
+    db.commit()
+    # Reload the expired runs in one query rather than a refresh each
+    db.query(TestRun).filter(TestRun.id.in_(run_ids)).all()
+    response_cache.invalidate(current_user["user_id"])
+    
+    if parents:
+        queued += [(child.id, child.test_case_id, rows_of[child.parent_run_id][child.dataset_row]) for child in children]
+    for run_id, test_case_id, dataset_row in queued:
+        _spawn(_run_batch_item(
+            run_id, test_case_id, current_user, environment_url, routing_profile, capture_layers, dataset_row
+        ))
+    for group in groups.values():
+        _spawn(_run_prefix_group(
+            batch_id, group, [(run_id, test_case_of[run_id]) for run_id in group["run_ids"]],
+            current_user, environment_url, routing_profile, capture_layers
+        ))
+    
+    return test_runs
+
 @router.get("/{test_case_id}/runs", response_model=List[TestRunSchema])
 async def get_test_case_runs(
     test_case_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=100),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get test runs for a specific test case"""
+    """Get test runs for a specific test case, including archived history"""
     # Verify test case ownership
     test_case = db.query(TestCase).filter(
         TestCase.id == test_case_id,
@@ -253,11 +890,129 @@ async def get_test_case_runs(
             detail="Test case not found"
         )
     
-    test_runs = db.query(TestRun).filter(
+    return merged_page(
+        db,
+        db.query(TestRun).filter(TestRun.test_case_id == test_case_id).order_by(TestRun.created_at.desc()),
+        archive_query_like(db, test_case_id=test_case_id),
+        skip,
+        limit
+    )
+
+def _get_owned_test_case(db: Session, test_case_id: int, user_id: int) -> TestCase:
+    test_case = db.query(TestCase).filter(
+        TestCase.id == test_case_id,
+        TestCase.owner_id == user_id
+    ).first()
+    if not test_case:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test case not found"
+        )
+    return test_case
+
+@router.get("/{test_case_id}/versions", response_model=List[TestCaseVersionSchema])
+async def list_test_case_versions(
+    test_case_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Saved versions of a test case, newest first"""
+    _get_owned_test_case(db, test_case_id, current_user["user_id"])
+    return db.query(TestCaseVersion).filter(
+        TestCaseVersion.test_case_id == test_case_id
+    ).order_by(TestCaseVersion.version.desc()).all()
+
+@router.get("/{test_case_id}/versions/diff")
+async def diff_test_case_versions(
+    test_case_id: int,
+    from_version: int = Query(..., alias="from", ge=1),
+    to_version: Optional[int] = Query(None, alias="to", ge=1),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """JSON Patch from one version to another (default: the current version)"""
+    test_case = _get_owned_test_case(db, test_case_id, current_user["user_id"])
+    diff = diff_versions(db, test_case_id, from_version, to_version or test_case.version)
+    if diff is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Version not found"
+        )
+    return diff
+
+@router.get("/{test_case_id}/versions/{version}")
+async def get_test_case_version(
+    test_case_id: int,
+    version: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Content of a test case as of one version"""
+    test_case = _get_owned_test_case(db, test_case_id, current_user["user_id"])
+    content = get_version(db, test_case_id, version)
+    if content is None:
+        # Test cases saved before versioning only have their current version
+        if version != test_case.version:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Version not found"
+            )
+        content = content_of(test_case)
+    return {"test_case_id": test_case_id, "version": version, **content}
+
+@router.get("/{test_case_id}/baselines", response_model=List[VisualBaselineSchema])
+async def list_visual_baselines(
+    test_case_id: int,
+    environment_id: Optional[int] = Query(None),
+    db: Session = Depends(get_read_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Screenshot baselines of a test case, optionally for one environment"""
+    _get_owned_test_case(db, test_case_id, current_user["user_id"])
+    query = db.query(VisualBaseline).filter(VisualBaseline.test_case_id == test_case_id)
+    if environment_id is not None:
+        query = query.filter(VisualBaseline.environment_id == environment_id)
+    return query.order_by(VisualBaseline.environment_id, VisualBaseline.step_index).all()
+
+@router.post("/{test_case_id}/baselines/approve", response_model=VisualBaselineSchema)
+async def approve_visual_baseline(
+    test_case_id: int,
+    approval: BaselineApprove,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Accept a run's screenshot as the new baseline for its step and environment"""
+    _get_owned_test_case(db, test_case_id, current_user["user_id"])
+    test_run = db.query(TestRun).filter(
+        TestRun.id == approval.run_id,
         TestRun.test_case_id == test_case_id
-    ).order_by(TestRun.created_at.desc()).offset(skip).limit(limit).all()
+    ).first()
+    if not test_run:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Test run not found"
+        )
     
-    return test_runs
+    visual_diffs = test_run.visual_diffs or []
+    entry = next((entry for entry in visual_diffs if entry["step"] == approval.step_index), None)
+    if entry is None or not Path(entry["actual_path"]).exists():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="The run has no screenshot for this step"
+        )
+    
+    baseline = await visual_diff_engine.approve(
+        db, test_case_id, test_run.environment_id, approval.step_index,
+        entry["actual_path"], test_run.id, current_user["user_id"]
+    )
+    # Reassigned so the JSON column is flagged as changed
+    test_run.visual_diffs = [
+        {**item, "status": "approved", "baseline_id": baseline.id} if item is entry else item
+        for item in visual_diffs
+    ]
+    db.commit()
+    response_cache.invalidate(current_user["user_id"])
+    return baseline
 
 @router.post("/example-test-case", response_model=TestCaseSchema)
 async def create_example_test_case(
@@ -372,7 +1127,10 @@ async def create_example_test_case(
     )
     
     db.add(example_test_case)
+    db.flush()
+    record_initial_version(db, example_test_case, current_user["user_id"])
     db.commit()
     db.refresh(example_test_case)
+    response_cache.invalidate(current_user["user_id"])
     
     return example_test_case
@@ -0,0 +1,160 @@
+"""
+Network routing profiles for generated Playwright scripts
+"""
+import json
+import re
+from typing import Dict, Any, List, Optional
+
+# Resource types understood by Playwright's request.resourceType()
+RESOURCE_TYPES = [
+    'document', 'stylesheet', 'image', 'media', 'font', 'script',
+    'texttrack', 'xhr', 'fetch', 'eventsource', 'websocket', 'manifest', 'other'
+]
+
+# Navigation wait states accepted by page.goto()
+WAIT_UNTIL_STATES = ['commit', 'domcontentloaded', 'load', 'networkidle']
+
+# Rough transfer sizes (bytes) used to estimate savings for aborted requests,
+# since a blocked request never reports its real size
+ESTIMATED_BYTES_BY_TYPE = {
+    'image': 40000,
+    'media': 250000,
+    'font': 60000,
+    'stylesheet': 30000,
+    'script': 80000,
+    'xhr': 2000,
+    'fetch': 2000,
+    'other': 5000,
+}
+
+# Telemetry and analytics endpoints D365 pages call on every load
+D365_TELEMETRY_PATTERNS = [
+    '**/browser.events.data.microsoft.com/**',
+    '**/mobile.events.data.microsoft.com/**',
+    '**/*.events.data.microsoft.com/**',
+    '**/dc.services.visualstudio.com/**',
+    '**/js.monitor.azure.com/**',
+    '**/*.applicationinsights.azure.com/**',
+    '**/web.vortex.data.microsoft.com/**',
+]
+
+# Built-in presets that an environment profile can extend
+BUILTIN_PROFILES: Dict[str, Dict[str, Any]] = {
+    'none': {
+        'block_resource_types': [],
+        'block_url_patterns': [],
+        'stubs': [],
+    },
+    'telemetry': {
+        'block_resource_types': [],
+        'block_url_patterns': D365_TELEMETRY_PATTERNS,
+        'stubs': [],
+    },
+    'd365-lean': {
+        'block_resource_types': ['image', 'media', 'font'],
+        'block_url_patterns': D365_TELEMETRY_PATTERNS,
+        'stubs': [],
+        'navigation_wait_until': 'domcontentloaded',
+    },
+}
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a Playwright-style URL glob into a JavaScript regex source"""
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '*':
+            if pattern[i:i + 2] == '**':
+                regex += '.*'
+                i += 2
+                continue
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '.'
+        else:
+            regex += re.escape(char)
+        i += 1
+    return f'^{regex}$'
+
+def resolve_routing_profile(profile: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Expand a stored profile's preset and merge its overrides"""
+    if not profile:
+        return None
+    
+    preset_name = profile.get('preset')
+    if preset_name and preset_name not in BUILTIN_PROFILES:
+        raise ValueError(f"Unknown routing profile preset: {preset_name}")
+    base = BUILTIN_PROFILES.get(preset_name or 'none', BUILTIN_PROFILES['none'])
+    
+    resolved = {
+        'block_resource_types': sorted(set(base.get('block_resource_types', [])) | set(profile.get('block_resource_types') or [])),
+        'block_url_patterns': list(dict.fromkeys(list(base.get('block_url_patterns', [])) + list(profile.get('block_url_patterns') or []))),
+        'allow_url_patterns': list(profile.get('allow_url_patterns') or []),
+        'stubs': list(base.get('stubs', [])) + list(profile.get('stubs') or []),
+        'navigation_wait_until': profile.get('navigation_wait_until') or base.get('navigation_wait_until'),
+    }
+    
+    invalid_types = [t for t in resolved['block_resource_types'] if t not in RESOURCE_TYPES]
+    if invalid_types:
+        raise ValueError(f"Unknown resource types: {', '.join(invalid_types)}")
+    if resolved['navigation_wait_until'] and resolved['navigation_wait_until'] not in WAIT_UNTIL_STATES:
+        raise ValueError(f"Unknown navigation wait state: {resolved['navigation_wait_until']}")
+    
+    if not any(resolved[key] for key in ('block_resource_types', 'block_url_patterns', 'stubs', 'navigation_wait_until')):
+        return None
+    return resolved
+
+def generate_routing_script(profile: Dict[str, Any]) -> List[str]:
+    """Render module-level JavaScript that applies a resolved profile via page.route"""
+    config = {
+        'blockTypes': profile.get('block_resource_types', []),
+        'blockPatterns': [glob_to_regex(p) for p in profile.get('block_url_patterns', [])],
+        'allowPatterns': [glob_to_regex(p) for p in profile.get('allow_url_patterns', [])],
+        'stubs': [
+            {
+                'pattern': glob_to_regex(stub['url_pattern']),
+                'status': stub.get('status', 200),
+                'contentType': stub.get('content_type', 'application/json'),
+                'body': stub.get('body', ''),
+            }
+            for stub in profile.get('stubs', [])
+        ],
+        'estimatedBytes': ESTIMATED_BYTES_BY_TYPE,
+    }
+    
+    return [
+        "// Network routing profile",
+        f"const __routing = {json.dumps(config)};",
+        "const __toRegex = (source) => new RegExp(source);",
+        "__routing.blockPatterns = __routing.blockPatterns.map(__toRegex);",
+        "__routing.allowPatterns = __routing.allowPatterns.map(__toRegex);",
+        "__routing.stubs.forEach((stub) => { stub.regex = __toRegex(stub.pattern); });",
+        "const __routeStats = { blocked: 0, stubbed: 0, bytesSaved: 0, byType: {} };",
+        "",
+        "async function __applyRoutingProfile(route) {",
+        "  const request = route.request();",
+        "  const url = request.url();",
+        "  const type = request.resourceType();",
+        "  if (__routing.allowPatterns.some((re) => re.test(url))) {",
+        "    return route.fallback();",
+        "  }",
+        "  const stub = __routing.stubs.find((s) => s.regex.test(url));",
+        "  if (stub) {",
+        "    __routeStats.stubbed += 1;",
+        "    return route.fulfill({ status: stub.status, contentType: stub.contentType, body: stub.body });",
+        "  }",
+        "  if (__routing.blockTypes.includes(type) || __routing.blockPatterns.some((re) => re.test(url))) {",
+        "    __routeStats.blocked += 1;",
+        "    __routeStats.bytesSaved += __routing.estimatedBytes[type] || __routing.estimatedBytes.other;",
+        "    __routeStats.byType[type] = (__routeStats.byType[type] || 0) + 1;",
+        "    return route.abort('blockedbyclient');",
+        "  }",
+        "  return route.fallback();",
+        "}",
+        "",
+        "test.afterEach(async () => {",
+        "  __emit('route_stats', __routeStats);",
+        "});",
+        "",
+    ]
@@ -0,0 +1,188 @@
+"""
+Cron schedules that queue batch runs of a test case, a suite or a tag query
+
+An in-process ticker checks for due schedules every SCHEDULE_TICK_SECONDS:
+  - each tick starts a stable pseudo-random 0..jitter_seconds later, so
+    schedules sharing a cron expression don't all hit the runners and the
+    D365 org at the same second
+  - ticks missed while the server was down are coalesced into one fire
+  - a test case that already has a pending or running run of its current
+    version in the schedule's environment isn't queued again
+Schedules are claimed with a conditional UPDATE, so several server
+processes sharing the database fire each tick once.
+"""
+import os
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from models import RunSchedule, TestCase, TestSuite, User
+from cron import CronExpression
+from auth import user_context
+
+logger = logging.getLogger(__name__)
+
+SCHEDULES_ENABLED = os.getenv("SCHEDULES_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULE_TICK_SECONDS = float(os.getenv("SCHEDULE_TICK_SECONDS", "30"))
+# Missed ticks counted per fire after downtime; the fire happens once regardless
+SCHEDULE_MAX_COALESCED = 1000
+
+def parse_schedule(cron: str, tz: str) -> CronExpression:
+    """CronExpression for a schedule; ValueError for a bad expression or time zone"""
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown time zone: {tz}")
+    return CronExpression(cron, tz)
+
+def jitter_offset(schedule_id: int, tick: datetime, jitter_seconds: int) -> timedelta:
+    """Stable per schedule and tick, so a restart doesn't move a pending start"""
+    if not jitter_seconds:
+        return timedelta()
+    return timedelta(seconds=zlib.crc32(f"{schedule_id}:{tick.isoformat()}".encode()) % (jitter_seconds + 1))
+
+def next_fire(schedule: RunSchedule, after: datetime) -> Tuple[datetime, datetime]:
+    """Next cron tick after `after` and the time its runs start"""
+    tick = parse_schedule(schedule.cron, schedule.timezone).next_after(after)
+    return tick, tick + jitter_offset(schedule.id, tick, schedule.jitter_seconds)
+
+def upcoming_fires(schedule: RunSchedule, count: int) -> List[Dict[str, datetime]]:
+    fires = []
+    after = datetime.utcnow()
+    for tick in parse_schedule(schedule.cron, schedule.timezone).iter_after(after):
+        if len(fires) >= count:
+            break
+        fires.append({"tick": tick, "run_at": tick + jitter_offset(schedule.id, tick, schedule.jitter_seconds)})
+    return fires
+
+def match_tags(tags: str, query: str) -> bool:
+    """All plain terms of the query are among the tags and no !term is"""
+    present = {tag.strip().lower() for tag in (tags or "").split(",") if tag.strip()}
+    for term in (term.strip().lower() for term in query.split(",")):
+        if term.startswith("!"):
+            if term[1:] in present:
+                return False
+        elif term and term not in present:
+            return False
+    return True
+
+def resolve_targets(db: Session, schedule: RunSchedule) -> Tuple[List[TestCase], Any]:
+    """The schedule's active test cases and the suite capture policy, if it targets a suite"""
+    query = db.query(TestCase).filter(TestCase.owner_id == schedule.owner_id, TestCase.is_active == True)
+    if schedule.test_case_id:
+        return query.filter(TestCase.id == schedule.test_case_id).all(), None
+    if schedule.suite_id:
+        suite = db.query(TestSuite).filter(
+            TestSuite.id == schedule.suite_id,
+            TestSuite.owner_id == schedule.owner_id,
+            TestSuite.is_active == True
+        ).first()
+        if not suite:
+            return [], None
+        by_id = {test_case.id: test_case for test_case in query.filter(TestCase.id.in_(suite.test_case_ids))}
+        return [by_id[test_case_id] for test_case_id in dict.fromkeys(suite.test_case_ids) if test_case_id in by_id], suite.capture_policy
+    return [test_case for test_case in query.order_by(TestCase.id) if match_tags(test_case.tags, schedule.tag_query)], None
+
+def _claim(db: Session, schedule: RunSchedule, now: datetime) -> int:
+    """Advance a due schedule past `now`; returns the ticks covered, 0 if another process claimed it"""
+    cron = parse_schedule(schedule.cron, schedule.timezone)
+    ticks = 1
+    tick = schedule.next_tick_at
+    while ticks < SCHEDULE_MAX_COALESCED:
+        tick = cron.next_after(tick)
+        if tick > now:
+            break
+        ticks += 1
+    next_tick, next_run = next_fire(schedule, now)
+    claimed = db.query(RunSchedule).filter(
+        RunSchedule.id == schedule.id,
+        RunSchedule.next_run_at == schedule.next_run_at
+    ).update({
+        RunSchedule.next_tick_at: next_tick,
+        RunSchedule.next_run_at: next_run,
+        RunSchedule.last_tick_at: schedule.next_tick_at,
+        RunSchedule.last_run_at: now
+    }, synchronize_session=False)
+    db.commit()
+    return ticks if claimed else 0
+
+def fire_schedule(db: Session, schedule: RunSchedule, ticks: int) -> Dict[str, Any]:
+    """Queue the runs of one claimed fire; must run on the event loop"""
+    # Imported here: the tests router imports most of the application
+    from routers.tests import queue_batch_runs, _resolve_environment
+    
+    result = {"tick": schedule.last_tick_at.isoformat(), "coalesced_ticks": ticks - 1, "queued": [], "skipped_duplicates": 0}
+    owner = db.query(User).filter(User.id == schedule.owner_id).first()
+    if owner is None or owner.is_active is False:
+        result["error"] = "Schedule owner is inactive"
+        return result
+    current_user = user_context(owner)
+    test_cases, suite_capture = resolve_targets(db, schedule)
+    if not test_cases:
+        result["error"] = "No active test cases match the schedule"
+        return result
+    try:
+        environment_url, routing_profile, environment_capture = _resolve_environment(
+            db, schedule.environment_id, None, schedule.owner_id
+        )
+        test_runs = queue_batch_runs(
+            db, current_user, test_cases, schedule.environment_id, environment_url, routing_profile,
+            (environment_capture, suite_capture), skip_duplicates=True
+        )
+    except HTTPException as e:
+        result["error"] = e.detail
+        return result
+    
+    result["queued"] = [test_run.id for test_run in test_runs]
+    result["skipped_duplicates"] = len(test_cases) - len(test_runs)
+    return result
+
+def run_due_schedules(db: Session, now: datetime = None) -> int:
+    """Fire every due schedule once; returns how many fired"""
+    now = now or datetime.utcnow()
+    due = db.query(RunSchedule).filter(
+        RunSchedule.is_active == True,
+        RunSchedule.next_run_at <= now
+    ).order_by(RunSchedule.next_run_at).all()
+    
+    fired = 0
+    for schedule in due:
+        try:
+            ticks = _claim(db, schedule, now)
+            if not ticks:
+                continue
+            db.refresh(schedule)
+            result = fire_schedule(db, schedule, ticks)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Schedule {schedule.id} failed to fire: {e}")
+            result = {"tick": now.isoformat(), "error": str(e)}
+        schedule.last_result = result
+        db.commit()
+        fired += 1
+        if result.get("error"):
+            logger.warning(f"Schedule {schedule.id} queued nothing: {result['error']}")
+        else:
+            logger.info(
+                f"Schedule {schedule.id} queued {len(result['queued'])} runs, skipped {result['skipped_duplicates']} "
+                f"already in flight, coalesced {result['coalesced_ticks']} missed ticks"
+            )
+    return fired
+
+async def schedule_loop(session_factory):
+    """Check for due schedules every SCHEDULE_TICK_SECONDS"""
+    while True:
+        await asyncio.sleep(SCHEDULE_TICK_SECONDS)
+        db = session_factory()
+        try:
+            run_due_schedules(db)
+        except Exception as e:
+            logger.error(f"Schedule tick failed: {e}")
+        finally:
+            db.close()
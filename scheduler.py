@@ -0,0 +1,269 @@
+"""
+Fair-share admission of pending runs onto the shared execution pool
+
+Runs wait in `pending` until the scheduler grants them one of
+SCHEDULER_MAX_CONCURRENT_RUNS slots. Waiting runs are ordered by:
+  - lane: interactive single runs go before bulk batches, but batches get
+    one of every BATCH_LANE_SHARE dispatches while both lanes have work
+  - tenant: weighted fair queuing (start-time virtual clocks charged in
+    browser-seconds) across teams, or users without a team
+  - user: the same fair queuing between users of one team
+A user never holds more slots than their concurrent-run quota; runs over the
+quota stay queued while other users' runs are dispatched.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import TestRun
+from metrics import RUNS_QUEUED, SCHEDULER_WAIT, SCHEDULER_QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+LANE_INTERACTIVE = "interactive"
+LANE_BATCH = "batch"
+LANES = (LANE_INTERACTIVE, LANE_BATCH)
+
+SCHEDULER_MAX_CONCURRENT_RUNS = int(os.getenv("SCHEDULER_MAX_CONCURRENT_RUNS", "4"))
+BATCH_LANE_SHARE = int(os.getenv("BATCH_LANE_SHARE", "4"))
+# Charged to a tenant when a run starts, corrected to the real duration when it ends
+ESTIMATED_RUN_SECONDS = float(os.getenv("SCHEDULER_ESTIMATED_RUN_SECONDS", "60"))
+# e.g. {"team:payments": 2, "user:17": 0.5}; unlisted tenants weigh 1
+TENANT_WEIGHTS: Dict[str, float] = json.loads(os.getenv("SCHEDULER_TENANT_WEIGHTS", "{}"))
+
+# Defaults for users without their own quota (0 = unlimited browser minutes)
+DEFAULT_MAX_CONCURRENT_RUNS = int(os.getenv("USER_MAX_CONCURRENT_RUNS", "2"))
+DEFAULT_BROWSER_MINUTES_PER_DAY = float(os.getenv("USER_BROWSER_MINUTES_PER_DAY", "0"))
+
+def tenant_for(user: Dict[str, Any]) -> str:
+    return f"team:{user['team']}" if user.get("team") else f"user:{user['user_id']}"
+
+def concurrent_run_quota(user: Dict[str, Any]) -> int:
+    return user.get("max_concurrent_runs") or DEFAULT_MAX_CONCURRENT_RUNS
+
+def browser_minutes_quota(user: Dict[str, Any]) -> float:
+    quota = user.get("browser_minutes_per_day")
+    return DEFAULT_BROWSER_MINUTES_PER_DAY if quota is None else quota
+
+def browser_minutes_used(db: Session, user_id: int) -> float:
+    """Browser minutes the user's runs consumed over the last 24 hours"""
+    seconds = db.query(func.sum(TestRun.execution_time)).filter(
+        TestRun.user_id == user_id,
+        TestRun.created_at >= datetime.utcnow() - timedelta(days=1)
+    ).scalar()
+    return (seconds or 0) / 60
+
+def browser_minutes_remaining(db: Session, user: Dict[str, Any]) -> Optional[float]:
+    """Minutes left in the user's rolling daily quota, or None when unlimited"""
+    quota = browser_minutes_quota(user)
+    if not quota:
+        return None
+    return max(0.0, quota - browser_minutes_used(db, user["user_id"]))
+
+def projected_browser_minutes(db: Session, run_counts: Dict[int, int]) -> float:
+    """Browser minutes a set of runs is expected to take, from run_counts {test_case_id: runs}
+    
+    Each test case is charged the average duration of its runs over the last
+    week, or ESTIMATED_RUN_SECONDS when it has none. Dataset parents take no
+    browser time themselves and are left out of the average.
+    """
+    averages = dict(db.query(TestRun.test_case_id, func.avg(TestRun.execution_time)).filter(
+        TestRun.test_case_id.in_(run_counts),
+        TestRun.dataset_id.is_(None),
+        TestRun.execution_time.isnot(None),
+        TestRun.created_at >= datetime.utcnow() - timedelta(days=7)
+    ).group_by(TestRun.test_case_id).all())
+    seconds = sum((averages.get(test_case_id) or ESTIMATED_RUN_SECONDS) * count for test_case_id, count in run_counts.items())
+    return seconds / 60
+
+class RunCancelled(Exception):
+    """The run was cancelled while waiting for a slot"""
+
+class _Ticket:
+    __slots__ = ("run_id", "user_id", "tenant", "lane", "quota", "future", "enqueued_at", "started_at")
+    
+    def __init__(self, run_id: int, user_id: int, tenant: str, lane: str, quota: int):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.tenant = tenant
+        self.lane = lane
+        self.quota = quota
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+    
+    @property
+    def waited(self) -> float:
+        return (self.started_at or time.monotonic()) - self.enqueued_at
+
+class FairShareScheduler:
+    def __init__(self, max_concurrent: int = SCHEDULER_MAX_CONCURRENT_RUNS):
+        self.max_concurrent = max_concurrent
+        # lane -> tenant -> user_id -> FIFO of waiting tickets
+        self._waiting: Dict[str, Dict[str, Dict[int, Deque[_Ticket]]]] = {lane: {} for lane in LANES}
+        self._running = 0
+        self._running_by_user: Dict[int, int] = {}
+        # Virtual clocks, in weighted browser-seconds
+        self._clock = 0.0
+        self._tenant_vtime: Dict[str, float] = {}
+        self._user_vtime: Dict[int, float] = {}
+        self._user_clock: Dict[str, float] = {}
+        self._interactive_streak = 0
+    
+    async def acquire(self, run_id: int, user: Dict[str, Any], lane: str = LANE_INTERACTIVE) -> "_Ticket":
+        """Wait for an execution slot; pass the returned ticket to release() when done
+        
+        Raises RunCancelled if cancel() drops the run while it waits.
+        """
+        ticket = _Ticket(run_id, user["user_id"], tenant_for(user), lane, concurrent_run_quota(user))
+        self._enqueue(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket.future.cancelled() and not self._discard(ticket):
+                raise RunCancelled(run_id)
+            if ticket.future.done() and not ticket.future.cancelled():
+                self.release(ticket)
+            raise
+        ticket.started_at = time.monotonic()
+        return ticket
+    
+    def release(self, ticket: "_Ticket"):
+        """Return a slot, charging the tenant for the browser time actually used"""
+        elapsed = time.monotonic() - ticket.started_at if ticket.started_at else 0.0
+        self._charge(ticket, elapsed - ESTIMATED_RUN_SECONDS)
+        self._running -= 1
+        remaining = self._running_by_user.get(ticket.user_id, 1) - 1
+        if remaining:
+            self._running_by_user[ticket.user_id] = remaining
+        else:
+            self._running_by_user.pop(ticket.user_id, None)
+        self._dispatch()
+    
+    def cancel(self, run_id: int) -> bool:
+        """Drop a waiting run from the queue; False if it isn't queued"""
+        for tenants in self._waiting.values():
+            for users in tenants.values():
+                for queue in users.values():
+                    for ticket in queue:
+                        if ticket.run_id == run_id:
+                            self._discard(ticket)
+                            ticket.future.cancel()
+                            return True
+        return False
+    
+    def status(self) -> Dict[str, Any]:
+        queued = {
+            lane: sum(len(queue) for users in tenants.values() for queue in users.values())
+            for lane, tenants in self._waiting.items()
+        }
+        return {"running": self._running, "max_concurrent": self.max_concurrent, "queued": queued}
+    
+    @property
+    def queued_run_ids(self) -> set:
+        return {
+            ticket.run_id
+            for tenants in self._waiting.values()
+            for users in tenants.values()
+            for queue in users.values()
+            for ticket in queue
+        }
+    
+    def position(self, run_id: int) -> Optional[int]:
+        """Rough queue position of a waiting run (1 = next in its user's queue)"""
+        for tenants in self._waiting.values():
+            for users in tenants.values():
+                for queue in users.values():
+                    for index, ticket in enumerate(queue):
+                        if ticket.run_id == run_id:
+                            return index + 1
+        return None
+    
+    def _enqueue(self, ticket: _Ticket):
+        tenants = self._waiting[ticket.lane]
+        tenants.setdefault(ticket.tenant, {}).setdefault(ticket.user_id, deque()).append(ticket)
+        RUNS_QUEUED.inc()
+        SCHEDULER_QUEUE_DEPTH.inc(lane=ticket.lane)
+        self._dispatch()
+    
+    def _discard(self, ticket: _Ticket) -> bool:
+        users = self._waiting[ticket.lane].get(ticket.tenant, {})
+        queue = users.get(ticket.user_id)
+        if not queue or ticket not in queue:
+            return False
+        queue.remove(ticket)
+        self._prune(ticket)
+        RUNS_QUEUED.dec()
+        SCHEDULER_QUEUE_DEPTH.dec(lane=ticket.lane)
+        return True
+    
+    def _prune(self, ticket: _Ticket):
+        tenants = self._waiting[ticket.lane]
+        users = tenants[ticket.tenant]
+        if not users[ticket.user_id]:
+            del users[ticket.user_id]
+        if not users:
+            del tenants[ticket.tenant]
+    
+    def _weight(self, tenant: str) -> float:
+        return float(TENANT_WEIGHTS.get(tenant, 1.0)) or 1.0
+    
+    def _pick(self, lane: str) -> Optional[_Ticket]:
+        """Head ticket of the least-served eligible user in the least-served tenant"""
+        best = None
+        best_key = None
+        for tenant, users in self._waiting[lane].items():
+            tenant_vtime = max(self._tenant_vtime.get(tenant, 0.0), self._clock)
+            user_clock = self._user_clock.get(tenant, 0.0)
+            for user_id, queue in users.items():
+                if self._running_by_user.get(user_id, 0) >= queue[0].quota:
+                    continue
+                key = (tenant_vtime, max(self._user_vtime.get(user_id, 0.0), user_clock), queue[0].enqueued_at)
+                if best_key is None or key < best_key:
+                    best, best_key = queue[0], key
+        return best
+    
+    def _next_ticket(self) -> Optional[_Ticket]:
+        interactive = self._pick(LANE_INTERACTIVE)
+        batch = self._pick(LANE_BATCH)
+        if interactive and batch and self._interactive_streak >= BATCH_LANE_SHARE - 1:
+            return batch
+        return interactive or batch
+    
+    def _charge(self, ticket: _Ticket, seconds: float):
+        weighted = seconds / self._weight(ticket.tenant)
+        self._tenant_vtime[ticket.tenant] = self._tenant_vtime.get(ticket.tenant, self._clock) + weighted
+        self._user_vtime[ticket.user_id] = self._user_vtime.get(ticket.user_id, 0.0) + seconds
+    
+    def _dispatch(self):
+        while self._running < self.max_concurrent:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+            self._discard(ticket)
+            self._interactive_streak = self._interactive_streak + 1 if ticket.lane == LANE_INTERACTIVE else 0
+            
+            # Start-time fair queuing: the clock advances to the start tag of the
+            # dispatched run, so idle tenants and users rejoin at it instead of banking credit
+            self._clock = max(self._tenant_vtime.get(ticket.tenant, 0.0), self._clock)
+            self._tenant_vtime[ticket.tenant] = self._clock
+            user_clock = max(self._user_vtime.get(ticket.user_id, 0.0), self._user_clock.get(ticket.tenant, 0.0))
+            self._user_clock[ticket.tenant] = user_clock
+            self._user_vtime[ticket.user_id] = user_clock
+            self._charge(ticket, ESTIMATED_RUN_SECONDS)
+            
+            self._running += 1
+            self._running_by_user[ticket.user_id] = self._running_by_user.get(ticket.user_id, 0) + 1
+            SCHEDULER_WAIT.observe(time.monotonic() - ticket.enqueued_at, tenant=ticket.tenant, lane=ticket.lane)
+            ticket.future.set_result(None)
+
+# Global scheduler for the execution pool
+run_scheduler = FairShareScheduler()
@@ -1,7 +1,7 @@
 """
 Pydantic schemas for request/response validation
 """
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 
@@ -20,6 +20,7 @@ class UserLogin(BaseModel):
 class User(UserBase):
     id: int
     is_active: bool
+    team: Optional[str] = None
     created_at: datetime
     
     class Config:
@@ -29,6 +30,15 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+# Artifact capture policy (see capture_policy.py)
+class CapturePolicy(BaseModel):
+    preset: Optional[str] = None  # off, full, retain-on-failure, on-first-retry, sampled, screenshot-only, video
+    trace: Optional[str] = None  # off, on, retain-on-failure, on-first-retry, sampled
+    trace_sample_rate: Optional[int] = Field(None, ge=1, le=10000)  # sampled: keep 1 in N passing traces
+    screenshot: Optional[str] = None  # off, on, only-on-failure
+    video: Optional[str] = None  # off, on, retain-on-failure, on-first-retry
+    retries: Optional[int] = Field(None, ge=0, le=3)
+
 # Test Case schemas
 class TestStepBase(BaseModel):
     type: str  # navigate, click, fill, verify, wait, condition, break_if, loop_until
@@ -44,6 +54,9 @@ class TestStepBase(BaseModel):
     break_on_condition: Optional[bool] = None  # True = pass, False = fail
     max_attempts: Optional[int] = None  # For loop_until steps
     on_failure: Optional[str] = None  # continue, break_pass, break_fail
+    # Screenshot steps: dynamic content left out of visual comparison
+    mask: Optional[List[str]] = None  # Selectors painted over by Playwright
+    mask_regions: Optional[List[Dict[str, int]]] = None  # {x, y, width, height} in pixels, ignored by the diff
 
 class TestCaseBase(BaseModel):
     name: str
@@ -51,6 +64,9 @@ class TestCaseBase(BaseModel):
     steps: List[TestStepBase]
     expected_result: str = "pass"
     tags: Optional[str] = None
+    timeout_seconds: Optional[int] = Field(None, ge=1)  # Run wall-clock limit; server default when unset
+    capture_policy: Optional[CapturePolicy] = None
+    dataset_id: Optional[int] = None  # Runs fan out into one run per row, bound to the steps' {{placeholders}}
 
 class TestCaseCreate(TestCaseBase):
     pass
@@ -61,11 +77,15 @@ class TestCaseUpdate(BaseModel):
     steps: Optional[List[TestStepBase]] = None
     expected_result: Optional[str] = None
     tags: Optional[str] = None
+    timeout_seconds: Optional[int] = Field(None, ge=1)
+    capture_policy: Optional[CapturePolicy] = None
+    dataset_id: Optional[int] = None
     is_active: Optional[bool] = None
 
 class TestCase(TestCaseBase):
     id: int
     owner_id: int
+    version: int = 1
     is_active: bool
     created_at: datetime
     updated_at: Optional[datetime] = None
@@ -73,10 +93,60 @@ class TestCase(TestCaseBase):
     class Config:
         from_attributes = True
 
+class TestCaseVersion(BaseModel):
+    version: int
+    is_snapshot: bool
+    payload_bytes: Optional[int] = None
+    created_by: Optional[int] = None
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class TestCaseSaved(TestCase):
+    selector_warnings: List[Dict[str, Any]] = []  # Slow, flaky or brittle selectors (see selector_index.py)
+
+# Dataset schemas
+class DatasetCreate(BaseModel):
+    name: str
+    description: Optional[str] = None
+    rows: Optional[List[Dict[str, Any]]] = None  # JSON rows; or
+    csv: Optional[str] = None  # CSV text with a header line
+
+class Dataset(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    columns: List[str]
+    row_count: int
+    owner_id: int
+    is_active: bool
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
+class DatasetDetail(Dataset):
+    rows: List[Dict[str, str]]
+
 # Test Run schemas
 class TestRunCreate(BaseModel):
     test_case_id: int
     environment_url: Optional[str] = None
+    environment_id: Optional[int] = None
+    har_mode: Optional[str] = None  # record, replay
+    har_run_id: Optional[int] = None  # Recording to replay; defaults to the latest passing one
+    reuse_result: bool = False  # Return a recent passing run of the same steps and environment build instead of executing
+    reuse_max_age_minutes: Optional[int] = Field(None, ge=0)  # Defaults to RESULT_REUSE_MAX_AGE_MINUTES
+
+class BatchRunCreate(BaseModel):
+    test_case_ids: List[int] = Field([], max_length=1000)  # Defaults to the suite's test cases
+    suite_id: Optional[int] = None  # Applies the suite's capture policy
+    environment_url: Optional[str] = None
+    environment_id: Optional[int] = None
+    reuse_result: bool = False
+    reuse_max_age_minutes: Optional[int] = Field(None, ge=0)
+    share_prefixes: Optional[bool] = None  # Run common setup steps once; defaults to SHARED_PREFIXES_ENABLED
 
 class TestRun(BaseModel):
     id: int
@@ -88,6 +158,25 @@ class TestRun(BaseModel):
     screenshot_path: Optional[str] = None
     trace_path: Optional[str] = None
     error_message: Optional[str] = None
+    environment_id: Optional[int] = None
+    blocked_requests: Optional[int] = None
+    bytes_saved: Optional[int] = None
+    har_mode: Optional[str] = None
+    har_path: Optional[str] = None
+    log_path: Optional[str] = None
+    report_summary: Optional[Dict[str, Any]] = None
+    capture_policy: Optional[str] = None
+    artifact_bytes: Optional[int] = None
+    visual_diffs: Optional[List[Dict[str, Any]]] = None
+    test_case_version: Optional[int] = None
+    environment_build: Optional[str] = None
+    reuse_status: Optional[str] = None  # hit: copied from reused_from_run_id without executing
+    reused_from_run_id: Optional[int] = None
+    dataset_id: Optional[int] = None  # Parent of a dataset fan-out; report_summary sums up its rows
+    parent_run_id: Optional[int] = None
+    dataset_row: Optional[int] = None
+    batch_id: Optional[str] = None  # See /api/results/batches/{batch_id}/shared-prefixes
+    shared_prefix: Optional[Dict[str, Any]] = None
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     created_at: datetime
@@ -100,10 +189,17 @@ class TestSuiteBase(BaseModel):
     name: str
     description: Optional[str] = None
     test_case_ids: List[int]
+    capture_policy: Optional[CapturePolicy] = None
 
 class TestSuiteCreate(TestSuiteBase):
     pass
 
+class TestSuiteUpdate(BaseModel):
+    name: Optional[str] = None
+    description: Optional[str] = None
+    test_case_ids: Optional[List[int]] = None
+    capture_policy: Optional[CapturePolicy] = None
+
 class TestSuite(TestSuiteBase):
     id: int
     owner_id: int
@@ -113,15 +209,81 @@ class TestSuite(TestSuiteBase):
     class Config:
         from_attributes = True
 
+# Run schedule schemas
+class RunScheduleBase(BaseModel):
+    name: str
+    cron: str  # "0 2 * * 1-5", "@daily", ...
+    timezone: str = "UTC"  # IANA zone the cron expression is evaluated in
+    test_case_id: Optional[int] = None  # Exactly one of test_case_id, suite_id, tag_query
+    suite_id: Optional[int] = None
+    tag_query: Optional[str] = None  # "regression,sales" needs both tags; "!slow" excludes
+    environment_id: Optional[int] = None
+    jitter_seconds: int = Field(300, ge=0, le=86400)
+
+class RunScheduleCreate(RunScheduleBase):
+    pass
+
+class RunScheduleUpdate(BaseModel):
+    name: Optional[str] = None
+    cron: Optional[str] = None
+    timezone: Optional[str] = None
+    test_case_id: Optional[int] = None
+    suite_id: Optional[int] = None
+    tag_query: Optional[str] = None
+    environment_id: Optional[int] = None
+    jitter_seconds: Optional[int] = Field(None, ge=0, le=86400)
+    is_active: Optional[bool] = None
+
+class RunSchedule(RunScheduleBase):
+    id: int
+    owner_id: int
+    is_active: bool
+    next_tick_at: Optional[datetime] = None
+    next_run_at: Optional[datetime] = None
+    last_tick_at: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+    last_result: Optional[Dict[str, Any]] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # Environment schemas
+class RoutingStub(BaseModel):
+    url_pattern: str  # Playwright-style glob, e.g. **/api/data/v9.2/usersettings*
+    status: int = 200
+    content_type: str = "application/json"
+    body: str = ""
+
+class RoutingProfile(BaseModel):
+    preset: Optional[str] = None  # none, telemetry, d365-lean
+    block_resource_types: List[str] = []  # image, font, media, stylesheet, ...
+    block_url_patterns: List[str] = []
+    allow_url_patterns: List[str] = []  # Always passed through, even if blocked above
+    stubs: List[RoutingStub] = []
+    navigation_wait_until: Optional[str] = None  # commit, domcontentloaded, load, networkidle
+
 class EnvironmentBase(BaseModel):
     name: str
     url: str
     description: Optional[str] = None
+    routing_profile: Optional[RoutingProfile] = None
+    capture_policy: Optional[CapturePolicy] = None
+    build_version: Optional[str] = None  # Deployed build marker; result reuse requires it unchanged
 
 class EnvironmentCreate(EnvironmentBase):
     pass
 
+class EnvironmentUpdate(BaseModel):
+    name: Optional[str] = None
+    url: Optional[str] = None
+    description: Optional[str] = None
+    routing_profile: Optional[RoutingProfile] = None
+    capture_policy: Optional[CapturePolicy] = None
+    build_version: Optional[str] = None
+    is_active: Optional[bool] = None
+
 class Environment(EnvironmentBase):
     id: int
     owner_id: int
@@ -131,6 +293,28 @@ class Environment(EnvironmentBase):
     class Config:
         from_attributes = True
 
+# Visual baseline schemas
+class BaselineApprove(BaseModel):
+    run_id: int
+    step_index: int  # Screenshot step whose image becomes the baseline
+
+class VisualBaseline(BaseModel):
+    id: int
+    test_case_id: int
+    step_index: int
+    environment_id: Optional[int] = None
+    digest: str
+    phash: str
+    width: Optional[int] = None
+    height: Optional[int] = None
+    source_run_id: Optional[int] = None
+    approved_by: Optional[int] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
 # Response schemas
 class MessageResponse(BaseModel):
     message: str
@@ -0,0 +1,203 @@
+"""
+Selector index: resolution latency and outcome of every selector, across test cases
+
+Generated scripts report how long each step's selector took to resolve and
+whether it timed out. Samples are folded into one selector_index row per
+owner and selector, so a slow or flaky selector shows up once no matter how
+many test cases use it. Test cases are also checked when saved, against the
+index and against patterns that are usually slow or brittle in D365 (deep
+XPath, text matches, positional selectors).
+"""
+import os
+import re
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models import SelectorStat, TestCase
+
+logger = logging.getLogger(__name__)
+
+# Average resolution time above which a selector counts as slow
+SLOW_SELECTOR_MS = float(os.getenv("SLOW_SELECTOR_MS", "1000"))
+# Share of resolutions that timed out or failed above which a selector counts as flaky
+FLAKY_SELECTOR_RATE = float(os.getenv("FLAKY_SELECTOR_RATE", "0.05"))
+# Samples needed before index statistics are trusted for flags
+SELECTOR_MIN_SAMPLES = int(os.getenv("SELECTOR_MIN_SAMPLES", "5"))
+
+SELECTOR_STEP_TYPES = ('click', 'fill', 'verify', 'waitForSelector')
+# Positional or text-based selectors break when D365 reorders or relabels a form
+_TEXT_MATCH = re.compile(r"^text=|:has-text\(|:text(-is|-matches)?\(|text\(\)|contains\(")
+_POSITIONAL = re.compile(r":nth-(child|of-type)\(|\[\d+\]|>> nth=")
+_STABLE_ATTRIBUTE = re.compile(r"\[(data-id|data-testid|data-lp-id|id|name|aria-label)[~|^$*]?=")
+
+def selector_key(selector: str) -> str:
+    return hashlib.sha1(selector.encode()).hexdigest()
+
+def lint_selector(selector: str) -> List[str]:
+    """Patterns in a selector that usually make it slow or brittle"""
+    issues = []
+    is_xpath = selector.startswith(('//', 'xpath=', '(//'))
+    if is_xpath and selector.count('/') > 6:
+        issues.append("deep XPath; prefer a [data-id=...] attribute selector")
+    elif is_xpath and '//' in selector.lstrip('(').removeprefix('xpath=')[2:]:
+        issues.append("XPath descendant search scans the whole DOM")
+    if _TEXT_MATCH.search(selector):
+        issues.append("text match breaks when labels change or are localized")
+    if _POSITIONAL.search(selector):
+        issues.append("positional selector breaks when the form layout changes")
+    if not is_xpath and not _STABLE_ATTRIBUTE.search(selector) and _css_depth(selector) > 4:
+        issues.append("long descendant chain without a stable attribute")
+    return issues
+
+def _css_depth(selector: str) -> int:
+    """Compound selectors in a CSS chain, ignoring spaces inside quoted values"""
+    unquoted = re.sub(r"(['\"]).*?\1", "''", selector.strip())
+    return len(re.split(r"\s*[>+~]\s*|\s+", unquoted))
+
+def record_resolutions(db: Session, user_id: int, test_case_id: int, run_id: int, samples: List[Dict[str, Any]]):
+    """Fold a run's selector samples ({selector, ms, outcome}) into the index
+    
+    Counters are incremented in SQL so concurrent runs don't lose updates.
+    """
+    by_selector = defaultdict(list)
+    for sample in samples:
+        if sample.get('selector'):
+            by_selector[sample['selector']].append(sample)
+    
+    for selector, resolutions in by_selector.items():
+        durations = [float(sample.get('ms') or 0) for sample in resolutions]
+        timeouts = sum(1 for sample in resolutions if sample.get('outcome') == 'timeout')
+        errors = sum(1 for sample in resolutions if sample.get('outcome') == 'error')
+        slowest = max(durations)
+        values = {
+            SelectorStat.resolutions: SelectorStat.resolutions + len(resolutions),
+            SelectorStat.timeouts: SelectorStat.timeouts + timeouts,
+            SelectorStat.errors: SelectorStat.errors + errors,
+            SelectorStat.total_ms: SelectorStat.total_ms + sum(durations),
+            SelectorStat.slow_resolutions: SelectorStat.slow_resolutions + sum(1 for ms in durations if ms > SLOW_SELECTOR_MS),
+            SelectorStat.max_ms: case((SelectorStat.max_ms < slowest, slowest), else_=SelectorStat.max_ms),
+            SelectorStat.last_ms: durations[-1],
+            SelectorStat.last_test_case_id: test_case_id,
+            SelectorStat.last_run_id: run_id
+        }
+        key = selector_key(selector)
+        match = (SelectorStat.owner_id == user_id, SelectorStat.selector_hash == key)
+        if db.query(SelectorStat).filter(*match).update(values, synchronize_session=False):
+            continue
+        try:
+            with db.begin_nested():
+                db.add(SelectorStat(
+                    owner_id=user_id,
+                    selector_hash=key,
+                    selector=selector,
+                    resolutions=len(resolutions),
+                    timeouts=timeouts,
+                    errors=errors,
+                    total_ms=sum(durations),
+                    slow_resolutions=sum(1 for ms in durations if ms > SLOW_SELECTOR_MS),
+                    max_ms=slowest,
+                    last_ms=durations[-1],
+                    last_test_case_id=test_case_id,
+                    last_run_id=run_id
+                ))
+        except IntegrityError:
+            # Another run inserted it first
+            db.query(SelectorStat).filter(*match).update(values, synchronize_session=False)
+    db.commit()
+
+def describe_stat(stat: SelectorStat) -> Dict[str, Any]:
+    failures = stat.timeouts + stat.errors
+    return {
+        "selector": stat.selector,
+        "resolutions": stat.resolutions,
+        "avg_ms": round(stat.total_ms / stat.resolutions, 1) if stat.resolutions else None,
+        "max_ms": stat.max_ms,
+        "last_ms": stat.last_ms,
+        "total_seconds": round(stat.total_ms / 1000, 1),
+        "slow_rate": round(stat.slow_resolutions / stat.resolutions, 4) if stat.resolutions else None,
+        "timeouts": stat.timeouts,
+        "errors": stat.errors,
+        "failure_rate": round(failures / stat.resolutions, 4) if stat.resolutions else None,
+        "issues": lint_selector(stat.selector),
+        "updated_at": stat.updated_at or stat.created_at
+    }
+
+def selector_flags(description: Dict[str, Any]) -> List[str]:
+    """Index-based problems of a selector, once it has enough samples"""
+    flags = []
+    if description["resolutions"] >= SELECTOR_MIN_SAMPLES:
+        if description["avg_ms"] > SLOW_SELECTOR_MS:
+            flags.append(f"slow: resolves in {description['avg_ms']:.0f} ms on average")
+        if description["failure_rate"] > FLAKY_SELECTOR_RATE:
+            flags.append(f"flaky: {description['failure_rate']:.0%} of resolutions timed out or failed")
+    return flags
+
+def selector_usage(db: Session, user_id: int) -> Dict[str, List[int]]:
+    """Selector -> ids of the owner's active test cases whose steps use it"""
+    usage = defaultdict(list)
+    for test_case_id, steps in db.query(TestCase.id, TestCase.steps).filter(
+        TestCase.owner_id == user_id,
+        TestCase.is_active == True
+    ):
+        for selector in {step.get('selector') for step in steps or [] if step.get('type') in SELECTOR_STEP_TYPES}:
+            if selector:
+                usage[selector].append(test_case_id)
+    return usage
+
+def rank_selectors(db: Session, user_id: int, sort: str = "impact", limit: int = 20,
+                   min_resolutions: int = SELECTOR_MIN_SAMPLES) -> List[Dict[str, Any]]:
+    """The owner's worst selectors: slowest (avg), flakiest (failure rate) or impact (total time spent)"""
+    order = {
+        "slowest": SelectorStat.total_ms / SelectorStat.resolutions,
+        "flakiest": (SelectorStat.timeouts + SelectorStat.errors) * 1.0 / SelectorStat.resolutions,
+        "impact": SelectorStat.total_ms
+    }[sort]
+    stats = db.query(SelectorStat).filter(
+        SelectorStat.owner_id == user_id,
+        SelectorStat.resolutions >= min_resolutions
+    ).order_by(order.desc(), SelectorStat.id).limit(limit).all()
+    
+    usage = selector_usage(db, user_id)
+    ranked = []
+    for stat in stats:
+        description = describe_stat(stat)
+        description["flags"] = selector_flags(description)
+        description["used_by_test_cases"] = usage.get(stat.selector, [])
+        ranked.append(description)
+    return ranked
+
+def review_steps(db: Session, user_id: int, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Warnings for the selectors of a test case being saved"""
+    selectors = {}
+    for index, step in enumerate(steps, start=1):
+        if step.get('type') in SELECTOR_STEP_TYPES and step.get('selector'):
+            selectors.setdefault(step['selector'], []).append(index)
+    if not selectors:
+        return []
+    
+    known = {
+        stat.selector_hash: stat
+        for stat in db.query(SelectorStat).filter(
+            SelectorStat.owner_id == user_id,
+            SelectorStat.selector_hash.in_([selector_key(selector) for selector in selectors])
+        )
+    }
+    warnings = []
+    for selector, step_indexes in selectors.items():
+        stat = known.get(selector_key(selector))
+        problems = selector_flags(describe_stat(stat)) if stat else []
+        problems += lint_selector(selector)
+        if problems:
+            warnings.append({
+                "selector": selector,
+                "steps": step_indexes,
+                "problems": problems,
+                "avg_ms": round(stat.total_ms / stat.resolutions, 1) if stat and stat.resolutions else None
+            })
+    return warnings
@@ -0,0 +1,117 @@
+"""
+Fast JSON encoding, direct ORM row encoding and streamed list responses
+"""
+import os
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+# Rows fetched per round trip when streaming large pages
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+# Largest page a list endpoint builds in memory, and the larger cap for streamed pages
+PAGE_MAX_LIMIT = 1000
+STREAM_MAX_LIMIT = int(os.getenv("STREAM_MAX_LIMIT", "50000"))
+
+STREAM_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+def _datetime(value: datetime) -> str:
+    """ISO 8601 as Pydantic writes it, with Z for UTC"""
+    text = value.isoformat()
+    if value.utcoffset() == timedelta(0):
+        text = text[:-6] + "Z"
+    return text
+
+def _default(value: Any) -> Any:
+    """orjson hook for types it doesn't encode natively"""
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    return jsonable_encoder(value)
+
+def dumps(content: Any) -> bytes:
+    """Encode to compact UTF-8 JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    return json.dumps(
+        jsonable_encoder(content, custom_encoder={datetime: _datetime}),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: same output as JSONResponse, encoded by dumps()"""
+    
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+class RowEncoder:
+    """Turn ORM rows into response dicts shaped like a schema, without validating each row
+    
+    For data the platform wrote itself (already validated on the way in)
+    this produces the same JSON as model_validate() at a fraction of the cost.
+    Nested list fields (e.g. test steps) are projected onto their schema's
+    fields with its defaults, so the output keeps the same keys.
+    """
+    
+    def __init__(self, schema: Type[BaseModel], nested: Optional[Dict[str, Type[BaseModel]]] = None):
+        self.fields = list(schema.model_fields)
+        self.nested_defaults = {
+            name: {field: info.default for field, info in model.model_fields.items()}
+            for name, model in (nested or {}).items()
+        }
+    
+    def __call__(self, row: Any) -> Dict[str, Any]:
+        data = {name: getattr(row, name) for name in self.fields}
+        for name, defaults in self.nested_defaults.items():
+            items = data.get(name)
+            if items:
+                data[name] = [
+                    {field: item.get(field, default) for field, default in defaults.items()}
+                    for item in items
+                ]
+        return data
+
+def _stream_chunks(rows: Iterable[Any], encode: Callable[[Any], Dict[str, Any]], fmt: str, batch_size: int) -> Iterator[bytes]:
+    """Yield encoded rows batch by batch so only one batch is ever held in memory"""
+    batch = []
+    first = True
+    if fmt == "json":
+        yield b"["
+    for row in rows:
+        batch.append(dumps(encode(row)))
+        if len(batch) >= batch_size:
+            yield _join(batch, fmt, first)
+            first = False
+            batch = []
+    if batch:
+        yield _join(batch, fmt, first)
+    if fmt == "json":
+        yield b"]"
+
+def _join(encoded, fmt: str, first: bool) -> bytes:
+    if fmt == "ndjson":
+        return b"\n".join(encoded) + b"\n"
+    return (b"" if first else b",") + b",".join(encoded)
+
+def stream_rows(rows: Iterable[Any], encode: Callable[[Any], Dict[str, Any]], fmt: str, batch_size: int = STREAM_BATCH_SIZE) -> StreamingResponse:
+    """Stream any row iterable as a JSON array or NDJSON"""
+    return StreamingResponse(
+        _stream_chunks(rows, encode, fmt, batch_size),
+        media_type=STREAM_MEDIA_TYPES[fmt]
+    )
+
+def stream_query(query, encode: Callable[[Any], Dict[str, Any]], fmt: str, batch_size: int = STREAM_BATCH_SIZE) -> StreamingResponse:
+    """Stream a query as a JSON array or NDJSON using a server-side cursor"""
+    return stream_rows(query.yield_per(batch_size), encode, fmt, batch_size)
@@ -0,0 +1,225 @@
+"""
+Simulated executor backend for load-testing the platform without browsers
+
+Selected with EXECUTOR_BACKEND=simulated. Runs go through the scheduler,
+database writes and result handling exactly like real ones, but instead
+of launching Playwright the backend sleeps for a sampled browser time and
+returns a sampled outcome:
+  - startup and per-step durations are log-normal, from a median and a
+    spread (sigma of the underlying normal)
+  - a run fails (a step times out) or errors (browser or network crash)
+    with the configured probabilities
+  - artifact sizes are log-normal, scaled by the run's capture policy
+SIMULATED_TIME_SCALE shrinks every duration, so thousands of runs fit in
+a short benchmark (see benchmarks/load_harness.py). A run's execution_time
+is the time actually slept, so wall time minus execution_time is platform
+overhead. Nothing is written to disk.
+"""
+import os
+import math
+import random
+import asyncio
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from capture_policy import resolve_capture_policy, plan_capture
+from metrics import EXECUTOR_RUN_DURATION, RUNS_TERMINATED
+from selector_index import SELECTOR_STEP_TYPES
+from tracing import NOOP_TRACE
+from dataset_runs import BOUND_FIELDS, bind
+from test_executor import ExecutorBackend, EXECUTOR_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SIMULATED_STARTUP_SECONDS = float(os.getenv("SIMULATED_STARTUP_SECONDS", "4"))  # Median npx, browser and page start
+SIMULATED_STEP_SECONDS = float(os.getenv("SIMULATED_STEP_SECONDS", "1.5"))  # Median per step
+SIMULATED_DURATION_SIGMA = float(os.getenv("SIMULATED_DURATION_SIGMA", "0.5"))
+SIMULATED_FAILURE_RATE = float(os.getenv("SIMULATED_FAILURE_RATE", "0.08"))
+SIMULATED_ERROR_RATE = float(os.getenv("SIMULATED_ERROR_RATE", "0.02"))
+SIMULATED_ARTIFACT_BYTES = float(os.getenv("SIMULATED_ARTIFACT_BYTES", "400000"))  # Median with full capture
+SIMULATED_ARTIFACT_SIGMA = float(os.getenv("SIMULATED_ARTIFACT_SIGMA", "1.0"))
+SIMULATED_TIME_SCALE = float(os.getenv("SIMULATED_TIME_SCALE", "1.0"))
+# Seeds each run's random stream with the run id, for repeatable load tests
+SIMULATED_SEED = os.getenv("SIMULATED_SEED")
+
+# Share of the full-capture artifact size each capture mode keeps
+_CAPTURE_WEIGHTS = {"trace": 0.6, "video": 0.3, "screenshot": 0.1}
+
+ERROR_MESSAGES = [
+    "Error: browserType.launch: Browser closed unexpectedly",
+    "Error: page.goto: net::ERR_CONNECTION_RESET",
+    "Error: Target page, context or browser has been closed",
+]
+
+def _lognormal(rng: random.Random, median: float, sigma: float) -> float:
+    return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+class SimulatedTestExecutor(ExecutorBackend):
+    name = "simulated"
+    
+    def __init__(self):
+        super().__init__()
+        # run_id -> event set by cancel()
+        self._runs: Dict[int, asyncio.Event] = {}
+    
+    def _rng(self, run_id: int) -> random.Random:
+        return random.Random(f"{SIMULATED_SEED}:{run_id}") if SIMULATED_SEED is not None else random.Random()
+    
+    def _sample(self, rng: random.Random, steps: list, capture: Dict[str, Any], skip: int = 0) -> Dict[str, Any]:
+        """Outcome, browser seconds, per-step timings and artifact bytes of one run
+        
+        skip leading steps are restored from a shared prefix rather than run;
+        restoring costs about one step.
+        """
+        steps = steps[skip:]
+        outcome = rng.random()
+        status = 'error' if outcome < SIMULATED_ERROR_RATE else 'failed' if outcome < SIMULATED_ERROR_RATE + SIMULATED_FAILURE_RATE else 'passed'
+        # Failures stop at a random step, which times out; errors can happen anywhere
+        last_step = rng.randrange(len(steps)) if steps and status != 'passed' else len(steps) - 1
+        
+        seconds = _lognormal(rng, SIMULATED_STARTUP_SECONDS, SIMULATED_DURATION_SIGMA)
+        restore_seconds = _lognormal(rng, SIMULATED_STEP_SECONDS, SIMULATED_DURATION_SIGMA) if skip else 0.0
+        seconds += restore_seconds
+        timings = []
+        for index, step in enumerate(steps[:last_step + 1], start=skip + 1):
+            timed_out = status == 'failed' and index == skip + last_step + 1
+            step_seconds = step.get('timeout', 5000) / 1000 if timed_out else _lognormal(rng, SIMULATED_STEP_SECONDS, SIMULATED_DURATION_SIGMA)
+            timings.append({'index': index, 'type': step.get('type'), 'seconds': step_seconds, 'timed_out': timed_out, 'selector': step.get('selector')})
+            seconds += step_seconds
+        
+        # Failure-only modes (retain-on-failure, only-on-failure) discard a passing run's artifacts
+        kept = sum(
+            weight for kind, weight in _CAPTURE_WEIGHTS.items()
+            if capture.get(kind) == 'on' or (capture.get(kind) not in (None, 'off') and status != 'passed')
+        )
+        return {
+            'status': status,
+            'seconds': seconds,
+            'timings': timings,
+            'restore_seconds': restore_seconds,
+            'artifact_bytes': int(_lognormal(rng, SIMULATED_ARTIFACT_BYTES * kept, SIMULATED_ARTIFACT_SIGMA))
+        }
+    
+    def _prefix_outcome(self, prefix: Dict[str, Any], sample: Dict[str, Any]) -> Dict[str, Any]:
+        """Like the Playwright backend's, in slept (scaled) seconds"""
+        if prefix.get('url'):
+            return {'restore_seconds': sample['restore_seconds'] * SIMULATED_TIME_SCALE}
+        timings = sample['timings'][:prefix['steps']]
+        if len(sample['timings']) <= prefix['steps'] or any(timing['timed_out'] for timing in timings):
+            return {}
+        return {'url': 'about:blank#simulated', 'prefix_seconds': sum(timing['seconds'] for timing in timings) * SIMULATED_TIME_SCALE}
+    
+    async def execute_test(
+        self,
+        test_case: Dict[str, Any],
+        run_id: int,
+        environment_url: Optional[str] = None,
+        routing_profile: Optional[Dict[str, Any]] = None,
+        har_mode: Optional[str] = None,
+        har_path: Optional[str] = None,
+        trace=None,
+        timeout: Optional[float] = None,
+        capture_policy: Optional[Dict[str, Any]] = None,
+        dataset_row: Optional[Dict[str, str]] = None,
+        shared_prefix: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Sleep for a sampled browser time and return a sampled result"""
+        trace = trace or NOOP_TRACE
+        time_limit = min(timeout or EXECUTOR_TIMEOUT_SECONDS, EXECUTOR_TIMEOUT_SECONDS)
+        capture = plan_capture(capture_policy or resolve_capture_policy(), run_id)
+        steps = test_case.get('steps', [])
+        if dataset_row is not None:
+            # Bound like the generated script would, so selector timings carry real selectors
+            steps = [
+                {**step, **{field: bind(step[field], dataset_row) for field in BOUND_FIELDS if isinstance(step.get(field), str)}}
+                for step in steps
+            ]
+        prefix = shared_prefix if shared_prefix and shared_prefix.get('state_path') else None
+        restore = bool(prefix and prefix.get('url'))
+        cancelled = self._runs[run_id] = asyncio.Event()
+        state_saved = None
+        try:
+            sample = self._sample(self._rng(run_id), steps, capture, prefix['steps'] if restore else 0)
+            timed_out = sample['seconds'] > time_limit
+            if prefix and not restore and prefix.get('on_state'):
+                # Report the saved state when the leader would be past the prefix
+                outcome = self._prefix_outcome(prefix, sample)
+                if outcome and outcome['prefix_seconds'] < min(sample['seconds'], time_limit) * SIMULATED_TIME_SCALE:
+                    state_saved = asyncio.get_running_loop().call_later(outcome['prefix_seconds'], prefix['on_state'], outcome)
+            
+            with trace.span('executor.simulated', **{'simulated.seconds': round(sample['seconds'], 3)}) as span:
+                start_time = datetime.utcnow()
+                try:
+                    await asyncio.wait_for(cancelled.wait(), min(sample['seconds'], time_limit) * SIMULATED_TIME_SCALE)
+                except asyncio.TimeoutError:
+                    pass
+                execution_time = (datetime.utcnow() - start_time).total_seconds()
+                
+                status = sample['status']
+                error_message = None
+                failed_step = next((timing for timing in sample['timings'] if timing['timed_out']), None)
+                if cancelled.is_set():
+                    status, error_message = 'cancelled', 'Run cancelled'
+                    RUNS_TERMINATED.inc(reason='cancelled')
+                elif timed_out:
+                    status, error_message = 'error', f'Run exceeded its {time_limit:g}s timeout and was terminated'
+                    RUNS_TERMINATED.inc(reason='timeout')
+                elif failed_step:
+                    error_message = f"TimeoutError: step {failed_step['index']} ({failed_step['type']}) exceeded its timeout"
+                elif status != 'passed':
+                    error_message = ERROR_MESSAGES[run_id % len(ERROR_MESSAGES)]
+                if error_message:
+                    span.set_error(error_message)
+                EXECUTOR_RUN_DURATION.observe(execution_time, status=status)
+            
+            return {
+                'status': status,
+                'execution_time': execution_time,
+                'stdout': f"[simulated] {test_case.get('name', run_id)}: {status} in {sample['seconds']:.1f}s of browser time\n",
+                'stderr': '',
+                'error_message': error_message,
+                'return_code': 0 if status == 'passed' else 1,
+                'report_summary': {
+                    'status': status,
+                    'duration_ms': round(sample['seconds'] * 1000),
+                    'counts': {status: 1},
+                    'tests': [{
+                        'title': test_case.get('name'),
+                        'status': status,
+                        'duration_ms': round(sample['seconds'] * 1000),
+                        'errors': [{'message': error_message}] if error_message else [],
+                        'failed_steps': [{'index': failed_step['index'], 'error': {'message': error_message}}] if failed_step else []
+                    }],
+                    'errors': [],
+                    'simulated': True
+                },
+                'capture_policy': capture['name'],
+                'artifact_bytes': sample['artifact_bytes'],
+                'selector_timings': [
+                    {
+                        'index': timing['index'],
+                        'selector': timing['selector'],
+                        'ms': round(timing['seconds'] * 1000),
+                        'outcome': 'timeout' if timing['timed_out'] else 'ok'
+                    }
+                    for timing in sample['timings']
+                    if timing['type'] in SELECTOR_STEP_TYPES and timing['selector']
+                ],
+                'shared_prefix': self._prefix_outcome(prefix, sample) if prefix else None
+            }
+        finally:
+            if state_saved:
+                state_saved.cancel()
+            self._runs.pop(run_id, None)
+    
+    def cancel(self, run_id: int) -> bool:
+        event = self._runs.get(run_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+    
+    @property
+    def active_run_ids(self) -> set:
+        return set(self._runs)
@@ -0,0 +1,126 @@
+-- D365 Test Automation Platform Database Migrations
+-- Brings databases created from an earlier schema.sql up to date.
+-- Run schema.sql first (it creates the tables that don't exist yet and
+-- leaves existing ones alone), then this script. Every statement checks
+-- before it changes anything, so it is safe to run more than once.
+
+-- =============================================
+-- Users: scheduling tenant and quota overrides
+-- =============================================
+IF COL_LENGTH('users', 'team') IS NULL
+    ALTER TABLE users ADD team NVARCHAR(100) NULL;
+IF COL_LENGTH('users', 'max_concurrent_runs') IS NULL
+    ALTER TABLE users ADD max_concurrent_runs INT NULL;
+IF COL_LENGTH('users', 'browser_minutes_per_day') IS NULL
+    ALTER TABLE users ADD browser_minutes_per_day FLOAT NULL;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='IX_users_team' AND object_id=OBJECT_ID('users'))
+    CREATE INDEX IX_users_team ON users(team);
+GO
+
+-- =============================================
+-- Test Cases: timeouts, capture policy, datasets, versions, ETags
+-- =============================================
+IF COL_LENGTH('test_cases', 'timeout_seconds') IS NULL
+    ALTER TABLE test_cases ADD timeout_seconds INT NULL;
+IF COL_LENGTH('test_cases', 'capture_policy') IS NULL
+    ALTER TABLE test_cases ADD capture_policy NVARCHAR(MAX) NULL;
+IF COL_LENGTH('test_cases', 'dataset_id') IS NULL
+    ALTER TABLE test_cases ADD dataset_id INT NULL;
+IF COL_LENGTH('test_cases', 'version') IS NULL
+    ALTER TABLE test_cases ADD version INT NOT NULL DEFAULT 1;
+IF COL_LENGTH('test_cases', 'row_version') IS NULL
+    ALTER TABLE test_cases ADD row_version INT NOT NULL DEFAULT 1;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.foreign_keys WHERE name='FK_test_cases_dataset')
+    ALTER TABLE test_cases ADD CONSTRAINT FK_test_cases_dataset
+        FOREIGN KEY (dataset_id) REFERENCES datasets(id);
+GO
+
+-- =============================================
+-- Test Runs: stderr, routing, HAR, reporting, capture, versions, reuse, datasets, batches
+-- =============================================
+IF COL_LENGTH('test_runs', 'stderr') IS NULL
+    ALTER TABLE test_runs ADD stderr NVARCHAR(MAX) NULL;
+IF COL_LENGTH('test_runs', 'environment_id') IS NULL
+    ALTER TABLE test_runs ADD environment_id INT NULL;
+IF COL_LENGTH('test_runs', 'blocked_requests') IS NULL
+    ALTER TABLE test_runs ADD blocked_requests INT NULL;
+IF COL_LENGTH('test_runs', 'bytes_saved') IS NULL
+    ALTER TABLE test_runs ADD bytes_saved BIGINT NULL;
+IF COL_LENGTH('test_runs', 'har_mode') IS NULL
+    ALTER TABLE test_runs ADD har_mode NVARCHAR(20) NULL;
+IF COL_LENGTH('test_runs', 'har_path') IS NULL
+    ALTER TABLE test_runs ADD har_path NVARCHAR(500) NULL;
+IF COL_LENGTH('test_runs', 'log_path') IS NULL
+    ALTER TABLE test_runs ADD log_path NVARCHAR(500) NULL;
+IF COL_LENGTH('test_runs', 'report_summary') IS NULL
+    ALTER TABLE test_runs ADD report_summary NVARCHAR(MAX) NULL;
+IF COL_LENGTH('test_runs', 'capture_policy') IS NULL
+    ALTER TABLE test_runs ADD capture_policy NVARCHAR(50) NULL;
+IF COL_LENGTH('test_runs', 'artifact_bytes') IS NULL
+    ALTER TABLE test_runs ADD artifact_bytes INT NULL;
+IF COL_LENGTH('test_runs', 'visual_diffs') IS NULL
+    ALTER TABLE test_runs ADD visual_diffs NVARCHAR(MAX) NULL;
+IF COL_LENGTH('test_runs', 'test_case_version') IS NULL
+    ALTER TABLE test_runs ADD test_case_version INT NULL;
+IF COL_LENGTH('test_runs', 'steps_hash') IS NULL
+    ALTER TABLE test_runs ADD steps_hash NVARCHAR(64) NULL;
+IF COL_LENGTH('test_runs', 'environment_build') IS NULL
+    ALTER TABLE test_runs ADD environment_build NVARCHAR(100) NULL;
+IF COL_LENGTH('test_runs', 'reuse_status') IS NULL
+    ALTER TABLE test_runs ADD reuse_status NVARCHAR(10) NULL;
+IF COL_LENGTH('test_runs', 'reused_from_run_id') IS NULL
+    ALTER TABLE test_runs ADD reused_from_run_id INT NULL;
+IF COL_LENGTH('test_runs', 'dataset_id') IS NULL
+    ALTER TABLE test_runs ADD dataset_id INT NULL;
+IF COL_LENGTH('test_runs', 'parent_run_id') IS NULL
+    ALTER TABLE test_runs ADD parent_run_id INT NULL;
+IF COL_LENGTH('test_runs', 'dataset_row') IS NULL
+    ALTER TABLE test_runs ADD dataset_row INT NULL;
+IF COL_LENGTH('test_runs', 'batch_id') IS NULL
+    ALTER TABLE test_runs ADD batch_id NVARCHAR(32) NULL;
+IF COL_LENGTH('test_runs', 'shared_prefix') IS NULL
+    ALTER TABLE test_runs ADD shared_prefix NVARCHAR(MAX) NULL;
+IF COL_LENGTH('test_runs', 'row_version') IS NULL
+    ALTER TABLE test_runs ADD row_version INT NOT NULL DEFAULT 1;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='IX_test_runs_parent_run_id' AND object_id=OBJECT_ID('test_runs'))
+    CREATE INDEX IX_test_runs_parent_run_id ON test_runs(parent_run_id);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name='IX_test_runs_batch_id' AND object_id=OBJECT_ID('test_runs'))
+    CREATE INDEX IX_test_runs_batch_id ON test_runs(batch_id);
+GO
+
+-- Cancelled runs (see reaper.py); the constraint is recreated with the new status
+IF EXISTS (
+    SELECT * FROM sys.check_constraints
+    WHERE name='CK_test_runs_status' AND definition NOT LIKE '%cancelled%'
+)
+    ALTER TABLE test_runs DROP CONSTRAINT CK_test_runs_status;
+GO
+
+IF NOT EXISTS (SELECT * FROM sys.check_constraints WHERE name='CK_test_runs_status')
+    ALTER TABLE test_runs ADD CONSTRAINT CK_test_runs_status
+        CHECK (status IN ('pending', 'running', 'passed', 'failed', 'error', 'cancelled'));
+GO
+
+-- =============================================
+-- Test Suites: capture policy
+-- =============================================
+IF COL_LENGTH('test_suites', 'capture_policy') IS NULL
+    ALTER TABLE test_suites ADD capture_policy NVARCHAR(MAX) NULL;
+GO
+
+-- =============================================
+-- Environments: routing profile, capture policy, build marker
+-- =============================================
+IF COL_LENGTH('environments', 'routing_profile') IS NULL
+    ALTER TABLE environments ADD routing_profile NVARCHAR(MAX) NULL;
+IF COL_LENGTH('environments', 'capture_policy') IS NULL
+    ALTER TABLE environments ADD capture_policy NVARCHAR(MAX) NULL;
+IF COL_LENGTH('environments', 'build_version') IS NULL
+    ALTER TABLE environments ADD build_version NVARCHAR(100) NULL;
+GO
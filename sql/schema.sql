@@ -24,13 +24,44 @@ BEGIN
         email NVARCHAR(100) NOT NULL UNIQUE,
         hashed_password NVARCHAR(255) NOT NULL,
         is_active BIT NOT NULL DEFAULT 1,
+        team NVARCHAR(100) NULL, -- Scheduling tenant; users without one are their own tenant
+        max_concurrent_runs INT NULL, -- Quota overrides; NULL uses the scheduler defaults
+        browser_minutes_per_day FLOAT NULL,
         created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
         updated_at DATETIME2(7) NULL,
         
         -- Indexes
         INDEX IX_users_username (username),
         INDEX IX_users_email (email),
-        INDEX IX_users_is_active (is_active)
+        INDEX IX_users_is_active (is_active),
+        INDEX IX_users_team (team)
+    );
+END
+GO
+
+-- =============================================
+-- Datasets Table (see dataset_runs.py)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='datasets' AND xtype='U')
+BEGIN
+    CREATE TABLE datasets (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        name NVARCHAR(200) NOT NULL,
+        description NTEXT NULL,
+        columns NVARCHAR(MAX) NOT NULL, -- JSON array of column names
+        rows NVARCHAR(MAX) NOT NULL, -- JSON array of {column: value} rows; immutable once stored
+        row_count INT NOT NULL,
+        owner_id INT NOT NULL,
+        is_active BIT NOT NULL DEFAULT 1,
+        created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
+        
+        -- Foreign Keys
+        CONSTRAINT FK_datasets_owner 
+            FOREIGN KEY (owner_id) REFERENCES users(id)
+            ON DELETE CASCADE,
+        
+        -- Indexes
+        INDEX IX_datasets_owner_id (owner_id)
     );
 END
 GO
@@ -47,8 +78,13 @@ BEGIN
         steps NVARCHAR(MAX) NOT NULL, -- JSON array of test steps
         expected_result NVARCHAR(20) NOT NULL DEFAULT 'pass', -- pass/fail
         tags NVARCHAR(500) NULL, -- Comma-separated tags
+        timeout_seconds INT NULL, -- Wall-clock limit per run; capped by EXECUTOR_TIMEOUT_SECONDS
+        capture_policy NVARCHAR(MAX) NULL, -- JSON trace/screenshot/video capture; overrides suite and environment
+        dataset_id INT NULL, -- Rows its {{placeholders}} are bound to; runs fan out per row
+        version INT NOT NULL DEFAULT 1, -- Current content version (see test_case_versions)
         is_active BIT NOT NULL DEFAULT 1,
         owner_id INT NOT NULL,
+        row_version INT NOT NULL DEFAULT 1, -- Bumped on every update, feeds ETags
         created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
         updated_at DATETIME2(7) NULL,
         
@@ -56,6 +92,8 @@ BEGIN
         CONSTRAINT FK_test_cases_owner 
             FOREIGN KEY (owner_id) REFERENCES users(id)
             ON DELETE CASCADE,
+        CONSTRAINT FK_test_cases_dataset 
+            FOREIGN KEY (dataset_id) REFERENCES datasets(id),
         
         -- Indexes
         INDEX IX_test_cases_owner_id (owner_id),
@@ -66,6 +104,34 @@ BEGIN
 END
 GO
 
+-- =============================================
+-- Test Case Versions Table (see versioning.py)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='test_case_versions' AND xtype='U')
+BEGIN
+    CREATE TABLE test_case_versions (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        test_case_id INT NOT NULL,
+        version INT NOT NULL,
+        is_snapshot BIT NOT NULL, -- 1 = full content, 0 = JSON Patch from the previous version
+        payload VARBINARY(MAX) NOT NULL, -- zlib-compressed JSON
+        payload_bytes INT NULL,
+        created_by INT NULL,
+        created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
+        
+        -- Foreign Keys
+        CONSTRAINT FK_test_case_versions_test_case 
+            FOREIGN KEY (test_case_id) REFERENCES test_cases(id)
+            ON DELETE CASCADE,
+        CONSTRAINT FK_test_case_versions_created_by 
+            FOREIGN KEY (created_by) REFERENCES users(id),
+        
+        -- Indexes
+        INDEX UX_test_case_versions_case_version UNIQUE (test_case_id, version)
+    );
+END
+GO
+
 -- =============================================
 -- Test Runs Table
 -- =============================================
@@ -75,12 +141,34 @@ BEGIN
         id INT IDENTITY(1,1) PRIMARY KEY,
         test_case_id INT NOT NULL,
         user_id INT NOT NULL,
-        status NVARCHAR(20) NOT NULL DEFAULT 'pending', -- pending/running/passed/failed/error
+        status NVARCHAR(20) NOT NULL DEFAULT 'pending', -- pending/running/passed/failed/error/cancelled
         result NTEXT NULL, -- Detailed result output
         execution_time FLOAT NULL, -- Execution time in seconds
         screenshot_path NVARCHAR(500) NULL, -- Path to screenshot if available
         trace_path NVARCHAR(500) NULL, -- Path to Playwright trace
         error_message NTEXT NULL, -- Error details if failed
+        stderr NVARCHAR(MAX) NULL, -- Playwright stderr, head and tail when capped
+        environment_id INT NULL,
+        blocked_requests INT NULL, -- Requests aborted by the environment routing profile
+        bytes_saved BIGINT NULL, -- Estimated bytes not downloaded due to blocking
+        har_mode NVARCHAR(20) NULL, -- record/replay, NULL for a plain live run
+        har_path NVARCHAR(500) NULL, -- HAR captured (record) or served (replay)
+        log_path NVARCHAR(500) NULL, -- Full stdout spilled to the artifact store when result was truncated
+        report_summary NVARCHAR(MAX) NULL, -- JSON: per-test status, errors, failed steps and attachments
+        capture_policy NVARCHAR(50) NULL, -- Name of the capture policy the run used
+        artifact_bytes INT NULL, -- Disk used by the run's traces, screenshots, videos and logs
+        visual_diffs NVARCHAR(MAX) NULL, -- JSON: per screenshot step comparison with its baseline
+        test_case_version INT NULL, -- Test case version that was executed
+        steps_hash NVARCHAR(64) NULL, -- What was executed, for result reuse (see result_reuse.py)
+        environment_build NVARCHAR(100) NULL, -- Environment build marker when the run was queued
+        reuse_status NVARCHAR(10) NULL, -- hit/miss when the request opted into result reuse
+        reused_from_run_id INT NULL, -- Run whose result a reuse hit copied
+        dataset_id INT NULL, -- Set on the parent run of a dataset fan-out
+        parent_run_id INT NULL, -- Set on its per-row child runs
+        dataset_row INT NULL, -- 0-based dataset row a child run was bound to
+        batch_id NVARCHAR(32) NULL, -- Batch-run request that queued the run
+        shared_prefix NVARCHAR(MAX) NULL, -- JSON: shared setup prefix group, role and timings (see prefix_planner.py)
+        row_version INT NOT NULL DEFAULT 1, -- Bumped on every update, feeds ETags
         started_at DATETIME2(7) NULL,
         completed_at DATETIME2(7) NULL,
         created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
@@ -95,7 +183,7 @@ BEGIN
         
         -- Check Constraints
         CONSTRAINT CK_test_runs_status 
-            CHECK (status IN ('pending', 'running', 'passed', 'failed', 'error')),
+            CHECK (status IN ('pending', 'running', 'passed', 'failed', 'error', 'cancelled')),
         CONSTRAINT CK_test_runs_execution_time 
             CHECK (execution_time IS NULL OR execution_time >= 0),
         
@@ -104,7 +192,52 @@ BEGIN
         INDEX IX_test_runs_user_id (user_id),
         INDEX IX_test_runs_status (status),
         INDEX IX_test_runs_created_at (created_at DESC),
-        INDEX IX_test_runs_completed_at (completed_at DESC)
+        INDEX IX_test_runs_completed_at (completed_at DESC),
+        INDEX IX_test_runs_parent_run_id (parent_run_id),
+        INDEX IX_test_runs_batch_id (batch_id)
+    );
+END
+GO
+
+-- =============================================
+-- Test Runs Archive Table (cold storage, see archive.py)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='test_runs_archive' AND xtype='U')
+BEGIN
+    CREATE TABLE test_runs_archive (
+        id INT PRIMARY KEY, -- Original test_runs.id
+        test_case_id INT NOT NULL,
+        user_id INT NOT NULL,
+        status NVARCHAR(20) NOT NULL,
+        execution_time FLOAT NULL,
+        environment_id INT NULL,
+        started_at DATETIME2(7) NULL,
+        completed_at DATETIME2(7) NULL,
+        created_at DATETIME2(7) NOT NULL,
+        payload VARBINARY(MAX) NULL, -- zlib-compressed JSON of the remaining run columns
+        archived_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
+        
+        -- Indexes
+        INDEX IX_test_runs_archive_user_created (user_id, created_at DESC),
+        INDEX IX_test_runs_archive_test_case_created (test_case_id, created_at DESC)
+    ) WITH (DATA_COMPRESSION = PAGE);
+END
+GO
+
+-- =============================================
+-- Test Run Rollups Table (daily aggregates of archived runs)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='test_run_rollups' AND xtype='U')
+BEGIN
+    CREATE TABLE test_run_rollups (
+        user_id INT NOT NULL,
+        day DATE NOT NULL,
+        status NVARCHAR(20) NOT NULL,
+        run_count INT NOT NULL DEFAULT 0,
+        execution_time_sum FLOAT NOT NULL DEFAULT 0,
+        execution_time_count INT NOT NULL DEFAULT 0,
+        
+        CONSTRAINT PK_test_run_rollups PRIMARY KEY (user_id, day, status)
     );
 END
 GO
@@ -119,6 +252,7 @@ BEGIN
         name NVARCHAR(200) NOT NULL,
         description NTEXT NULL,
         test_case_ids NVARCHAR(MAX) NOT NULL, -- JSON array of test case IDs
+        capture_policy NVARCHAR(MAX) NULL, -- JSON trace/screenshot/video capture for runs of this suite
         owner_id INT NOT NULL,
         is_active BIT NOT NULL DEFAULT 1,
         created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
@@ -147,6 +281,9 @@ BEGIN
         name NVARCHAR(100) NOT NULL,
         url NVARCHAR(500) NOT NULL,
         description NTEXT NULL,
+        routing_profile NVARCHAR(MAX) NULL, -- JSON request blocking/stubbing rules
+        capture_policy NVARCHAR(MAX) NULL, -- JSON default trace/screenshot/video capture
+        build_version NVARCHAR(100) NULL, -- Deployed build/version marker, set by CI; gates result reuse
         owner_id INT NOT NULL,
         is_active BIT NOT NULL DEFAULT 1,
         created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
@@ -164,6 +301,129 @@ BEGIN
 END
 GO
 
+-- =============================================
+-- Visual Baselines Table (see visual_diff.py)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='visual_baselines' AND xtype='U')
+BEGIN
+    CREATE TABLE visual_baselines (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        test_case_id INT NOT NULL,
+        step_index INT NOT NULL, -- 1-based screenshot step number
+        environment_id INT NULL, -- NULL for runs without an environment
+        path NVARCHAR(500) NOT NULL,
+        digest NVARCHAR(64) NOT NULL, -- sha256 of the PNG file
+        phash NVARCHAR(1024) NOT NULL, -- Tiled perceptual hash, hex (see image_diff.py)
+        width INT NULL,
+        height INT NULL,
+        source_run_id INT NULL, -- Run the screenshot was taken from
+        approved_by INT NULL, -- NULL when it was the step's first screenshot
+        created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
+        updated_at DATETIME2(7) NULL,
+        
+        -- Foreign Keys
+        CONSTRAINT FK_visual_baselines_test_case 
+            FOREIGN KEY (test_case_id) REFERENCES test_cases(id)
+            ON DELETE CASCADE,
+        CONSTRAINT FK_visual_baselines_environment 
+            FOREIGN KEY (environment_id) REFERENCES environments(id),
+        CONSTRAINT FK_visual_baselines_approved_by 
+            FOREIGN KEY (approved_by) REFERENCES users(id),
+        
+        -- Indexes
+        INDEX UX_visual_baselines_case_env_step UNIQUE (test_case_id, environment_id, step_index) WHERE environment_id IS NOT NULL,
+        INDEX UX_visual_baselines_case_step_default UNIQUE (test_case_id, step_index) WHERE environment_id IS NULL
+    );
+END
+GO
+
+-- =============================================
+-- Selector Index Table (see selector_index.py)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='selector_index' AND xtype='U')
+BEGIN
+    CREATE TABLE selector_index (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        owner_id INT NOT NULL,
+        selector_hash NVARCHAR(40) NOT NULL, -- sha1 of the selector, for the unique key
+        selector NVARCHAR(MAX) NOT NULL,
+        resolutions INT NOT NULL DEFAULT 0,
+        timeouts INT NOT NULL DEFAULT 0,
+        errors INT NOT NULL DEFAULT 0,
+        slow_resolutions INT NOT NULL DEFAULT 0, -- Over SLOW_SELECTOR_MS
+        total_ms FLOAT NOT NULL DEFAULT 0,
+        max_ms FLOAT NULL,
+        last_ms FLOAT NULL,
+        last_test_case_id INT NULL,
+        last_run_id INT NULL,
+        created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
+        updated_at DATETIME2(7) NULL,
+        
+        -- Foreign Keys
+        CONSTRAINT FK_selector_index_owner 
+            FOREIGN KEY (owner_id) REFERENCES users(id)
+            ON DELETE CASCADE,
+        
+        -- Indexes
+        INDEX UX_selector_index_owner_selector UNIQUE (owner_id, selector_hash)
+    );
+END
+GO
+
+-- =============================================
+-- Run Schedules Table (see run_schedules.py)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='run_schedules' AND xtype='U')
+BEGIN
+    CREATE TABLE run_schedules (
+        id INT IDENTITY(1,1) PRIMARY KEY,
+        name NVARCHAR(200) NOT NULL,
+        owner_id INT NOT NULL,
+        cron NVARCHAR(100) NOT NULL, -- Five-field cron expression or @daily-style alias
+        timezone NVARCHAR(64) NOT NULL DEFAULT 'UTC',
+        test_case_id INT NULL, -- Exactly one of test_case_id, suite_id, tag_query
+        suite_id INT NULL,
+        tag_query NVARCHAR(500) NULL, -- Comma-separated tags that must all be present; !tag excludes
+        environment_id INT NULL,
+        jitter_seconds INT NOT NULL DEFAULT 300,
+        is_active BIT NOT NULL DEFAULT 1,
+        next_tick_at DATETIME2(7) NULL, -- Next cron tick (UTC)
+        next_run_at DATETIME2(7) NULL, -- next_tick_at plus the schedule's jitter
+        last_tick_at DATETIME2(7) NULL,
+        last_run_at DATETIME2(7) NULL,
+        last_result NVARCHAR(MAX) NULL, -- JSON: runs queued and skipped by the last fire
+        created_at DATETIME2(7) NOT NULL DEFAULT GETUTCDATE(),
+        updated_at DATETIME2(7) NULL,
+        
+        -- Foreign Keys
+        CONSTRAINT FK_run_schedules_owner 
+            FOREIGN KEY (owner_id) REFERENCES users(id)
+            ON DELETE CASCADE,
+        CONSTRAINT FK_run_schedules_test_case 
+            FOREIGN KEY (test_case_id) REFERENCES test_cases(id),
+        CONSTRAINT FK_run_schedules_suite 
+            FOREIGN KEY (suite_id) REFERENCES test_suites(id),
+        CONSTRAINT FK_run_schedules_environment 
+            FOREIGN KEY (environment_id) REFERENCES environments(id),
+        
+        -- Indexes
+        INDEX IX_run_schedules_due (is_active, next_run_at)
+    );
+END
+GO
+
+-- =============================================
+-- Replication Heartbeat Table (see database.ReplicaRouter)
+-- =============================================
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='replication_heartbeat' AND xtype='U')
+BEGIN
+    CREATE TABLE replication_heartbeat (
+        id INT NOT NULL PRIMARY KEY, -- Single row, id 1
+        beat_at DATETIME2(7) NOT NULL -- Written on the primary; the replica's copy is its watermark
+    );
+END
+GO
+
 -- =============================================
 -- Test Suite Runs Table (for tracking suite executions)
 -- =============================================
@@ -464,8 +724,12 @@ BEGIN
     
     -- Grant necessary permissions
     GRANT SELECT, INSERT, UPDATE, DELETE ON users TO D365TestPlatformUser;
+    GRANT SELECT, INSERT, UPDATE, DELETE ON datasets TO D365TestPlatformUser;
     GRANT SELECT, INSERT, UPDATE, DELETE ON test_cases TO D365TestPlatformUser;
     GRANT SELECT, INSERT, UPDATE, DELETE ON test_runs TO D365TestPlatformUser;
+    GRANT SELECT, INSERT, UPDATE, DELETE ON test_runs_archive TO D365TestPlatformUser;
+    GRANT SELECT, INSERT, UPDATE, DELETE ON test_run_rollups TO D365TestPlatformUser;
+    GRANT SELECT, INSERT, UPDATE ON replication_heartbeat TO D365TestPlatformUser;
     GRANT SELECT, INSERT, UPDATE, DELETE ON test_suites TO D365TestPlatformUser;
     GRANT SELECT, INSERT, UPDATE, DELETE ON environments TO D365TestPlatformUser;
     GRANT SELECT, INSERT, UPDATE, DELETE ON test_suite_runs TO D365TestPlatformUser;
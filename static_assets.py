@@ -0,0 +1,215 @@
+"""
+Content-hashed, precompressed static assets and the in-memory index page
+
+`python static_assets.py` builds static/dist/: every .js/.css file is copied
+to a content-hashed name (app.js -> app.3f2a9c1e7b0d.js) with .gz and, when
+the brotli package is installed, .br variants next to it. The app also runs
+the build at startup (skipping unchanged files), so a plain deploy works.
+"""
+import os
+import re
+import gzip
+import json
+import stat
+import hashlib
+import logging
+import mimetypes
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse
+
+try:
+    import brotli
+except ImportError:  # optional: only gzip variants are built without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.getenv("STATIC_DIR", "static")
+DIST_DIRNAME = "dist"
+MANIFEST_NAME = "manifest.json"
+HASHED_EXTENSIONS = (".js", ".css")
+# Set STATIC_BUILD_ON_STARTUP=false when dist/ is produced by the deploy pipeline
+STATIC_BUILD_ON_STARTUP = os.getenv("STATIC_BUILD_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Preference order when the client accepts several encodings
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    """Content codings a client accepts (q > 0) from its Accept-Encoding header"""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if match and float(match.group(1)) == 0:
+            continue
+        accepted.add(coding)
+    if "*" in accepted:
+        accepted.update(encoding for encoding, _ in ENCODINGS)
+    return accepted
+
+def _compress(data: bytes) -> Dict[str, bytes]:
+    """Encoded variants of a payload, keyed by content coding"""
+    variants = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(data, quality=11)
+    return variants
+
+def build(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    """Write hashed and precompressed copies of static assets, return the manifest
+    
+    The manifest maps source paths relative to static_dir (e.g.
+    "components/TestBuilder.js") to their hashed path under dist/.
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIRNAME)
+    manifest = {}
+    written = set()
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for filename in sorted(files):
+            if not filename.endswith(HASHED_EXTENSIONS):
+                continue
+            source = os.path.join(root, filename)
+            relative = os.path.relpath(source, static_dir).replace(os.sep, "/")
+            with open(source, "rb") as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            stem, extension = os.path.splitext(relative)
+            hashed = f"{stem}.{digest}{extension}"
+            manifest[relative] = hashed
+            
+            target = os.path.join(dist_dir, hashed)
+            written.update({target, target + ".gz", target + ".br"})
+            if os.path.exists(target) and os.path.exists(target + ".gz") and (brotli is None or os.path.exists(target + ".br")):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as f:
+                f.write(data)
+            variants = _compress(data)
+            for encoding, suffix in ENCODINGS:
+                if encoding in variants:
+                    with open(target + suffix, "wb") as f:
+                        f.write(variants[encoding])
+            logger.info(f"Built {relative} -> {DIST_DIRNAME}/{hashed}")
+    
+    # Drop outdated hashes so dist/ doesn't grow on every change
+    for root, _, files in os.walk(dist_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            if filename != MANIFEST_NAME and path not in written:
+                os.remove(path)
+    
+    os.makedirs(dist_dir, exist_ok=True)
+    with open(os.path.join(dist_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+def load_manifest(static_dir: str = STATIC_DIR) -> Dict[str, str]:
+    path = os.path.join(static_dir, DIST_DIRNAME, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+class IndexPage:
+    """index.html held in memory with hashed asset URLs and precompressed variants"""
+    
+    def __init__(self):
+        self.body: bytes = b""
+        self.variants: Dict[str, bytes] = {}
+        self.etag = ""
+    
+    def load(self, static_dir: str = STATIC_DIR, manifest: Optional[Dict[str, str]] = None):
+        with open(os.path.join(static_dir, "index.html"), "r") as f:
+            html = f.read()
+        for source, hashed in (manifest or {}).items():
+            html = html.replace(f'"/static/{source}"', f'"/static/{DIST_DIRNAME}/{hashed}"')
+        self.body = html.encode("utf-8")
+        self.variants = _compress(self.body)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:16]}"'
+    
+    def response(self, request: Request) -> Response:
+        """Serve the page, negotiated by Accept-Encoding and revalidated by ETag"""
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": REVALIDATE_CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if_none_match = request.headers.get("if-none-match", "")
+        if self.etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        
+        accepted = accepted_encodings(request.headers.get("accept-encoding"))
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.variants:
+                headers["Content-Encoding"] = encoding
+                return Response(self.variants[encoding], media_type="text/html", headers=headers)
+        return Response(self.body, media_type="text/html", headers=headers)
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles that serves .br/.gz siblings when accepted and caches hashed assets forever"""
+    
+    def _variant(self, full_path: str, accepted: set) -> Tuple[Optional[str], Optional[os.stat_result], Optional[str]]:
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            try:
+                variant_stat = os.stat(full_path + suffix)
+            except OSError:
+                continue
+            if stat.S_ISREG(variant_stat.st_mode):
+                return full_path + suffix, variant_stat, encoding
+        return None, None, None
+    
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        
+        variant_path, variant_stat, encoding = self._variant(
+            full_path, accepted_encodings(request_headers.get("accept-encoding"))
+        )
+        if variant_path:
+            response = FileResponse(variant_path, status_code=status_code, stat_result=variant_stat, media_type=media_type)
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, media_type=media_type)
+        
+        response.headers["Vary"] = "Accept-Encoding"
+        is_hashed = os.path.relpath(full_path, self.directory).startswith(DIST_DIRNAME + os.sep)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if is_hashed else REVALIDATE_CACHE_CONTROL
+        
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+# Global index page, loaded at startup
+index_page = IndexPage()
+
+def load_static_assets(static_dir: str = STATIC_DIR):
+    """Build dist/ if enabled and load index.html into memory"""
+    if STATIC_BUILD_ON_STARTUP:
+        try:
+            manifest = build(static_dir)
+        except OSError as e:
+            logger.warning(f"Static asset build failed, serving unhashed assets: {e}")
+            manifest = {}
+    else:
+        manifest = load_manifest(static_dir)
+    index_page.load(static_dir, manifest)
+    logger.info(f"Loaded index page ({len(manifest)} hashed assets, encodings: {', '.join(index_page.variants)})")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    for source, hashed in build().items():
+        print(f"{source} -> {DIST_DIRNAME}/{hashed}")
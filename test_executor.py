@@ -1,35 +1,298 @@
 """
-Playwright test execution engine
+Test execution engine: executor backends and the Playwright implementation
 """
 import os
 import json
+import time
+import signal
 import subprocess
 import tempfile
 import asyncio
 import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 from typing import Dict, Any, Optional
 from datetime import datetime
 from pathlib import Path
 
+from routing_profiles import generate_routing_script
+from capture_policy import resolve_capture_policy, plan_capture, playwright_cli_args, generate_capture_script
+from metrics import EXECUTOR_SPAWN_DURATION, EXECUTOR_RUN_DURATION, ARTIFACT_BYTES, RUNS_TERMINATED
+from tracing import NOOP_TRACE
+from reporter_stream import SCRIPT_EVENT_MARKER, CappedLog, ReportParser, pump_lines
+from dataset_runs import PLACEHOLDER, placeholders
+import artifact_store
+
 logger = logging.getLogger(__name__)
 
-class PlaywrightTestExecutor:
+# Artifact kinds reported in metrics, keyed by file suffix
+ARTIFACT_KINDS = {'.png': 'screenshot', '.zip': 'trace', '.webm': 'video', '.har': 'har', '.gz': 'log'}
+
+# Line-delimited reporter the executor parses incrementally (see reporter_stream.py)
+LINE_REPORTER_PATH = Path(__file__).resolve().parent / 'playwright_templates' / 'line_reporter.js'
+
+# Hard wall-clock limit for every run; a test case's timeout_seconds can only lower it
+EXECUTOR_TIMEOUT_SECONDS = float(os.getenv("EXECUTOR_TIMEOUT_SECONDS", "1800"))
+# Time between SIGTERM and SIGKILL when tearing down a run's process tree
+EXECUTOR_KILL_GRACE_SECONDS = float(os.getenv("EXECUTOR_KILL_GRACE_SECONDS", "5"))
+
+# playwright runs real browsers; simulated samples results for load tests (see simulated_executor.py)
+EXECUTOR_BACKEND = os.getenv("EXECUTOR_BACKEND", "playwright")
+
+# Process groups only exist on POSIX; elsewhere just the npx process is signalled
+USE_PROCESS_GROUPS = os.name == 'posix'
+
+# Generated scripts kept, so the rows of a dataset run share one
+SCRIPT_CACHE_SIZE = int(os.getenv("SCRIPT_CACHE_SIZE", "256"))
+# Environment variable carrying a dataset row to the generated script
+DATASET_ROW_ENV = 'D365_DATASET_ROW'
+
+STEP_TYPES = ('navigate', 'click', 'fill', 'verify', 'wait', 'waitForSelector', 'screenshot')
+STEP_TYPES_BY_NAME = {step_type.lower(): step_type for step_type in STEP_TYPES}
+
+def _bound(text: str, literal: Optional[str] = None) -> str:
+    """A JS string for text: literal (by default text in single quotes), or an
+    expression filling its {{placeholders}} from the dataset row at runtime"""
+    if PLACEHOLDER.search(text):
+        return f"__bind({json.dumps(text)})"
+    return f"'{text}'" if literal is None else literal
+
+class ExecutorBackend(ABC):
+    """Runs a test case's steps for the platform; see create_executor()
+    
+    Backends implement execute_test() returning the result dict that
+    routers/tests.py saves onto the run (status, execution_time, stdout,
+    stderr, error_message, report_summary, artifact_bytes, ...), plus
+    cancel() and active_run_ids for runs executing in this process.
+    """
+    name = "base"
+    
+    def __init__(self):
+        self.har_dir = Path("har_recordings")
+        self.har_dir.mkdir(exist_ok=True)
+    
+    @abstractmethod
+    async def execute_test(
+        self,
+        test_case: Dict[str, Any],
+        run_id: int,
+        environment_url: Optional[str] = None,
+        routing_profile: Optional[Dict[str, Any]] = None,
+        har_mode: Optional[str] = None,
+        har_path: Optional[str] = None,
+        trace=None,
+        timeout: Optional[float] = None,
+        capture_policy: Optional[Dict[str, Any]] = None,
+        dataset_row: Optional[Dict[str, str]] = None,
+        shared_prefix: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Run a test case and return its result dict"""
+    
+    @abstractmethod
+    def cancel(self, run_id: int) -> bool:
+        """Cancel a run executing in this process; False if it isn't running here"""
+    
+    @property
+    @abstractmethod
+    def active_run_ids(self) -> set:
+        """Ids of the runs executing in this process"""
+    
+    def kill_orphaned_process_groups(self) -> int:
+        """Kill processes left behind by server processes that have exited"""
+        return 0
+    
+    def har_path_for(self, test_case_id: Any, run_id: int) -> Path:
+        """Location of the HAR recorded for a test case during a given run"""
+        case_dir = self.har_dir / f"test_case_{test_case_id}"
+        case_dir.mkdir(parents=True, exist_ok=True)
+        return (case_dir / f"run_{run_id}.har").resolve()
+    
+    def prefix_state_path(self, batch_id: str, group: str) -> Path:
+        """Where a shared prefix leader saves its browser state for the rest of its group"""
+        state_dir = Path("temp_tests")
+        state_dir.mkdir(exist_ok=True)
+        return (state_dir / f"prefix_{batch_id}_{group}.json").resolve()
+    
+    def har_exists(self, har_path: Optional[str]) -> bool:
+        """Check that a recorded HAR is still present on disk"""
+        return bool(har_path) and Path(har_path).is_file()
+    
+    def validate_test_steps(self, steps: list) -> list:
+        """Validate and normalize test steps"""
+        valid_steps = []
+        for step in steps:
+            if not isinstance(step, dict):
+                continue
+            
+            # Step types match case-insensitively and are stored as spelled in STEP_TYPES
+            step_type = STEP_TYPES_BY_NAME.get(str(step.get('type', '')).lower())
+            if step_type is None:
+                continue
+            
+            valid_step = {
+                'type': step_type,
+                'description': step.get('description', f'{step_type} action')
+            }
+            
+            if step_type in ['click', 'fill', 'verify', 'waitForSelector']:
+                selector = step.get('selector', '')
+                if not selector:
+                    continue
+                valid_step['selector'] = selector
+            
+            if step_type in ['navigate', 'fill', 'wait']:
+                value = step.get('value', '')
+                if not value and step_type != 'wait':
+                    continue
+                valid_step['value'] = value
+            
+            if step_type == 'verify':
+                valid_step['expected'] = step.get('expected', 'visible')
+            
+            if step_type == 'screenshot':
+                for key in ('mask', 'mask_regions'):
+                    if step.get(key):
+                        valid_step[key] = step[key]
+            
+            valid_step['timeout'] = step.get('timeout', 5000)
+            valid_steps.append(valid_step)
+        
+        return valid_steps
+
+class PlaywrightTestExecutor(ExecutorBackend):
+    """Runs generated Playwright scripts with npx, one process tree per run"""
+    name = "playwright"
+    
     def __init__(self):
+        super().__init__()
         self.temp_dir = Path("temp_tests")
         self.temp_dir.mkdir(exist_ok=True)
+        # run_id -> Playwright process (None until spawned) for runs executing here
+        self._processes: Dict[int, Optional[asyncio.subprocess.Process]] = {}
+        self._cancelled = set()
+        # Cache key (steps and options) -> generated script
+        self._scripts: OrderedDict = OrderedDict()
+    
+    def generate_playwright_script(
+        self,
+        test_steps: list,
+        test_name: str,
+        routing_profile: Optional[Dict[str, Any]] = None,
+        har_mode: Optional[str] = None,
+        har_path: Optional[str] = None,
+        capture: Optional[Dict[str, Any]] = None,
+        shared_prefix: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Convert JSON test steps to Playwright JavaScript code
         
-    def generate_playwright_script(self, test_steps: list, test_name: str) -> str:
-        """Convert JSON test steps to Playwright JavaScript code"""
+        With a shared_prefix (see prefix_planner.py) that has a url, the
+        script starts from the saved state instead of running the prefix
+        steps; without one, it saves the state after the prefix.
+        """
+        restore = shared_prefix if shared_prefix and shared_prefix.get('state_path') and shared_prefix.get('url') else None
+        save_after = shared_prefix['steps'] if shared_prefix and shared_prefix.get('state_path') and not restore else None
         script_lines = [
             "const { test, expect } = require('@playwright/test');",
             "",
+            "function __emit(type, data) {",
+            f"  console.log('{SCRIPT_EVENT_MARKER}' + JSON.stringify({{ type, data }}));",
+            "}",
+            "",
+            "// Per-step timings, correlated with the run trace by the executor",
+            "let __currentStep = null;",
+            "function __stepStart(index, type) {",
+            "  __currentStep = { index, type, start: Date.now() };",
+            "}",
+            "function __stepEnd() {",
+            "  if (__currentStep) {",
+            "    __emit('step', { ...__currentStep, end: Date.now(), status: 'passed' });",
+            "    __currentStep = null;",
+            "  }",
+            "}",
+            "",
+            "// Selector resolution latency and outcome, aggregated into the selector index",
+            "async function __resolve(page, index, selector, timeout, state = 'attached') {",
+            "  const start = Date.now();",
+            "  try {",
+            "    await page.locator(selector).first().waitFor({ state, timeout });",
+            "    __emit('selector', { index, selector, ms: Date.now() - start, outcome: 'ok' });",
+            "  } catch (error) {",
+            "    __emit('selector', { index, selector, ms: Date.now() - start, outcome: error.name === 'TimeoutError' ? 'timeout' : 'error' });",
+            "    throw error;",
+            "  }",
+            "}",
+            "",
+            "test.afterEach(async () => {",
+            "  if (__currentStep) {",
+            "    __emit('step', { ...__currentStep, end: Date.now(), status: 'failed' });",
+            "    __currentStep = null;",
+            "  }",
+            "  __emit('test_end', { at: Date.now() });",
+            "});",
+            ""
+        ]
+        
+        if placeholders(test_steps):
+            script_lines.extend([
+                "// Dataset row for the steps' {{placeholders}}, passed in by the executor",
+                f"const __row = JSON.parse(process.env.{DATASET_ROW_ENV} || '{{}}');",
+                "function __bind(text) {",
+                "  return text.replace(/\\{\\{\\s*([^{}]+?)\\s*\\}\\}/g, (match, name) => Object.prototype.hasOwnProperty.call(__row, name) ? __row[name] : match);",
+                "}",
+                ""
+            ])
+        
+        if capture:
+            script_lines.extend(generate_capture_script(capture))
+        
+        if restore:
+            script_lines.extend([f"test.use({{ storageState: {json.dumps(restore['state_path'])} }});", ""])
+        
+        if routing_profile:
+            script_lines.extend(generate_routing_script(routing_profile))
+        
+        script_lines.extend([
             f"test('{test_name}', async ({{ page }}) => {{",
+            "  __emit('test_start', { at: Date.now() });",
             "  // Set default timeout",
             "  test.setTimeout(60000);",
             ""
-        ]
+        ])
+        
+        # HAR routes go first so the routing profile (registered later) is consulted before them
+        if har_mode == 'record':
+            script_lines.append(f"  await page.routeFromHAR({json.dumps(har_path)}, {{ update: true, updateContent: 'embed', updateMode: 'full' }});")
+        elif har_mode == 'replay':
+            script_lines.append(f"  await page.routeFromHAR({json.dumps(har_path)}, {{ notFound: 'abort' }});")
+        
+        if routing_profile:
+            script_lines.append("  await page.route('**/*', __applyRoutingProfile);")
+        
+        if har_mode or routing_profile:
+            script_lines.append("")
+        
+        wait_until = (routing_profile or {}).get('navigation_wait_until')
+        
+        if restore:
+            goto_options = f", {{ waitUntil: '{wait_until}' }}" if wait_until else ""
+            script_lines.extend([
+                f"  // Steps 1-{restore['steps']} ran once for the batch; start from the state they left",
+                "  const __restoreStart = Date.now();",
+                f"  await page.goto({json.dumps(restore['url'])}{goto_options});"
+            ])
+            # A prefix ending in a waitForSelector ends once the page has rendered that far
+            last = test_steps[restore['steps'] - 1]
+            if last.get('type') == 'waitForSelector':
+                selector = last.get('selector', '')
+                script_lines.append(f"  await page.waitForSelector({_bound(selector, json.dumps(selector))}, {{ state: 'visible', timeout: {last.get('timeout', 5000)} }});")
+            script_lines.extend([
+                "  __emit('prefix_restore', { ms: Date.now() - __restoreStart });",
+                ""
+            ])
         
         for i, step in enumerate(test_steps):
+            if restore and i < restore['steps']:
+                continue
             step_type = step.get('type', '')
             selector = step.get('selector', '')
             value = step.get('value', '')
@@ -37,49 +300,129 @@ class PlaywrightTestExecutor:
             timeout = step.get('timeout', 5000)
             
             script_lines.append(f"  // Step {i + 1}: {step.get('description', step_type)}")
+            script_lines.append(f"  __stepStart({i + 1}, {json.dumps(step_type)});")
+            
+            # Time the selector on its own; waitForSelector steps are nothing but that
+            if selector and (step_type in ('click', 'fill') or (step_type == 'verify' and expected != 'hidden')):
+                script_lines.append(f"  await __resolve(page, {i + 1}, {_bound(selector, json.dumps(selector))}, {timeout});")
             
             if step_type == 'navigate':
-                script_lines.append(f"  await page.goto('{value}');")
-                
+                if wait_until:
+                    script_lines.append(f"  await page.goto({_bound(value)}, {{ waitUntil: '{wait_until}' }});")
+                else:
+                    script_lines.append(f"  await page.goto({_bound(value)});")
+            
             elif step_type == 'click':
-                script_lines.append(f"  await page.click('{selector}', {{ timeout: {timeout} }});")
-                
+                script_lines.append(f"  await page.click({_bound(selector)}, {{ timeout: {timeout} }});")
+            
             elif step_type == 'fill':
-                script_lines.append(f"  await page.fill('{selector}', '{value}');")
-                
+                script_lines.append(f"  await page.fill({_bound(selector)}, {_bound(value)});")
+            
             elif step_type == 'verify':
                 if expected == 'visible':
-                    script_lines.append(f"  await expect(page.locator('{selector}')).toBeVisible();")
+                    script_lines.append(f"  await expect(page.locator({_bound(selector)})).toBeVisible();")
                 elif expected == 'hidden':
-                    script_lines.append(f"  await expect(page.locator('{selector}')).toBeHidden();")
+                    script_lines.append(f"  await expect(page.locator({_bound(selector)})).toBeHidden();")
                 else:
-                    script_lines.append(f"  await expect(page.locator('{selector}')).toHaveText('{expected}');")
-                    
+                    script_lines.append(f"  await expect(page.locator({_bound(selector)})).toHaveText({_bound(expected)});")
+            
             elif step_type == 'wait':
                 timeout_ms = int(value) if value.isdigit() else 1000
                 script_lines.append(f"  await page.waitForTimeout({timeout_ms});")
-                
+            
             elif step_type == 'waitForSelector':
-                script_lines.append(f"  await page.waitForSelector('{selector}', {{ timeout: {timeout} }});")
-                
+                script_lines.append(f"  await __resolve(page, {i + 1}, {_bound(selector, json.dumps(selector))}, {timeout}, 'visible');")
+            
             elif step_type == 'screenshot':
-                script_lines.append(f"  await page.screenshot({{ path: 'screenshot-step-{i + 1}.png' }});")
-                
+                # Written to the run's output dir; stable rendering so baselines compare cleanly
+                options = [f"path: test.info().outputPath('screenshot-step-{i + 1}.png')", "animations: 'disabled'", "caret: 'hide'"]
+                if step.get('mask'):
+                    locators = ", ".join(f"page.locator({json.dumps(mask)})" for mask in step['mask'])
+                    options.append(f"mask: [{locators}]")
+                script_lines.append(f"  await page.screenshot({{ {', '.join(options)} }});")
+            
+            script_lines.append("  __stepEnd();")
+            if save_after == i + 1:
+                script_lines.extend([
+                    "  // Shared prefix done: save the state the rest of the batch starts from",
+                    f"  await page.context().storageState({{ path: {json.dumps(shared_prefix['state_path'])} }});",
+                    "  __emit('prefix_state', { url: page.url() });"
+                ])
             script_lines.append("")
         
         script_lines.append("});")
         return "\n".join(script_lines)
     
+    def _prefix_outcome(self, shared_prefix: Dict[str, Any], events: list) -> Dict[str, Any]:
+        """Saved URL and prefix step time of a leader, or restore time of a member; empty if it didn't get there"""
+        if shared_prefix.get('url'):
+            restored = next((e['data'] for e in events if e.get('type') == 'prefix_restore'), None)
+            return {'restore_seconds': restored['ms'] / 1000} if restored else {}
+        saved = next((e['data'] for e in events if e.get('type') == 'prefix_state'), None)
+        if saved is None or not Path(shared_prefix['state_path']).is_file():
+            return {}
+        step_ms = sum(
+            e['data']['end'] - e['data']['start'] for e in events
+            if e.get('type') == 'step' and e['data'].get('index', 0) <= shared_prefix['steps']
+        )
+        return {'url': saved['url'], 'prefix_seconds': step_ms / 1000}
+    
+    def _script_for(self, test_steps: list, test_name: str, *options) -> str:
+        """generate_playwright_script, reusing the script of identical earlier calls"""
+        key = json.dumps([test_steps, test_name, *options], sort_keys=True, default=str)
+        script = self._scripts.get(key)
+        if script is None:
+            script = self._scripts[key] = self.generate_playwright_script(test_steps, test_name, *options)
+            if len(self._scripts) > SCRIPT_CACHE_SIZE:
+                self._scripts.popitem(last=False)
+        else:
+            self._scripts.move_to_end(key)
+        return script
+    
     async def execute_test(
         self, 
         test_case: Dict[str, Any], 
         run_id: int,
-        environment_url: Optional[str] = None
+        environment_url: Optional[str] = None,
+        routing_profile: Optional[Dict[str, Any]] = None,
+        har_mode: Optional[str] = None,
+        har_path: Optional[str] = None,
+        trace=None,
+        timeout: Optional[float] = None,
+        capture_policy: Optional[Dict[str, Any]] = None,
+        dataset_row: Optional[Dict[str, str]] = None,
+        shared_prefix: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
-        """Execute a test case and return results"""
+        """Execute a test case and return results
+        
+        har_mode 'record' captures the run's network traffic into a new HAR;
+        'replay' serves responses from har_path and aborts anything not in it.
+        Phases are recorded as spans on `trace` when one is passed.
+        The run is killed (with its whole browser process tree) once it
+        exceeds `timeout` seconds, capped at EXECUTOR_TIMEOUT_SECONDS, or
+        when cancel() is called for run_id. capture_policy (a resolved
+        policy, see capture_policy.py) decides which traces, screenshots and
+        videos are recorded and kept. dataset_row fills the steps'
+        {{placeholders}} (see dataset_runs.py). shared_prefix makes the run
+        save or start from a shared setup prefix's state (see
+        prefix_planner.py); the result's shared_prefix reports how it went.
+        A leader's shared_prefix may carry an on_state callback, called with
+        that report as soon as the state is saved, while the run goes on.
+        """
+        trace = trace or NOOP_TRACE
+        time_limit = min(timeout or EXECUTOR_TIMEOUT_SECONDS, EXECUTOR_TIMEOUT_SECONDS)
+        capture = plan_capture(capture_policy or resolve_capture_policy(), run_id)
+        on_state = shared_prefix.get('on_state') if shared_prefix else None
+        if on_state:
+            shared_prefix = {key: value for key, value in shared_prefix.items() if key != 'on_state'}
+        self._processes[run_id] = None
+        process = None
         test_name = test_case.get('name', f'test_{run_id}')
         test_steps = test_case.get('steps', [])
         
+        if har_mode == 'record':
+            har_path = str(self.har_path_for(test_case.get('id', 'adhoc'), run_id))
+        
         # Inject environment URL if provided
         if environment_url and test_steps:
             # Update first navigate step with environment URL
@@ -90,67 +433,126 @@ class PlaywrightTestExecutor:
         
         try:
             # Generate Playwright script
-            script_content = self.generate_playwright_script(test_steps, test_name)
+            with trace.span('executor.generate_script', steps=len(test_steps)):
+                script_content = self._script_for(
+                    test_steps, test_name, routing_profile, har_mode, har_path, capture, shared_prefix
+                )
             
             # Create temporary test file
             test_file = self.temp_dir / f"test_{run_id}.spec.js"
-            with open(test_file, 'w') as f:
-                f.write(script_content)
+            with trace.span('executor.write_script'):
+                with open(test_file, 'w') as f:
+                    f.write(script_content)
             
             # Prepare Playwright command
             cmd = [
                 'npx', 'playwright', 'test',
                 str(test_file),
-                '--reporter=json',
+                f'--reporter={LINE_REPORTER_PATH}',
                 f'--output-dir=test-results-{run_id}',
-                '--trace=on'
+                *playwright_cli_args(capture)
             ]
             
             # Execute test
-            start_time = datetime.utcnow()
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
-                cwd=os.getcwd()
-            )
+            with trace.span('executor.playwright', command=' '.join(cmd[:3])) as process_span:
+                process_span_id = trace.current_span_id
+                start_time = datetime.utcnow()
+                with trace.span('executor.spawn'):
+                    # Own process group so npx, node and Chromium can be killed together
+                    process = await asyncio.create_subprocess_exec(
+                        *cmd,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.PIPE,
+                        cwd=os.getcwd(),
+                        env={**os.environ, DATASET_ROW_ENV: json.dumps(dataset_row)} if dataset_row is not None else None,
+                        start_new_session=USE_PROCESS_GROUPS
+                    )
+                self._processes[run_id] = process
+                self._write_pgid_file(run_id, process)
+                spawned_ns = time.time_ns()
+                EXECUTOR_SPAWN_DURATION.observe((datetime.utcnow() - start_time).total_seconds())
+                if run_id in self._cancelled:
+                    self._terminate_tree(process)
+                
+                on_event = None
+                if on_state and shared_prefix.get('state_path') and not shared_prefix.get('url'):
+                    def on_event(event):
+                        if event.get('type') == 'prefix_state':
+                            outcome = self._prefix_outcome(shared_prefix, parser.events)
+                            if outcome:
+                                on_state(outcome)
+                parser = ReportParser(on_event)
+                stdout_log, stderr_log, timed_out = await self._collect_output(process, run_id, time_limit, parser)
+                exited_ns = time.time_ns()
+                end_time = datetime.utcnow()
+                execution_time = (end_time - start_time).total_seconds()
+                process_span.set_attribute('process.exit_code', process.returncode)
             
-            stdout, stderr = await process.communicate()
-            end_time = datetime.utcnow()
-            execution_time = (end_time - start_time).total_seconds()
-            
-            # Parse results
-            result = {
-                'status': 'passed' if process.returncode == 0 else 'failed',
-                'execution_time': execution_time,
-                'stdout': stdout.decode('utf-8') if stdout else '',
-                'stderr': stderr.decode('utf-8') if stderr else '',
-                'return_code': process.returncode
-            }
+            with trace.span('executor.parse_output', stdout_bytes=stdout_log.total_bytes, stderr_bytes=stderr_log.total_bytes):
+                # Output was parsed while streaming; keep capped text and the summary
+                log_path = self._keep_spill(run_id, 'stdout.log.gz', stdout_log)
+                stderr_path = self._keep_spill(run_id, 'stderr.log.gz', stderr_log)
+                result = {
+                    'status': 'passed' if process.returncode == 0 else 'failed',
+                    'execution_time': execution_time,
+                    'stdout': stdout_log.text(log_path),
+                    'stderr': stderr_log.text(stderr_path),
+                    'return_code': process.returncode,
+                    'log_path': log_path,
+                    'report_summary': parser.summary(),
+                    'capture_policy': capture['name'],
+                    'artifact_bytes': artifact_store.size_of(log_path and Path(log_path)) + artifact_store.size_of(stderr_path and Path(stderr_path))
+                }
+                if result['status'] == 'failed' and parser.first_error():
+                    result['error_message'] = parser.first_error()
+                if run_id in self._cancelled:
+                    result['status'] = 'cancelled'
+                    result['error_message'] = 'Run cancelled'
+                    RUNS_TERMINATED.inc(reason='cancelled')
+                elif timed_out:
+                    result['status'] = 'error'
+                    result['error_message'] = f'Run exceeded its {time_limit:g}s timeout and was terminated'
+                    RUNS_TERMINATED.inc(reason='timeout')
+                if result['status'] != 'passed':
+                    process_span.set_error(result.get('error_message') or f'exit code {process.returncode}')
+                EXECUTOR_RUN_DURATION.observe(execution_time, status=result['status'])
+                
+                # Structured events printed by the generated script
+                events = parser.events
+                route_stats = [e['data'] for e in events if e.get('type') == 'route_stats']
+                if route_stats:
+                    result['network_stats'] = route_stats[-1]
+                result['selector_timings'] = [e['data'] for e in events if e.get('type') == 'selector']
+                if shared_prefix and shared_prefix.get('state_path'):
+                    result['shared_prefix'] = self._prefix_outcome(shared_prefix, events)
             
-            # Try to parse JSON output
-            try:
-                if result['stdout']:
-                    json_output = json.loads(result['stdout'])
-                    result['detailed_results'] = json_output
-            except json.JSONDecodeError:
-                pass
+            self._add_script_spans(trace, events, process_span_id, spawned_ns, exited_ns)
             
             # Check for generated files
-            output_dir = Path(f'test-results-{run_id}')
-            if output_dir.exists():
-                # Look for screenshots
-                screenshots = list(output_dir.glob('**/*.png'))
-                if screenshots:
-                    result['screenshot_path'] = str(screenshots[0])
-                
-                # Look for traces
-                traces = list(output_dir.glob('**/*.zip'))
-                if traces:
-                    result['trace_path'] = str(traces[0])
+            with trace.span('executor.scan_artifacts'):
+                output_dir = Path(f'test-results-{run_id}')
+                if output_dir.exists():
+                    # Look for screenshots
+                    screenshots = list(output_dir.glob('**/*.png'))
+                    if screenshots:
+                        result['screenshot_path'] = str(screenshots[0])
+                    result['step_screenshots'] = _step_screenshots(output_dir)
+                    
+                    # Look for traces
+                    traces = list(output_dir.glob('**/*.zip'))
+                    if traces:
+                        result['trace_path'] = str(traces[0])
+                    
+                    result['artifact_bytes'] += self._record_artifact_bytes(output_dir.glob('**/*'))
             
-            return result
+            # Record the HAR that was captured or served
+            if har_mode == 'replay' or (har_mode == 'record' and self.har_exists(har_path)):
+                result['har_path'] = har_path
+            if har_mode == 'record' and self.har_exists(har_path):
+                result['artifact_bytes'] += self._record_artifact_bytes([Path(har_path)])
             
+            return result
+        
         except Exception as e:
             logger.error(f"Test execution failed: {e}")
             return {
@@ -161,6 +563,17 @@ class PlaywrightTestExecutor:
                 'stderr': ''
             }
         finally:
+            # Reap anything the run left behind (e.g. Chromium outliving npx)
+            if process is not None:
+                self._signal_tree(process, signal.SIGKILL)
+            self._processes.pop(run_id, None)
+            self._cancelled.discard(run_id)
+            self._pgid_file(run_id).unlink(missing_ok=True)
+            try:
+                artifact_store.run_dir(run_id).rmdir()  # Only succeeds when nothing was spilled
+            except OSError:
+                pass
+            
             # Clean up temporary test file
             try:
                 if test_file.exists():
@@ -168,41 +581,188 @@ class PlaywrightTestExecutor:
             except Exception as e:
                 logger.warning(f"Failed to clean up test file: {e}")
     
-    def validate_test_steps(self, steps: list) -> list:
-        """Validate and normalize test steps"""
-        valid_steps = []
-        for step in steps:
-            if not isinstance(step, dict):
+    async def _collect_output(self, process, run_id: int, time_limit: float, parser: ReportParser):
+        """Stream output through the reporter parser into capped, spilled logs
+        
+        The process tree is torn down if it outlives time_limit.
+        Returns (stdout_log, stderr_log, timed_out).
+        """
+        with artifact_store.open_spill(run_id, 'stdout.log.gz') as stdout_spill, \
+                artifact_store.open_spill(run_id, 'stderr.log.gz') as stderr_spill:
+            stdout_log = CappedLog(stdout_spill)
+            stderr_log = CappedLog(stderr_spill)
+            collect = asyncio.ensure_future(asyncio.gather(
+                pump_lines(process.stdout, stdout_log, parser.feed),
+                pump_lines(process.stderr, stderr_log),
+                process.wait()
+            ))
+            done, _ = await asyncio.wait({collect}, timeout=time_limit)
+            timed_out = not done
+            if timed_out:
+                logger.warning(f"Playwright process {process.pid} exceeded {time_limit:g}s, terminating")
+                self._signal_tree(process, signal.SIGTERM)
+                done, _ = await asyncio.wait({collect}, timeout=EXECUTOR_KILL_GRACE_SECONDS)
+                if not done:
+                    self._signal_tree(process, signal.SIGKILL)
+                await collect
+        return stdout_log, stderr_log, timed_out
+    
+    def _keep_spill(self, run_id: int, name: str, log: CappedLog) -> Optional[str]:
+        """Keep a spilled log only when the capped text lost part of it"""
+        path = artifact_store.path_for(run_id, name)
+        if not log.truncated:
+            path.unlink(missing_ok=True)
+            return None
+        self._record_artifact_bytes([path])
+        return str(path)
+    
+    def _signal_tree(self, process, sig) -> None:
+        """Send sig to the run's whole process group (npx, node and Chromium)"""
+        try:
+            if USE_PROCESS_GROUPS:
+                os.killpg(process.pid, sig)
+            elif process.returncode is None and sig == signal.SIGKILL:
+                process.kill()
+            elif process.returncode is None:
+                process.terminate()
+        except (ProcessLookupError, PermissionError):
+            pass
+    
+    def _terminate_tree(self, process) -> None:
+        """SIGTERM the process tree now and SIGKILL it after the grace period"""
+        self._signal_tree(process, signal.SIGTERM)
+        asyncio.get_running_loop().call_later(
+            EXECUTOR_KILL_GRACE_SECONDS, self._signal_tree, process, signal.SIGKILL
+        )
+    
+    def cancel(self, run_id: int) -> bool:
+        """Cancel a run executing in this process; False if it isn't running here"""
+        if run_id not in self._processes:
+            return False
+        self._cancelled.add(run_id)
+        process = self._processes[run_id]
+        if process is not None:
+            self._terminate_tree(process)
+        return True
+    
+    @property
+    def active_run_ids(self) -> set:
+        return set(self._processes)
+    
+    def _pgid_file(self, run_id: int) -> Path:
+        return self.temp_dir / f"run_{run_id}.{os.getpid()}.pgid"
+    
+    def _write_pgid_file(self, run_id: int, process) -> None:
+        """Record the run's process group so a restarted server can kill it if we crash"""
+        if USE_PROCESS_GROUPS:
+            self._pgid_file(run_id).write_text(str(process.pid))
+    
+    def kill_orphaned_process_groups(self) -> int:
+        """Kill browser process trees left by server processes that have exited"""
+        if not USE_PROCESS_GROUPS:
+            return 0
+        killed = 0
+        boot_time = _boot_time()
+        for pgid_file in self.temp_dir.glob("run_*.pgid"):
+            try:
+                run_id = int(pgid_file.name.split('.')[0].split('_', 1)[1])
+                owner_pid = int(pgid_file.suffixes[-2].lstrip('.'))
+                pgid = int(pgid_file.read_text().strip())
+            except (IndexError, ValueError, OSError):
+                pgid_file.unlink(missing_ok=True)
                 continue
-                
-            step_type = step.get('type', '').lower()
-            if step_type not in ['navigate', 'click', 'fill', 'verify', 'wait', 'waitForSelector', 'screenshot']:
+            if owner_pid == os.getpid() and run_id in self._processes:
                 continue
-            
-            valid_step = {
-                'type': step_type,
-                'description': step.get('description', f'{step_type} action')
-            }
-            
-            if step_type in ['click', 'fill', 'verify', 'waitForSelector']:
-                selector = step.get('selector', '')
-                if not selector:
-                    continue
-                valid_step['selector'] = selector
-            
-            if step_type in ['navigate', 'fill', 'wait']:
-                value = step.get('value', '')
-                if not value and step_type != 'wait':
-                    continue
-                valid_step['value'] = value
-            
-            if step_type == 'verify':
-                valid_step['expected'] = step.get('expected', 'visible')
-            
-            valid_step['timeout'] = step.get('timeout', 5000)
-            valid_steps.append(valid_step)
+            if owner_pid != os.getpid() and _pid_alive(owner_pid):
+                continue  # Another live worker owns this run
+            # Files from before a reboot refer to pids that may since have been reused
+            if boot_time is None or pgid_file.stat().st_mtime > boot_time:
+                try:
+                    os.killpg(pgid, signal.SIGKILL)
+                    killed += 1
+                    logger.warning(f"Killed orphaned Playwright process group {pgid} ({pgid_file.name})")
+                except (ProcessLookupError, PermissionError):
+                    pass
+            pgid_file.unlink(missing_ok=True)
+        return killed
+    
+    def _add_script_spans(self, trace, events: list, parent_id: Optional[str], spawned_ns: int, exited_ns: int) -> None:
+        """Turn timing events from the generated script into spans under the process span"""
+        ms_to_ns = 1_000_000
+        test_start = next((e['data']['at'] for e in events if e.get('type') == 'test_start'), None)
+        test_end = next((e['data']['at'] for e in events if e.get('type') == 'test_end'), None)
         
-        return valid_steps
+        if test_start is None:
+            return
+        test_start_ns = test_start * ms_to_ns
+        test_end_ns = test_end * ms_to_ns if test_end is not None else exited_ns
+        
+        # npx resolution, config loading, worker start and browser/page fixtures
+        trace.add_span('playwright.startup', spawned_ns, test_start_ns, parent_id=parent_id)
+        test_span = trace.add_span('playwright.test', test_start_ns, test_end_ns, parent_id=parent_id)
+        for event in events:
+            if event.get('type') != 'step':
+                continue
+            step = event['data']
+            trace.add_span(
+                f"step {step['index']}: {step['type']}",
+                step['start'] * ms_to_ns,
+                step['end'] * ms_to_ns,
+                parent_id=getattr(test_span, 'span_id', None),
+                error='step failed' if step.get('status') == 'failed' else None,
+                **{'step.index': step['index'], 'step.type': step['type']}
+            )
+        # Browser teardown, trace writing and JSON reporting
+        trace.add_span('playwright.teardown', test_end_ns, exited_ns, parent_id=parent_id)
+    
+    def _record_artifact_bytes(self, paths) -> int:
+        """Count bytes of artifacts a run left on disk, by kind; returns the total"""
+        total = 0
+        for path in paths:
+            if path.is_file():
+                size = path.stat().st_size
+                ARTIFACT_BYTES.inc(size, kind=ARTIFACT_KINDS.get(path.suffix, 'other'))
+                total += size
+        return total
+
+def _attempt(path: Path) -> int:
+    """Retry number of the attempt that wrote a file; Playwright suffixes retried output dirs with -retryN"""
+    _, _, retry = path.parent.name.rpartition('-retry')
+    return int(retry) if retry.isdigit() else 0
+
+def _step_screenshots(output_dir: Path) -> Dict[int, str]:
+    """Step number -> screenshot path, taken from the last attempt when the test was retried"""
+    paths = sorted(output_dir.glob('**/screenshot-step-*.png'), key=_attempt)
+    # Later attempts overwrite earlier ones
+    return {int(path.stem.rsplit('-', 1)[1]): str(path) for path in paths}
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _boot_time() -> Optional[float]:
+    """System boot time (Linux), used to ignore process ids recorded before a reboot"""
+    try:
+        with open('/proc/stat') as f:
+            for line in f:
+                if line.startswith('btime '):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def create_executor(name: str) -> ExecutorBackend:
+    if name == "playwright":
+        return PlaywrightTestExecutor()
+    if name == "simulated":
+        from simulated_executor import SimulatedTestExecutor
+        return SimulatedTestExecutor()
+    raise ValueError(f"Unknown EXECUTOR_BACKEND: {name}")
 
 # Global executor instance
-test_executor = PlaywrightTestExecutor()
+test_executor = create_executor(EXECUTOR_BACKEND)
@@ -0,0 +1,70 @@
+"""
+Shared fixtures: the app on a throwaway SQLite database, one user and seeded data
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Before the app is imported: the engine and caches read these at import time
+_db_dir = tempfile.mkdtemp(prefix="d365_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'test.db')}"
+os.environ["EXECUTOR_BACKEND"] = "simulated"
+os.environ["SCHEDULES_ENABLED"] = "false"
+os.environ["RESPONSE_CACHE_TTL_SECONDS"] = "0"
+
+import pytest
+from fastapi.testclient import TestClient
+
+SEEDED_TEST_CASES = 30
+RUNS_PER_TEST_CASE = 3
+
+@pytest.fixture(scope="session")
+def client():
+    import main
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    client.post("/api/auth/register", json={"username": "tester", "email": "tester@example.com", "password": "secret"})
+    response = client.post("/api/auth/login", json={"username": "tester", "password": "secret"})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+@pytest.fixture(scope="session")
+def seeded(auth_headers):
+    """Test cases with a few finished runs each, enough rows for an N+1 to show"""
+    from database import SessionLocal
+    from models import User, TestCase, TestRun
+    
+    db = SessionLocal()
+    try:
+        user_id = db.query(User.id).filter(User.username == "tester").scalar()
+        steps = [
+            {"type": "navigate", "value": "https://org.crm.dynamics.com"},
+            {"type": "click", "selector": "[data-id='new-record-button']"},
+            {"type": "screenshot"}
+        ]
+        test_cases = [
+            TestCase(name=f"case {index}", steps=steps, tags="smoke", owner_id=user_id)
+            for index in range(SEEDED_TEST_CASES)
+        ]
+        db.add_all(test_cases)
+        db.flush()
+        db.add_all([
+            TestRun(
+                test_case_id=test_case.id,
+                user_id=user_id,
+                status="passed" if attempt else "failed",
+                execution_time=1.5,
+                error_message=None if attempt else "Timeout 5000ms exceeded"
+            )
+            for test_case in test_cases
+            for attempt in range(RUNS_PER_TEST_CASE)
+        ])
+        db.commit()
+        first_run_id = db.query(TestRun.id).filter(TestRun.user_id == user_id).order_by(TestRun.id).limit(1).scalar()
+        return {"test_case_id": test_cases[0].id, "run_id": first_run_id}
+    finally:
+        db.close()
@@ -0,0 +1,57 @@
+"""
+The archiver moves a dataset run's parent and rows together
+"""
+from datetime import datetime, timedelta
+
+def _dataset_run(seeded, row_statuses):
+    """An old parent run with rows created just now, as a slow fan-out would leave them"""
+    from database import SessionLocal
+    from models import Dataset, TestRun
+    db = SessionLocal()
+    try:
+        user_id = db.query(TestRun.user_id).filter(TestRun.id == seeded["run_id"]).scalar()
+        dataset = Dataset(name="rows", columns=["name"], rows=[{"name": "a"}], row_count=1, owner_id=user_id)
+        db.add(dataset)
+        db.flush()
+        parent = TestRun(
+            test_case_id=seeded["test_case_id"], user_id=user_id, dataset_id=dataset.id, status="passed",
+            created_at=datetime.utcnow() - timedelta(days=400)
+        )
+        db.add(parent)
+        db.flush()
+        db.add_all([
+            TestRun(test_case_id=seeded["test_case_id"], user_id=user_id, parent_run_id=parent.id, dataset_row=index, status=row_status)
+            for index, row_status in enumerate(row_statuses)
+        ])
+        db.commit()
+        return parent.id
+    finally:
+        db.close()
+
+def _hot_ids(parent_id):
+    from database import SessionLocal
+    from models import TestRun
+    db = SessionLocal()
+    try:
+        return {run_id for run_id, in db.query(TestRun.id).filter((TestRun.id == parent_id) | (TestRun.parent_run_id == parent_id))}
+    finally:
+        db.close()
+
+def _archive():
+    from archive import archive_runs
+    from database import SessionLocal
+    db = SessionLocal()
+    try:
+        return archive_runs(db, older_than_days=365)
+    finally:
+        db.close()
+
+def test_parent_is_archived_with_its_rows(seeded):
+    parent_id = _dataset_run(seeded, ["passed", "failed"])
+    _archive()
+    assert _hot_ids(parent_id) == set()
+
+def test_parent_stays_while_a_row_is_in_flight(seeded):
+    parent_id = _dataset_run(seeded, ["passed", "running"])
+    _archive()
+    assert len(_hot_ids(parent_id)) == 3
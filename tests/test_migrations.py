@@ -0,0 +1,24 @@
+"""
+Databases created before a column was added get it at startup (database.add_missing_columns)
+"""
+from sqlalchemy import create_engine, inspect, text
+
+def test_adds_missing_columns_and_indexes(tmp_path):
+    import models
+    from database import Base, add_missing_columns
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(engine)
+    # Roll the tables back to before batch runs and test case versions
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_test_runs_batch_id"))
+        connection.execute(text("ALTER TABLE test_runs DROP COLUMN batch_id"))
+        connection.execute(text("ALTER TABLE test_cases DROP COLUMN version"))
+        connection.execute(text("INSERT INTO users (username, email, hashed_password) VALUES ('old', 'old@example.com', 'x')"))
+        connection.execute(text("INSERT INTO test_cases (name, steps, owner_id, row_version) VALUES ('old', '[]', 1, 1)"))
+    
+    assert sorted(add_missing_columns(engine)) == ["test_cases.version", "test_runs.batch_id"]
+    assert add_missing_columns(engine) == []
+    
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT version FROM test_cases")).scalar() == 1
+    assert "ix_test_runs_batch_id" in {index["name"] for index in inspect(engine).get_indexes("test_runs")}
@@ -0,0 +1,61 @@
+"""
+Shared prefixes end where storage state and a goto can bring the page back
+"""
+from prefix_planner import plan_shared_prefixes
+
+SIGN_IN = [
+    {"type": "navigate", "value": "https://org.crm.dynamics.com"},
+    {"type": "fill", "selector": "#username", "value": "tester"},
+    {"type": "click", "selector": "#sign-in"},
+    {"type": "waitForSelector", "selector": "#app-home"},
+]
+# Opens a form and types into it: page state a goto to the form's URL doesn't restore
+OPEN_FORM = [
+    {"type": "click", "selector": "#new-account"},
+    {"type": "fill", "selector": "#account-name", "value": "Contoso"},
+]
+
+def _runs(*endings):
+    return [(run_id, SIGN_IN + OPEN_FORM + [ending]) for run_id, ending in enumerate(endings, start=1)]
+
+def test_prefix_stops_before_clicks_and_fills():
+    groups = plan_shared_prefixes(_runs(
+        {"type": "click", "selector": "#save"},
+        {"type": "click", "selector": "#cancel"},
+    ))
+    assert [(group["steps"], group["run_ids"]) for group in groups.values()] == [(len(SIGN_IN), [1, 2])]
+
+def test_no_prefix_without_a_navigation_or_wait_to_end_at():
+    steps = [SIGN_IN[0], *OPEN_FORM]
+    groups = plan_shared_prefixes([
+        (1, steps + [{"type": "click", "selector": "#save"}]),
+        (2, steps + [{"type": "click", "selector": "#cancel"}]),
+    ])
+    assert groups == {}
+
+def test_restored_member_waits_for_the_prefix_end_again():
+    from test_executor import PlaywrightTestExecutor
+    steps = SIGN_IN + OPEN_FORM
+    script = PlaywrightTestExecutor().generate_playwright_script(steps, "member", shared_prefix={
+        "group": "g", "steps": len(SIGN_IN), "role": "member", "restored": True,
+        "state_path": "/tmp/state.json", "url": "https://org.crm.dynamics.com/main.aspx"
+    })
+    goto = script.index("await page.goto(\"https://org.crm.dynamics.com/main.aspx\")")
+    wait = script.index("await page.waitForSelector(\"#app-home\"")
+    assert goto < wait < script.index("__emit('prefix_restore'")
+    assert "#sign-in" not in script
+    assert "#new-account" in script and "#account-name" in script
+
+def test_saved_steps_keep_the_prefix_end(client, auth_headers):
+    runs = []
+    for run_id, ending in enumerate(("#save", "#cancel"), start=1):
+        response = client.post("/api/tests/", headers=auth_headers, json={
+            "name": f"saved {ending}",
+            "steps": SIGN_IN + OPEN_FORM + [{"type": "click", "selector": ending}]
+        })
+        assert response.status_code == 200
+        steps = response.json()["steps"]
+        assert steps[len(SIGN_IN) - 1]["type"] == "waitForSelector"
+        runs.append((run_id, steps))
+    groups = plan_shared_prefixes(runs)
+    assert [group["steps"] for group in groups.values()] == [len(SIGN_IN)]
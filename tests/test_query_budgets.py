@@ -0,0 +1,35 @@
+"""
+Hot routes stay within their SQL budgets (query_budget.ROUTE_QUERY_BUDGETS)
+
+Each list is requested over SEEDED_TEST_CASES test cases with several runs
+each, so a query issued per row pushes the route over its budget or
+repeats one statement shape, and the test fails.
+"""
+import pytest
+
+from query_budget import assert_max_queries, route_budget, N_PLUS_ONE_THRESHOLD
+
+# (route template as budgeted, URL requested)
+ROUTES = [
+    ("/api/results/dashboard", "/api/results/dashboard"),
+    ("/api/results/runs", "/api/results/runs?limit=100"),
+    ("/api/results/runs/{run_id}", "/api/results/runs/{run_id}"),
+    ("/api/tests/", "/api/tests/?limit=100"),
+    ("/api/tests/{test_case_id}", "/api/tests/{test_case_id}"),
+]
+
+@pytest.mark.parametrize("route,url", ROUTES, ids=[route for route, _ in ROUTES])
+def test_route_within_query_budget(client, auth_headers, seeded, route, url):
+    from auth import invalidate_user_cache
+    # Measure the worst case: the authenticated user is looked up, not cached
+    invalidate_user_cache()
+    with assert_max_queries(route_budget(route), max_repeats=N_PLUS_ONE_THRESHOLD - 1):
+        response = client.get(url.format(**seeded), headers=auth_headers)
+    assert response.status_code == 200
+
+def test_list_queries_do_not_grow_with_rows(client, auth_headers, seeded):
+    with assert_max_queries(route_budget("/api/tests/")) as few:
+        client.get("/api/tests/?limit=5", headers=auth_headers)
+    with assert_max_queries(route_budget("/api/tests/")) as many:
+        client.get("/api/tests/?limit=100", headers=auth_headers)
+    assert many.count == few.count
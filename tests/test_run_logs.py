@@ -0,0 +1,42 @@
+"""
+Run logs: stderr is served from its own column, not the run's error message
+"""
+from datetime import datetime, timedelta
+
+def _run_with_stderr(seeded, created_at=None):
+    from database import SessionLocal
+    from models import TestRun
+    db = SessionLocal()
+    try:
+        run = TestRun(
+            test_case_id=seeded["test_case_id"],
+            user_id=db.query(TestRun.user_id).filter(TestRun.id == seeded["run_id"]).scalar(),
+            status="failed",
+            result="1 failed",
+            error_message="TimeoutError: step 2 (click) exceeded its timeout",
+            stderr="[chromium] crashed while loading the page\n",
+            created_at=created_at or datetime.utcnow()
+        )
+        db.add(run)
+        db.commit()
+        return run.id
+    finally:
+        db.close()
+
+def test_stderr_log_is_not_the_error_message(client, auth_headers, seeded):
+    run_id = _run_with_stderr(seeded)
+    response = client.get(f"/api/results/runs/{run_id}/log?source=stderr", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.text == "[chromium] crashed while loading the page\n"
+
+def test_stderr_log_of_an_archived_run(client, auth_headers, seeded):
+    from archive import archive_runs
+    from database import SessionLocal
+    run_id = _run_with_stderr(seeded, created_at=datetime.utcnow() - timedelta(days=400))
+    db = SessionLocal()
+    try:
+        assert archive_runs(db, older_than_days=365)["archived"] == 1
+    finally:
+        db.close()
+    response = client.get(f"/api/results/runs/{run_id}/log?source=stderr", headers=auth_headers)
+    assert response.text == "[chromium] crashed while loading the page\n"
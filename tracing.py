@@ -0,0 +1,237 @@
+"""
+Span-based phase tracing for test runs, exported as OTLP/JSON
+"""
+import os
+import json
+import time
+import secrets
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Set TRACING_ENABLED=false to skip building and writing run traces
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+TRACE_DIR = Path(os.getenv("TRACE_DIR", "run_traces"))
+SERVICE_NAME = "d365-test-platform"
+
+# OTLP span status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class Span:
+    def __init__(self, trace: "RunTrace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_UNSET
+        self.status_message = ""
+    
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+    
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+    
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [
+                {"key": key, "value": _attribute_value(value)}
+                for key, value in self.attributes.items() if value is not None
+            ],
+            "status": {"code": self.status, "message": self.status_message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+class RunTrace:
+    """Collects the spans of a single test run"""
+    
+    def __init__(self, **attributes):
+        self.run_id: Optional[int] = None
+        self.trace_id = secrets.token_hex(16)
+        self.attributes = dict(attributes)
+        self.spans: List[Span] = []
+        self._stack: List[Span] = []
+    
+    def bind_run(self, run_id: int):
+        """Attach the run id once the TestRun row exists"""
+        self.run_id = run_id
+        self.attributes["run.id"] = run_id
+    
+    @property
+    def current_span_id(self) -> Optional[str]:
+        return self._stack[-1].span_id if self._stack else None
+    
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a block as a child of the currently open span"""
+        span = Span(self, name, self.current_span_id, attributes)
+        self.spans.append(span)
+        self._stack.append(span)
+        try:
+            yield span
+            if span.status == STATUS_UNSET:
+                span.status = STATUS_OK
+        except Exception as e:
+            span.set_error(str(e))
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            self._stack.remove(span)
+    
+    def add_span(
+        self,
+        name: str,
+        start_ns: int,
+        end_ns: int,
+        parent_id: Optional[str] = None,
+        error: Optional[str] = None,
+        **attributes
+    ) -> Span:
+        """Record a span timed elsewhere, e.g. a step reported by the generated script"""
+        span = Span(self, name, parent_id or self.current_span_id, attributes)
+        span.start_ns = start_ns
+        span.end_ns = end_ns
+        if error:
+            span.set_error(error)
+        else:
+            span.status = STATUS_OK
+        self.spans.append(span)
+        return span
+    
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON ExportTraceServiceRequest document"""
+        return {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": _attribute_value(SERVICE_NAME)}
+                    ] + [
+                        {"key": key, "value": _attribute_value(value)}
+                        for key, value in self.attributes.items() if value is not None
+                    ]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": "d365.test_runs"},
+                    "spans": [span.to_otlp() for span in self.spans],
+                }],
+            }]
+        }
+    
+    def export(self) -> Optional[Path]:
+        """Write the trace to TRACE_DIR/run_<id>.json"""
+        if self.run_id is None:
+            return None
+        try:
+            TRACE_DIR.mkdir(parents=True, exist_ok=True)
+            path = trace_path_for(self.run_id)
+            with open(path, "w") as f:
+                json.dump(self.to_otlp(), f)
+            return path
+        except OSError as e:
+            logger.warning(f"Failed to export trace for run {self.run_id}: {e}")
+            return None
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value: Any):
+        pass
+    
+    def set_error(self, message: str):
+        pass
+
+class NoopTrace:
+    """Stand-in used when tracing is disabled or no trace was passed"""
+    run_id = None
+    trace_id = None
+    current_span_id = None
+    
+    def bind_run(self, run_id: int):
+        pass
+    
+    @contextmanager
+    def span(self, name: str, **attributes):
+        yield _NoopSpan()
+    
+    def add_span(self, *args, **kwargs):
+        return _NoopSpan()
+    
+    def export(self):
+        return None
+
+NOOP_TRACE = NoopTrace()
+
+def start_run_trace(**attributes):
+    """Create a trace for a run, or a no-op when tracing is disabled"""
+    return RunTrace(**attributes) if TRACING_ENABLED else NOOP_TRACE
+
+def trace_path_for(run_id: int) -> Path:
+    return TRACE_DIR / f"run_{run_id}.json"
+
+def load_trace(run_id: int) -> Optional[Dict[str, Any]]:
+    """Read an exported run trace, if there is one"""
+    path = trace_path_for(run_id)
+    if not path.is_file():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def summarize_trace(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Flatten an OTLP document into an indented timeline relative to the first span"""
+    spans = [
+        span
+        for resource in document.get("resourceSpans", [])
+        for scope in resource.get("scopeSpans", [])
+        for span in scope.get("spans", [])
+    ]
+    if not spans:
+        return []
+    
+    origin = min(int(span["startTimeUnixNano"]) for span in spans)
+    children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+    span_ids = {span["spanId"] for span in spans}
+    for span in spans:
+        parent = span.get("parentSpanId") if span.get("parentSpanId") in span_ids else None
+        children.setdefault(parent, []).append(span)
+    
+    timeline = []
+    
+    def walk(parent_id, depth):
+        for span in sorted(children.get(parent_id, []), key=lambda s: int(s["startTimeUnixNano"])):
+            start = int(span["startTimeUnixNano"])
+            end = int(span["endTimeUnixNano"])
+            timeline.append({
+                "name": span["name"],
+                "depth": depth,
+                "offset_ms": round((start - origin) / 1e6, 3),
+                "duration_ms": round((end - start) / 1e6, 3),
+                "status": {STATUS_OK: "ok", STATUS_ERROR: "error"}.get(span.get("status", {}).get("code"), "unset"),
+            })
+            walk(span["spanId"], depth + 1)
+    
+    walk(None, 0)
+    return timeline
@@ -0,0 +1,227 @@
+"""
+Test case version history: periodic full snapshots plus JSON Patch deltas
+
+Every save that changes a test case's content adds a version. Most versions
+are stored as an RFC 6902 patch from the previous version; every
+VERSION_SNAPSHOT_INTERVAL versions (or when a patch would be nearly as big as
+the content) a full snapshot is stored instead, so rebuilding any version
+applies at most that many patches. Version payloads are zlib-compressed JSON.
+Versions never change once written, so rebuilt versions are cached.
+"""
+import os
+import json
+import zlib
+import copy
+import difflib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models import TestCase, TestCaseVersion
+
+logger = logging.getLogger(__name__)
+
+VERSION_SNAPSHOT_INTERVAL = int(os.getenv("VERSION_SNAPSHOT_INTERVAL", "20"))
+VERSION_CACHE_SIZE = int(os.getenv("VERSION_CACHE_SIZE", "512"))
+
+# Fields that make up a version; ownership and soft-delete state aren't versioned
+VERSIONED_FIELDS = ("name", "description", "steps", "expected_result", "tags", "timeout_seconds", "capture_policy", "dataset_id")
+
+def content_of(test_case: TestCase) -> Dict[str, Any]:
+    return {field: copy.deepcopy(getattr(test_case, field)) for field in VERSIONED_FIELDS}
+
+def _pack(data: Any) -> bytes:
+    return zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6)
+
+def _unpack(payload: bytes) -> Any:
+    return json.loads(zlib.decompress(payload))
+
+def _pointer(path: str, key: Any) -> str:
+    return f"{path}/{str(key).replace('~', '~0').replace('/', '~1')}"
+
+def make_patch(old: Any, new: Any, path: str = "") -> List[Dict[str, Any]]:
+    """JSON Patch (add/remove/replace) turning old into new
+    
+    Objects are diffed key by key and lists element by element, so editing
+    one field of one step yields a single small operation.
+    """
+    if old == new:
+        return []
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = []
+        for key in old:
+            if key not in new:
+                ops.append({"op": "remove", "path": _pointer(path, key)})
+            else:
+                ops.extend(make_patch(old[key], new[key], _pointer(path, key)))
+        for key in new:
+            if key not in old:
+                ops.append({"op": "add", "path": _pointer(path, key), "value": new[key]})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        return _list_patch(old, new, path)
+    return [{"op": "replace", "path": path, "value": new}]
+
+def _list_patch(old: list, new: list, path: str) -> List[Dict[str, Any]]:
+    encode = lambda item: json.dumps(item, sort_keys=True)
+    matcher = difflib.SequenceMatcher(None, [encode(item) for item in old], [encode(item) for item in new], autojunk=False)
+    ops = []
+    # Back to front, so each operation's index still refers to the old list
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == "equal":
+            continue
+        if tag == "replace" and i2 - i1 == j2 - j1:
+            for offset in reversed(range(i2 - i1)):
+                ops.extend(make_patch(old[i1 + offset], new[j1 + offset], _pointer(path, i1 + offset)))
+            continue
+        for index in reversed(range(i1, i2)):
+            ops.append({"op": "remove", "path": _pointer(path, index)})
+        for offset, item in enumerate(new[j1:j2]):
+            ops.append({"op": "add", "path": _pointer(path, i1 + offset), "value": item})
+    return ops
+
+def apply_patch(document: Any, ops: List[Dict[str, Any]]) -> Any:
+    """Apply a patch from make_patch to a copy of document"""
+    document = copy.deepcopy(document)
+    for op in ops:
+        keys = [part.replace("~1", "/").replace("~0", "~") for part in op["path"].split("/")[1:]]
+        if not keys:
+            document = copy.deepcopy(op["value"])
+            continue
+        parent = document
+        for key in keys[:-1]:
+            parent = parent[int(key)] if isinstance(parent, list) else parent[key]
+        last = int(keys[-1]) if isinstance(parent, list) else keys[-1]
+        if op["op"] == "remove":
+            del parent[last]
+        elif op["op"] == "add" and isinstance(parent, list):
+            parent.insert(last, copy.deepcopy(op["value"]))
+        else:
+            parent[last] = copy.deepcopy(op["value"])
+    return document
+
+class _VersionCache:
+    """LRU of rebuilt versions; safe to share since versions are immutable"""
+    
+    def __init__(self, size: int):
+        self.size = size
+        self._items: "OrderedDict[Tuple[int, int], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            content = self._items.get(key)
+            if content is not None:
+                self._items.move_to_end(key)
+            return content
+    
+    def put(self, key: Tuple[int, int], content: Dict[str, Any]):
+        with self._lock:
+            self._items[key] = content
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+_cache = _VersionCache(VERSION_CACHE_SIZE)
+
+def _add_version(db: Session, test_case_id: int, version: int, content: Dict[str, Any],
+                 previous: Optional[Dict[str, Any]], user_id: Optional[int]) -> TestCaseVersion:
+    since_snapshot = None
+    if previous is not None:
+        last_snapshot = db.query(func.max(TestCaseVersion.version)).filter(
+            TestCaseVersion.test_case_id == test_case_id,
+            TestCaseVersion.is_snapshot == True
+        ).scalar()
+        since_snapshot = version - last_snapshot if last_snapshot else None
+    
+    snapshot = _pack(content)
+    if since_snapshot is None or since_snapshot >= VERSION_SNAPSHOT_INTERVAL:
+        payload, is_snapshot = snapshot, True
+    else:
+        delta = _pack(make_patch(previous, content))
+        # A patch nearly as large as the content saves little and costs a replay step
+        payload, is_snapshot = (snapshot, True) if len(delta) * 2 > len(snapshot) else (delta, False)
+    
+    row = TestCaseVersion(
+        test_case_id=test_case_id,
+        version=version,
+        is_snapshot=is_snapshot,
+        payload=payload,
+        payload_bytes=len(payload),
+        created_by=user_id
+    )
+    db.add(row)
+    return row
+
+def record_initial_version(db: Session, test_case: TestCase, user_id: Optional[int]):
+    """Snapshot a new test case as version 1 (call after it has an id)"""
+    test_case.version = 1
+    _add_version(db, test_case.id, 1, content_of(test_case), None, user_id)
+
+def record_version(db: Session, test_case: TestCase, previous: Dict[str, Any], user_id: Optional[int]) -> bool:
+    """Add a version for changes applied to test_case since `previous` (its content_of before the edit)
+    
+    Returns False when the versioned content didn't change. Test cases
+    created before versioning get their pre-edit state as a first snapshot.
+    """
+    content = content_of(test_case)
+    if content == previous:
+        return False
+    current = test_case.version or 1
+    has_history = db.query(TestCaseVersion.id).filter(TestCaseVersion.test_case_id == test_case.id).first()
+    if not has_history:
+        _add_version(db, test_case.id, current, previous, None, None)
+    test_case.version = current + 1
+    _add_version(db, test_case.id, current + 1, content, previous, user_id)
+    return True
+
+def get_version(db: Session, test_case_id: int, version: int) -> Optional[Dict[str, Any]]:
+    """Content of one version: its nearest snapshot with the later patches applied"""
+    cached = _cache.get((test_case_id, version))
+    if cached is not None:
+        return copy.deepcopy(cached)
+    
+    snapshot_version = db.query(func.max(TestCaseVersion.version)).filter(
+        TestCaseVersion.test_case_id == test_case_id,
+        TestCaseVersion.is_snapshot == True,
+        TestCaseVersion.version <= version
+    ).scalar()
+    if snapshot_version is None:
+        return None
+    rows = db.query(TestCaseVersion.version, TestCaseVersion.is_snapshot, TestCaseVersion.payload).filter(
+        TestCaseVersion.test_case_id == test_case_id,
+        TestCaseVersion.version.between(snapshot_version, version)
+    ).order_by(TestCaseVersion.version).all()
+    if not rows or rows[-1].version != version:
+        return None
+    
+    content = None
+    for row in rows:
+        content = _unpack(row.payload) if row.is_snapshot else apply_patch(content, _unpack(row.payload))
+    _cache.put((test_case_id, version), content)
+    return copy.deepcopy(content)
+
+def diff_versions(db: Session, test_case_id: int, from_version: int, to_version: int) -> Optional[Dict[str, Any]]:
+    """Patch between two versions plus a per-field and per-step summary"""
+    old = get_version(db, test_case_id, from_version)
+    new = get_version(db, test_case_id, to_version)
+    if old is None or new is None:
+        return None
+    patch = make_patch(old, new)
+    changed_steps = sorted({
+        int(op["path"].split("/")[2]) + 1
+        for op in patch
+        if op["path"].startswith("/steps/") and op["path"].split("/")[2].isdigit()
+    })
+    return {
+        "from_version": from_version,
+        "to_version": to_version,
+        "changed_fields": [field for field in VERSIONED_FIELDS if old.get(field) != new.get(field)],
+        "changed_steps": changed_steps,  # 1-based positions in the old version's steps
+        "step_count": {"from": len(old.get("steps") or []), "to": len(new.get("steps") or [])},
+        "patch": patch
+    }
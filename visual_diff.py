@@ -0,0 +1,175 @@
+"""
+Visual regression checks for screenshot steps
+
+Every screenshot step of a test case has a baseline image per environment.
+New screenshots are compared with it in a process pool, off the event loop:
+  - a byte-identical file, or one whose perceptual hash matches the
+    baseline's, skips the pixel diff
+  - otherwise a vectorized per-pixel diff ignores masked regions (the
+    step's `mask_regions` rectangles) and writes a diff image to the run's
+    artifacts
+A screenshot without a baseline becomes the baseline. A changed screenshot
+fails the run until it's approved as the new baseline.
+"""
+import os
+import shutil
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from models import VisualBaseline
+from image_diff import describe_image, compare_screenshot
+import artifact_store
+
+logger = logging.getLogger(__name__)
+
+VISUAL_BASELINE_DIR = Path(os.getenv("VISUAL_BASELINE_DIR", "visual_baselines"))
+VISUAL_DIFF_WORKERS = int(os.getenv("VISUAL_DIFF_WORKERS", "0")) or min(os.cpu_count() or 1, 8)
+VISUAL_FAIL_ON_CHANGE = os.getenv("VISUAL_FAIL_ON_CHANGE", "true").lower() == "true"
+
+def baseline_path_for(test_case_id: int, environment_id: Optional[int], step_index: int, digest: str) -> Path:
+    environment = f"env_{environment_id}" if environment_id else "default"
+    return VISUAL_BASELINE_DIR / f"case_{test_case_id}" / environment / f"step_{step_index}_{digest[:16]}.png"
+
+class VisualDiffEngine:
+    """Compares a run's step screenshots with their baselines on a shared process pool"""
+    
+    def __init__(self, workers: int = VISUAL_DIFF_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+    
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that runs the event loop and threads isn't safe
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+    
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+    
+    async def compare_run(
+        self,
+        db: Session,
+        run_id: int,
+        test_case_id: int,
+        environment_id: Optional[int],
+        steps: list,
+        screenshots: Dict[int, str]
+    ) -> List[Dict[str, Any]]:
+        """Compare each step screenshot (step number -> path) with its baseline
+        
+        Screenshots without a baseline are stored as the new baseline.
+        """
+        baselines = {
+            baseline.step_index: baseline
+            for baseline in db.query(VisualBaseline).filter(
+                VisualBaseline.test_case_id == test_case_id,
+                VisualBaseline.environment_id == environment_id
+            )
+        }
+        loop = asyncio.get_running_loop()
+        jobs = []
+        for step_index, actual_path in sorted(screenshots.items()):
+            baseline = baselines.get(step_index)
+            if baseline is None:
+                jobs.append(loop.run_in_executor(self.pool, describe_image, actual_path))
+            else:
+                step = steps[step_index - 1] if 0 < step_index <= len(steps) else {}
+                diff_path = str(artifact_store.path_for(run_id, f"visual/step_{step_index}_diff.png"))
+                jobs.append(loop.run_in_executor(
+                    self.pool, compare_screenshot, actual_path, baseline.path,
+                    baseline.digest, baseline.phash, step.get("mask_regions"), diff_path
+                ))
+        outcomes = await asyncio.gather(*jobs, return_exceptions=True)
+        
+        results = []
+        for (step_index, actual_path), outcome in zip(sorted(screenshots.items()), outcomes):
+            entry = {"step": step_index, "actual_path": actual_path}
+            if isinstance(outcome, Exception):
+                logger.warning(f"Visual comparison of run {run_id} step {step_index} failed: {outcome}")
+                entry.update(status="error", detail=str(outcome))
+            elif step_index in baselines:
+                entry.update(outcome, baseline_id=baselines[step_index].id)
+            else:
+                baseline = await self._store_baseline(db, test_case_id, environment_id, step_index, actual_path, outcome, run_id, None)
+                entry.update(status="new", baseline_id=baseline.id)
+            results.append(entry)
+        db.commit()
+        return results
+    
+    async def approve(
+        self,
+        db: Session,
+        test_case_id: int,
+        environment_id: Optional[int],
+        step_index: int,
+        actual_path: str,
+        run_id: int,
+        user_id: int
+    ) -> VisualBaseline:
+        """Make a run's screenshot the baseline for its step"""
+        info = await asyncio.get_running_loop().run_in_executor(self.pool, describe_image, actual_path)
+        baseline = await self._store_baseline(
+            db, test_case_id, environment_id, step_index, actual_path, info, run_id, user_id
+        )
+        db.commit()
+        db.refresh(baseline)
+        return baseline
+    
+    async def _store_baseline(
+        self,
+        db: Session,
+        test_case_id: int,
+        environment_id: Optional[int],
+        step_index: int,
+        actual_path: str,
+        info: Dict[str, Any],
+        run_id: int,
+        user_id: Optional[int]
+    ) -> VisualBaseline:
+        # Content-addressed file names, so a baseline being replaced is never half-written
+        path = baseline_path_for(test_case_id, environment_id, step_index, info["digest"])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        await asyncio.to_thread(shutil.copyfile, actual_path, path)
+        
+        baseline = db.query(VisualBaseline).filter(
+            VisualBaseline.test_case_id == test_case_id,
+            VisualBaseline.environment_id == environment_id,
+            VisualBaseline.step_index == step_index
+        ).first()
+        if baseline is None:
+            baseline = VisualBaseline(test_case_id=test_case_id, environment_id=environment_id, step_index=step_index)
+            db.add(baseline)
+        elif baseline.path != str(path):
+            Path(baseline.path).unlink(missing_ok=True)
+        baseline.path = str(path)
+        baseline.digest = info["digest"]
+        baseline.phash = info["phash"]
+        baseline.width = info["width"]
+        baseline.height = info["height"]
+        baseline.source_run_id = run_id
+        baseline.approved_by = user_id
+        db.flush()
+        return baseline
+
+def summarize_changes(results: List[Dict[str, Any]]) -> Optional[str]:
+    """Error message for a run whose screenshots changed, or None"""
+    changed = [entry for entry in results if entry["status"] == "changed"]
+    if not changed:
+        return None
+    details = ", ".join(
+        f"step {entry['step']} ({entry.get('detail') or format(entry['diff_ratio'], '.2%') + ' of pixels differ'})"
+        for entry in changed
+    )
+    return f"Visual change in screenshot {details}"
+
+# Global engine; its worker processes start on first use
+visual_diff_engine = VisualDiffEngine()